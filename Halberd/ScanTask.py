@@ -8,6 +8,60 @@
 @var default_parallelism: Number of parallel threads to launch for the scan.
 @type default_parallelism: C{int}
 
+@var default_max_parallelism: Upper bound for the number of parallel requests
+when it is tuned automatically.
+@type default_max_parallelism: C{int}
+
+@var default_pipeline: Number of requests to pipeline on each connection.
+@type default_pipeline: C{int}
+
+@var default_probe: Way to request headers from the target (one of
+L{Halberd.clientlib.probes}, C{auto} or C{tls}).
+@type default_probe: C{str}
+
+@var default_rate: Maximum number of requests per second (0 means unlimited).
+@type default_rate: C{float}
+
+@var default_bandwidth: Maximum number of bytes per second exchanged with the
+target (0 means unlimited).
+@type default_bandwidth: C{float}
+
+@var default_jitter: Randomization of the spacing between requests (as a
+fraction of the spacing).
+@type default_jitter: C{float}
+
+@var default_converge_window: Stop the scan once no new real servers have
+been found for this many seconds (0 disables early stopping).
+@type default_converge_window: C{float}
+
+@var default_converge_samples: Minimum number of replies before a scan can
+be stopped early.
+@type default_converge_samples: C{int}
+
+@var default_converge_time: Minimum time (in seconds) to spend scanning before
+stopping early.
+@type default_converge_time: C{float}
+
+@var default_engine: Scanning engine to use (C{threads}, C{async} or
+C{processes}).
+@type default_engine: C{str}
+
+@var default_processes: Number of worker processes used by the C{processes}
+engine (0 means one per CPU).
+@type default_processes: C{int}
+
+@var default_budget: Maximum number of parallel requests adding up all the
+targets of a multiple URL scan.
+@type default_budget: C{int}
+
+@var default_maxperhost: Maximum number of targets scanned at once on the
+same host.
+@type default_maxperhost: C{int}
+
+@var default_maxperaddr: Maximum number of targets scanned at once on the
+same address.
+@type default_maxperaddr: C{int}
+
 @var default_conf_dir: Path to the directory where the configuration file is
 located.
 @type default_conf_dir: C{str}
@@ -43,12 +97,41 @@ clue reanalysis.
 import os
 
 import Halberd.conflib
+import Halberd.metrics
 
 
 default_scantime = 15
 
 default_parallelism = 4
 
+default_max_parallelism = 64
+
+default_converge_window = 0
+
+default_converge_samples = 100
+
+default_converge_time = 2
+
+default_engine = 'threads'
+
+default_processes = 0
+
+default_budget = 32
+
+default_maxperhost = 1
+
+default_maxperaddr = 1
+
+default_pipeline = 1
+
+default_probe = 'get'
+
+default_rate = 0
+
+default_bandwidth = 0
+
+default_jitter = 0
+
 default_conf_dir = os.path.join(os.path.expanduser('~'), '.halberd')
 default_conf_file = os.path.join(default_conf_dir,
                                  'halberd' + os.extsep + 'cfg')
@@ -77,6 +160,87 @@ class ScanTask:
     @ivar debug: Display debug information.
     @type debug: C{bool}
 
+    @ivar autoparallelism: Tune the number of parallel requests during the
+    scan, starting at L{parallelism} (see L{Halberd.crew.Tuner}).
+    @type autoparallelism: C{bool}
+
+    @ivar max_parallelism: Upper bound for the number of parallel requests
+    when they are tuned automatically (shared by all the targets scanned at
+    once when scanning several of them).
+    @type max_parallelism: C{int}
+
+    @ivar concurrency: Trajectory followed by the number of parallel requests
+    during the last scan as a sequence of (elapsed seconds, parallel requests)
+    tuples. Empty unless L{autoparallelism} is set.
+    @type concurrency: C{list}
+
+    @ivar converge_window: Stop scanning when no new real servers show up
+    during this many seconds (see L{Halberd.crew.ConvergenceRule}). Zero
+    means the whole L{scantime} is always used.
+    @type converge_window: C{float}
+
+    @ivar converge_samples: Minimum number of replies before stopping early.
+    @type converge_samples: C{int}
+
+    @ivar converge_time: Minimum time (in seconds) to scan before stopping
+    early.
+    @type converge_time: C{float}
+
+    @ivar stopreason: Why the last scan was stopped.
+    @type stopreason: C{str}
+
+    @ivar engine: Kind of work crew used to scan (see
+    L{Halberd.crew.crewFactory}).
+    @type engine: C{str}
+
+    @ivar processes: Number of worker processes for the C{processes} engine
+    (0 means one per CPU).
+    @type processes: C{int}
+
+    @ivar budget: Maximum number of parallel requests when scanning several
+    targets at once (see L{Halberd.scheduler.Scheduler}).
+    @type budget: C{int}
+
+    @ivar maxperhost: Maximum number of targets scanned at once per host.
+    @type maxperhost: C{int}
+
+    @ivar maxperaddr: Maximum number of targets scanned at once per address.
+    @type maxperaddr: C{int}
+
+    @ivar metrics: File where metrics are periodically written (see
+    L{Halberd.metrics.Exporter}). Empty if no metrics are wanted.
+    @type metrics: C{str}
+
+    @ivar metrics_format: Format of the metrics file (C{json} or
+    C{prometheus}).
+    @type metrics_format: C{str}
+
+    @ivar metrics_interval: Seconds between metrics snapshots.
+    @type metrics_interval: C{float}
+
+    @ivar keepalive: Reuse connections to send several requests.
+    @type keepalive: C{bool}
+
+    @ivar pipeline: Number of requests to pipeline on each connection (1
+    disables pipelining).
+    @type pipeline: C{int}
+
+    @ivar probe: Probing strategy (see L{Halberd.clientlib.HTTPClient}). If
+    set to C{auto} the cheapest one tolerated by the target is used. C{tls}
+    fingerprints HTTPS servers by their TLS handshake without sending HTTP
+    requests (see L{Halberd.clientlib.TLSClient}).
+    @type probe: C{str}
+
+    @ivar rate: Maximum number of requests per second (see
+    L{Halberd.pacer.Pacer}).
+    @type rate: C{float}
+
+    @ivar bandwidth: Maximum number of bytes per second.
+    @type bandwidth: C{float}
+
+    @ivar jitter: Randomization of the spacing between requests.
+    @type jitter: C{float}
+
     @ivar urlfile: Root folder to use for storing results of MultiScans.
     @type urlfile: C{str}
 
@@ -112,6 +276,27 @@ class ScanTask:
     def __init__(self):
         self.scantime = default_scantime
         self.parallelism = default_parallelism
+        self.autoparallelism = False
+        self.max_parallelism = default_max_parallelism
+        self.concurrency = []
+        self.converge_window = default_converge_window
+        self.converge_samples = default_converge_samples
+        self.converge_time = default_converge_time
+        self.stopreason = ''
+        self.engine = default_engine
+        self.processes = default_processes
+        self.budget = default_budget
+        self.maxperhost = default_maxperhost
+        self.maxperaddr = default_maxperaddr
+        self.metrics = ''
+        self.metrics_format = 'json'
+        self.metrics_interval = Halberd.metrics.default_interval
+        self.keepalive = False
+        self.pipeline = default_pipeline
+        self.probe = default_probe
+        self.rate = default_rate
+        self.bandwidth = default_bandwidth
+        self.jitter = default_jitter
         self.conf_file = default_conf_file
         self.verbose = False
         self.debug = False
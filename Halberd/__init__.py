@@ -28,6 +28,12 @@ __all__ = [
     'util',
     'shell',
     'crew',
+    'pacer',
+    'tracer',
+    'profiler',
+    'metrics',
+    'resolver',
+    'scheduler',
     'ScanTask',
     'logger',
 ]
@@ -2,14 +2,33 @@
 
 """HTTP/HTTPS client module.
 
-@var default_timeout: Default timeout for socket operations.
+@var default_timeout: Default timeout for socket operations. It is also the
+initial value of adaptive timeouts (see L{RTTEstimator}).
 @type default_timeout: C{float}
 
+@var default_min_timeout: Lower bound for adaptive timeouts.
+@type default_min_timeout: C{float}
+
+@var default_max_timeout: Upper bound for adaptive timeouts.
+@type default_max_timeout: C{float}
+
 @var default_bufsize: Default number of bytes to try to read from the network.
 @type default_bufsize: C{int}
 
+@var default_maxheaders: Maximum size (in bytes) of the status line plus the
+MIME headers of a reply.
+@type default_maxheaders: C{int}
+
 @var default_template: Request template, must be filled by L{HTTPClient}
 @type default_template: C{str}
+
+@var probes: Probing strategies supported by L{HTTPClient} sorted from the
+cheapest to the most expensive one (in terms of bandwidth).
+@type probes: C{tuple}
+
+@var default_bodybufsize: Number of bytes to try to read at once when skipping
+response bodies.
+@type default_bodybufsize: C{int}
 """
 
 # Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
@@ -30,20 +49,37 @@
 
 
 import time
+import errno
+import rfc822
+import struct
+import ssl
 import socket
+import hashlib
 import urlparse
+import threading
+
+from itertools import count
 
-from itertools import takewhile
+import Halberd.util
+import Halberd.tracer
 
 
 default_timeout = 2
 
-default_bufsize = 1024
+default_min_timeout = 0.25
+
+default_max_timeout = 30
+
+default_bufsize = 8192
+
+default_maxheaders = 65536
+
+default_bodybufsize = 16384
 
 # WARNING - Changing the HTTP request method in the following template will
 # require updating tests/test_clientlib.py accordingly.
 default_template = """\
-GET %(request)s HTTP/1.1\r\n\
+%(method)s %(request)s HTTP/1.1\r\n\
 Host: %(hostname)s%(port)s\r\n\
 Pragma: no-cache\r\n\
 Cache-control: no-cache\r\n\
@@ -54,9 +90,32 @@ Accept-Language: en-us,en;q=0.5\r\n\
 Accept-Encoding: gzip,deflate\r\n\
 Accept-Charset: ISO-8859-1,utf-8;q=0.7,*;q=0.7\r\n\
 Keep-Alive: 300\r\n\
-Connection: keep-alive\r\n\r\n\
+Connection: keep-alive\r\n\
+%(extra)s\r\n\
 """
 
+probes = ('head', 'range', 'abort', 'get')
+
+# Source of connection identifiers (see HTTPClient.connid).
+_connids = count(1)
+
+# Probing strategy tolerated by each target (see selectProbe), or an event
+# set once its detection finishes, and number of inconclusive detections.
+# Regular requests are settled for after _maxdetections of them.
+_tolerated = {}
+_tolerated_lock = threading.Lock()
+_inconclusive = {}
+_maxdetections = 3
+
+# Timeout estimators shared by every client talking to the same target (see
+# getEstimator).
+_estimators = {}
+_estimators_lock = threading.Lock()
+
+# TLS contexts shared by every HTTPSClient (see _getContext).
+_contexts = {}
+_contexts_lock = threading.Lock()
+
 
 class HTTPError(Exception):
     """Generic HTTP exception"""
@@ -85,6 +144,151 @@ class ConnectionRefused(HTTPError):
 class UnknownReply(HTTPError):
     """The remote host didn't return an HTTP reply"""
 
+class HeadersTooLarge(UnknownReply):
+    """The reply's headers don't fit in the receive buffer"""
+
+
+class Reply:
+    """Reply sent by a web server.
+
+    @ivar status: Status line.
+    @type status: C{str}
+
+    @ivar headers: MIME headers as a sequence of (name, value) tuples kept in
+    the same order as they were sent by the server.
+    @type headers: C{list}
+
+    @ivar timestamp: Time when the reply started arriving.
+    @type timestamp: C{float}
+
+    @ivar started: Time when the client started processing the request.
+    @type started: C{float}
+
+    @ivar connected: Time when the connection was established (C{None} if an
+    already open connection was reused).
+    @type connected: C{float}
+
+    @ivar completed: Time when the MIME headers were completely read.
+    @type completed: C{float}
+
+    @ivar bytesin: Number of bytes received from the network while reading
+    the reply.
+    @type bytesin: C{int}
+
+    @ivar bytesout: Number of bytes sent to the network for the request.
+    @type bytesout: C{int}
+
+    @ivar connid: Identifier of the connection where the reply was read.
+    @type connid: C{int}
+
+    @ivar handshake: Kind of TLS handshake performed to get the reply (always
+    C{full}: the ssl module can't resume sessions). C{None} if no handshake
+    was needed.
+    @type handshake: C{str}
+    """
+    def __init__(self, status, headers, timestamp=None):
+        self.status = status
+        self.headers = headers
+        self.timestamp = timestamp
+
+        self.started = self.connected = self.completed = None
+        self.bytesin = self.bytesout = 0
+        self.connid = None
+        self.handshake = None
+
+    def getCode(self):
+        """Status code accessor.
+
+        @return: Status code of the reply (the empty string if missing).
+        @rtype: C{str}
+        """
+        fields = self.status.split(None, 2)
+        if len(fields) > 1:
+            return fields[1]
+        return ''
+
+    def __repr__(self):
+        return "<Reply at %x status='%s' headers=%d>" \
+                % (id(self), self.status, len(self.headers))
+
+
+class RTTEstimator:
+    """Adaptive timeout for the network operations involving a target.
+
+    The timeout is computed the way TCP computes its retransmission timeout
+    (RFC 6298): a smoothed round-trip time plus four times its mean
+    deviation. Each sample is the time elapsed since a request was written
+    until its reply started arriving. Every time an operation times out the
+    timeout is doubled, until a new sample arrives.
+
+    @ivar srtt: Smoothed round-trip time (C{None} until the first sample).
+    @type srtt: C{float}
+
+    @ivar rttvar: Round-trip time variation.
+    @type rttvar: C{float}
+
+    @ivar timeout: Current timeout.
+    @type timeout: C{float}
+    """
+    alpha = 1 / 8.0
+    beta = 1 / 4.0
+    k = 4
+
+    def __init__(self, timeout=default_timeout, mintimeout=default_min_timeout,
+                 maxtimeout=default_max_timeout):
+        self.srtt = None
+        self.rttvar = None
+        self.timeout = timeout
+
+        self.mintimeout = mintimeout
+        self.maxtimeout = maxtimeout
+
+        self.__mutex = threading.Lock()
+
+    def getTimeout(self):
+        """Timeout accessor.
+
+        @return: Timeout to use for the next operation (in seconds).
+        @rtype: C{float}
+        """
+        return self.timeout
+
+    def update(self, rtt):
+        """Takes a round-trip time sample into account.
+
+        @param rtt: Measured round-trip time (in seconds).
+        @type rtt: C{float}
+        """
+        self.__mutex.acquire()
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2.0
+        else:
+            self.rttvar += self.beta * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += self.alpha * (rtt - self.srtt)
+        self.timeout = self._bound(self.srtt + self.k * self.rttvar)
+        self.__mutex.release()
+
+    def backoff(self, timeout):
+        """Doubles the timeout after an operation timed out.
+
+        Operations started before the previous backoff don't count, so
+        many simultaneous timeouts double the timeout only once.
+
+        @param timeout: Timeout the expired operation was using.
+        @type timeout: C{float}
+        """
+        self.__mutex.acquire()
+        if timeout >= self.timeout:
+            self.timeout = self._bound(self.timeout * 2)
+        self.__mutex.release()
+
+    def _bound(self, timeout):
+        return min(max(timeout, self.mintimeout), self.maxtimeout)
+
+    def __repr__(self):
+        return "<RTTEstimator at %x timeout=%.3f>" % (id(self), self.timeout)
+
 
 class HTTPClient:
     """Special-purpose HTTP client.
@@ -96,15 +300,43 @@ class HTTPClient:
     @ivar bufsize: Buffer size for network I/O.
     @type bufsize: C{int}
 
+    @ivar maxheaders: Maximum size of the receive buffer (it starts at
+    L{bufsize} bytes and grows as needed). Replies whose headers don't fit in
+    it are rejected.
+    @type maxheaders: C{int}
+
     @ivar template: Template of the HTTP request to be sent to the target.
     @type template: C{str}
 
-    @ivar _recv: Reference to a callable responsible from reading data from the
-    network.
-    @type _recv: C{callable}
+    @ivar keepalive: Reuse the connection for subsequent requests instead of
+    opening a new one each time.
+    @type keepalive: C{bool}
+
+    @ivar connid: Identifier of the current connection. Every connection
+    opened by any client gets a different one.
+    @type connid: C{int}
+
+    @ivar probe: How to request the headers. C{get} sends a regular GET
+    request, C{head} uses the HEAD method, C{range} asks for the first byte
+    of the resource only and C{abort} resets the connection as soon as the
+    headers have arrived (so the server stops sending the body).
+    @type probe: C{str}
+
+    @ivar estimator: Source of adaptive timeouts (if C{None}, L{timeout} is
+    used as is).
+    @type estimator: L{RTTEstimator}
+
+    @ivar family: Address family of the socket (it follows the address the
+    client connects to).
+    @type family: C{int}
+
+    @ivar _recvInto: Reference to a callable responsible from reading data from
+    the network into a buffer (with the semantics of C{socket.recv_into}).
+    @type _recvInto: C{callable}
     """
     timeout = default_timeout
     bufsize = default_bufsize
+    maxheaders = default_maxheaders
     template = default_template
 
     def __init__(self):
@@ -116,10 +348,55 @@ class HTTPClient:
         # except.
         self._timeout_exceptions = [socket.timeout]
 
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.keepalive = False
+        self.connid = None
+        self.probe = 'get'
+        self.estimator = None
+        self.family = socket.AF_INET
+        # Time when the last request was completely written.
+        self._sentts = None
+
+        # Time when the last connection was established and number of bytes
+        # received so far.
+        self._connectts = 0
+        self._received = 0
+        # Kind of the last TLS handshake, until it is accounted for.
+        self._handshake = None
+
+        # Receive buffer. Data not consumed yet lies between _head and _tail.
+        self._buf = bytearray(min(self.bufsize, self.maxheaders))
+        self._view = memoryview(self._buf)
+
+        self._newSocket()
+
+    def _newSocket(self):
+        """Allocates the socket used to talk to the server.
+        """
+        self._sock = socket.socket(self.family, socket.SOCK_STREAM)
         self._sock.settimeout(self.timeout)
 
-        self._recv = self._sock.recv
+        self._recvInto = self._sock.recv_into
+
+        self._connected = False
+        self._head = self._tail = 0
+        # Time when the data at the head of the buffer arrived and time of the
+        # last read.
+        self._pendingts = self._lastts = None
+
+    def close(self):
+        """Closes the connection with the server.
+
+        When using the C{abort} probe the connection is reset instead of being
+        gracefully closed.
+        """
+        if self.probe == 'abort' and self._connected:
+            try:
+                self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                      struct.pack('ii', 1, 0))
+            except socket.error:
+                pass
+        self._sock.close()
+        self._connected = False
 
     def getHeaders(self, address, urlstr):
         """Talk to the target webserver and fetch MIME headers.
@@ -130,25 +407,219 @@ class HTTPClient:
         @param urlstr: URL to use.
         @type urlstr: C{str}
 
-        @return: The time when the client started reading the server's response
-        and the MIME headers that were sent.
+        @return: The server's reply.
+        @rtype: L{Reply}
+        """
+        started, received = time.time(), self._received
+        if not self.keepalive:
+            sent = self._putRequest(address, urlstr)
+            reply = self._readReply()
+            if self.probe == 'abort':
+                self.close()
+        else:
+            sent, reply = self._exchange(address, urlstr)
+            if self.probe == 'abort' or not self._skipBody(reply):
+                self._reopen()
+
+        self._account(reply, started, received, sent)
+        return reply
+
+    def getPipelined(self, address, urlstr, depth):
+        """Pipelines several requests and fetches the MIME headers of each reply.
+
+        All the requests are written at once on a persistent connection and
+        then the replies are read in order, so a whole batch costs about a
+        single round trip. Bodies are skipped.
+
+        Servers which close the connection, stop answering or answer with a
+        different status line after the first reply don't support pipelining.
+        In that case fewer replies than requested are returned and the
+        connection is dropped.
+
+        @param address: The target's network address.
+        @type address: C{str}
+
+        @param urlstr: URL to use.
+        @type urlstr: C{str}
+
+        @param depth: Number of requests to pipeline.
+        @type depth: C{int}
+
+        @return: Sequence of replies.
+        @rtype: C{list} of L{Reply}
+
+        @note: Bodies are always skipped here, even when using the C{abort}
+        probe.
+        """
+        started, received = time.time(), self._received
+        sent, reply = self._exchange(address, urlstr, depth)
+        sent /= depth
+
+        replies = [reply]
+        persistent = self._skipBody(reply)
+        self._account(reply, started, received, sent)
+        while persistent and len(replies) < depth:
+            received = self._received
+            try:
+                reply = self._readReply()
+            except (TimedOut, ConnectionRefused, UnknownReply):
+                break
+            if reply.getCode() != replies[0].getCode():
+                # The server mangled the pipelined requests.
+                break
+            replies.append(reply)
+            persistent = self._skipBody(reply)
+            self._account(reply, started, received, sent)
+
+        if not persistent or len(replies) < depth:
+            self._reopen()
+
+        return replies
+
+    def _exchange(self, address, urlstr, depth=1):
+        """Sends requests over a persistent connection and reads the first reply.
+
+        If the connection we were reusing was closed by the server in the
+        meantime, a new one is opened and the requests are sent again.
+
+        @return: Number of bytes sent and the first reply.
         @rtype: C{tuple}
         """
-        self._putRequest(address, urlstr)
+        reused = self._connected
+        try:
+            sent = self._putRequest(address, urlstr, depth)
+            reply = self._readReply()
+        except (ConnectionRefused, UnknownReply):
+            if not reused:
+                raise
+            # Stale connection.
+            self._reopen()
+            sent = self._putRequest(address, urlstr, depth)
+            reply = self._readReply()
+
+        return sent, reply
+
+    def _readReply(self):
+        """Reads a reply and splits it into its status line and MIME headers.
+
+        @rtype: L{Reply}
+        """
+        timestamp, status, headers = self._getReply()
 
-        timestamp, headers = self._getReply()
-        if not headers:
-            return None
+        reply = Reply(status, headers, timestamp)
+        reply.completed = time.time()
+        reply.connid = self.connid
+
+        tracer = Halberd.tracer.active
+        if tracer and timestamp:
+            if self._sentts:
+                tracer.addSpan('first byte', self._sentts, timestamp)
+            # Servers may send anything as a status line: only the code goes
+            # in, decoded so the trace can always be written out.
+            tracer.addSpan('headers', timestamp, reply.completed,
+                           status=reply.getCode().decode('latin-1'))
+
+        return reply
+
+    def _account(self, reply, started, received, sent):
+        """Fills in the timing and traffic information of a reply.
+        """
+        reply.started = started
+        if self._connectts >= started:
+            reply.connected = self._connectts
+        reply.bytesin = self._received - received
+        reply.bytesout = sent
+        reply.handshake, self._handshake = self._handshake, None
+
+        if self.estimator and self._sentts and reply.timestamp:
+            # Only the first reply to a request (or batch) is a valid sample.
+            self.estimator.update(reply.timestamp - self._sentts)
+            self._sentts = None
+
+    def _updateTimeout(self):
+        """Picks up the current timeout from the estimator (if any).
+        """
+        if self.estimator:
+            self.timeout = self.estimator.getTimeout()
 
-        # Remove HTTP response and leave only the MIME headers.
-        headers = headers.splitlines()[1:]
-        headers = list(takewhile(lambda x: x != '', headers))
-        headers.append('\r\n')
-        headers = '\r\n'.join(headers)
+    def _timedOut(self, msg):
+        """Reports a timeout to the estimator.
 
-        return timestamp, headers
+        @return: The exception to be raised.
+        @rtype: L{TimedOut}
+        """
+        if self.estimator:
+            self.estimator.backoff(self.timeout)
+        return TimedOut(msg)
+
+    def _reopen(self):
+        """Drops the current connection so the next request opens a new one.
+        """
+        self.close()
+        self._newSocket()
+
+    def _setFamily(self, address):
+        """Makes sure the socket can reach a given address (IPv4 or IPv6).
+
+        @param address: Address about to be connected to.
+        @type address: C{str}
+        """
+        family = Halberd.util.addressFamily(address)
+        if family != self.family:
+            self._sock.close()
+            self.family = family
+            self._newSocket()
+
+    def _splitReply(self, start, end):
+        """Splits a reply lying in the receive buffer into its status line
+        and its MIME headers.
+
+        Lines and colons are located in the buffer itself and every string is
+        copied straight out of it (no intermediate copy of the whole reply).
+
+        We keep the headers as a sequence of name, value tuples instead of a
+        dictionary because that way we keep the order in which the target sent
+        them. The values are left untouched (i.e. including leading spaces) so
+        they can be digested as they came.
+
+        @param start: Position of the reply in the buffer.
+        @type start: C{int}
+
+        @param end: Position where the reply's headers end.
+        @type end: C{int}
+
+        @return: Status line (C{str}) and MIME headers (C{list} of C{tuple}).
+        @rtype: C{tuple}
+
+        @raise UnknownReply: If it isn't an HTTP reply.
+        """
+        buf, view = self._buf, self._view
+        if not buf.startswith('HTTP/', start, end):
+            raise UnknownReply, 'Invalid protocol'
+
+        status = None
+        headers = []
+        while start < end:
+            eol = buf.find('\n', start, end)
+            if eol == -1:
+                eol = end
+            stop = eol
+            if stop > start and buf[stop - 1] == 13:
+                # Carriage return.
+                stop -= 1
+
+            if status is None:
+                status = view[start:stop].tobytes()
+            else:
+                colon = buf.find(':', start, stop)
+                if colon != -1:
+                    headers.append((view[start:colon].tobytes(),
+                                    view[colon + 1:stop].tobytes()))
+            start = eol + 1
 
-    def _putRequest(self, address, urlstr):
+        return status, headers
+
+    def _putRequest(self, address, urlstr, depth=1):
         """Sends an HTTP request to the target webserver.
 
         This method connects to the target server, sends the HTTP request and
@@ -160,10 +631,42 @@ class HTTPClient:
         @param urlstr: A valid Unified Resource Locator.
         @type urlstr: C{str}
 
+        @param depth: Number of times the request is sent (pipelined).
+        @type depth: C{int}
+
+        @return: Number of bytes sent.
+        @rtype: C{int}
+
         @raise InvalidURL: In case the URL scheme is not HTTP or HTTPS
         @raise ConnectionRefused: If it can't reach the target webserver.
         @raise TimedOut: If we cannot send the data within the specified time.
         """
+        port, req = self._makeRequest(urlstr)
+
+        if self.estimator:
+            self._updateTimeout()
+            self._sock.settimeout(self.timeout)
+
+        if not self._connected:
+            self._connect((address, port))
+
+        req *= depth
+        self._sendAll(req)
+        self._sentts = time.time()
+
+        return len(req)
+
+    def _makeRequest(self, urlstr):
+        """Builds the HTTP request for the specified URL.
+
+        @param urlstr: A valid Unified Resource Locator.
+        @type urlstr: C{str}
+
+        @return: Remote port (C{int}) and the request to be sent (C{str}).
+        @rtype: C{tuple}
+
+        @raise InvalidURL: In case the URL scheme is not HTTP or HTTPS
+        """
         scheme, netloc, url, params, query, fragment = urlparse.urlparse(urlstr)
 
         if scheme not in self.schemes:
@@ -175,9 +678,7 @@ class HTTPClient:
             
         req = self._fillTemplate(hostname, port, url, params, query, fragment)
 
-        self._connect((address, port))
-
-        self._sendAll(req)
+        return port, req
 
     def _getHostAndPort(self, netloc):
         """Determine the hostname and port to connect to from an URL
@@ -188,6 +689,18 @@ class HTTPClient:
         @return: Hostname (C{str}) and port (C{int})
         @rtype: C{tuple}
         """
+        if netloc.startswith('['):
+            # IPv6 literal (the brackets are kept for the Host header).
+            end = netloc.find(']') + 1
+            if end == 0:
+                raise InvalidURL, '%s is not a valid IPv6 address' % netloc
+            hostname, portnum = netloc[:end], netloc[end + 1:]
+            if not portnum:
+                return hostname, self.default_port
+            if portnum.isdigit():
+                return hostname, int(portnum)
+            raise InvalidURL, '%s is not a valid port number' % portnum
+
         try:
             hostname, portnum = netloc.split(':', 1)
         except ValueError:
@@ -228,7 +741,18 @@ class HTTPClient:
         else:
             p = ':' + str(port)
 
-        values = {'request': urlstr, 'hostname': hostname, 'port': p}
+        if self.probe == 'head':
+            method = 'HEAD'
+        else:
+            method = 'GET'
+
+        if self.probe == 'range':
+            extra = 'Range: bytes=0-0\r\n'
+        else:
+            extra = ''
+
+        values = {'method': method, 'request': urlstr, 'hostname': hostname,
+                  'port': p, 'extra': extra}
 
         return self.template % values
 
@@ -239,64 +763,429 @@ class HTTPClient:
         @type addr: C{tuple}
 
         @raise ConnectionRefused: If it can't reach the target webserver.
+        @raise TimedOut: If the target doesn't answer in time.
         """
+        self._setFamily(addr[0])
+        started = time.time()
         try:
             self._sock.connect(addr)
+        except socket.timeout:
+            raise self._timedOut('timed out while connecting')
         except socket.error:
             raise ConnectionRefused, 'Connection refused'
 
+        self._connected = True
+        self._connectts = time.time()
+        self.connid = _connids.next()
+
+        tracer = Halberd.tracer.active
+        if tracer:
+            tracer.addSpan('connect', started, self._connectts,
+                           addr=addr[0], port=addr[1], connid=self.connid)
+
     def _sendAll(self, data):
         """Sends a string to the socket.
         """
+        started = time.time()
         try:
             self._sock.sendall(data)
         except socket.timeout:
-            raise TimedOut, 'timed out while writing to the network'
+            raise self._timedOut('timed out while writing to the network')
+        except socket.error, msg:
+            raise ConnectionRefused, msg
+
+        tracer = Halberd.tracer.active
+        if tracer:
+            tracer.addSpan('send', started, time.time(), bytes=len(data))
 
     def _getReply(self):
         """Read a reply from the server.
 
-        @return: Time when the data started arriving plus the received data.
+        Data is received straight into the receive buffer and the search
+        for the end of the headers only covers newly arrived bytes, so the
+        cost is linear on the size of the reply.
+
+        @return: Time when the data started arriving, status line and MIME
+        headers (see L{_splitReply}).
         @rtype: C{tuple}
 
         @raise UnknownReply: If the remote server doesn't return a valid HTTP
         reply.
+        @raise HeadersTooLarge: If the headers don't fit in the buffer.
         @raise TimedOut: In case reading from the network takes too much time.
         """
-        data = ''
-        timestamp = None
+        offset = 0
         stoptime = time.time() + self.timeout
-        while time.time() < stoptime:
-            try:
-                chunk = self._recv(self.bufsize)
-            except tuple(self._timeout_exceptions), msg:
-                raise TimedOut, msg
-    
-            if not chunk:
-                # The remote end closed the connection.
+        while True:
+            idx = self._buf.find('\r\n\r\n', self._head + offset, self._tail)
+            if idx != -1:
+                # Whatever follows the headers belongs to the reply's body (or
+                # to the next reply when pipelining).
+                break
+
+            # Allow for a terminator split between two reads.
+            offset = max(0, self._tail - self._head - 3)
+            if time.time() >= stoptime or not self._fill(self.bufsize):
+                idx = self._tail
                 break
 
-            if not timestamp:
-                timestamp = time.time()
+        timestamp = self._pendingts
+        try:
+            status, headers = self._splitReply(self._head, idx)
+        finally:
+            self._consume(min(idx + 4, self._tail) - self._head)
+
+        return timestamp, status, headers
+
+    def _fill(self, bufsize):
+        """Reads data from the network into the receive buffer.
+
+        @param bufsize: Maximum number of bytes to read.
+        @type bufsize: C{int}
+
+        @return: Number of bytes read (zero if the remote end closed the
+        connection).
+        @rtype: C{int}
 
-            data += chunk
-            idx = data.find('\r\n\r\n')
+        @raise HeadersTooLarge: If there's no room left in the buffer.
+        @raise TimedOut: In case reading from the network takes too much time.
+        """
+        self._makeRoom()
+
+        bufsize = min(bufsize, len(self._buf) - self._tail)
+        try:
+            num = self._recvInto(self._view[self._tail:], bufsize)
+        except tuple(self._timeout_exceptions), msg:
+            raise self._timedOut(msg)
+        except socket.error, msg:
+            raise ConnectionRefused, msg
+
+        if num:
+            self._lastts = time.time()
+            if self._head == self._tail:
+                self._pendingts = self._lastts
+        self._tail += num
+        self._received += num
+
+        return num
+
+    def _makeRoom(self):
+        """Ensures there is free space at the end of the receive buffer.
+
+        Pending data is moved to the beginning of the buffer or, if it already
+        fills it, the buffer doubles its size (up to L{maxheaders} bytes).
+
+        @raise HeadersTooLarge: If the buffer can't grow any further.
+        """
+        if self._tail < len(self._buf):
+            return
+
+        size = self._tail - self._head
+        if self._head:
+            self._buf[:size] = self._buf[self._head:self._tail]
+            self._head, self._tail = 0, size
+        elif size < self.maxheaders:
+            buf = bytearray(min(2 * size, self.maxheaders))
+            buf[:size] = self._buf
+            self._buf, self._view = buf, memoryview(buf)
+        else:
+            raise HeadersTooLarge, 'Reply headers exceed %d bytes' % size
+
+    def _consume(self, num):
+        """Discards data from the head of the receive buffer.
+        """
+        self._head += num
+        if self._head == self._tail:
+            self._head = self._tail = 0
+        else:
+            # Part of the remaining data might have arrived earlier but we
+            # can't tell exactly when.
+            self._pendingts = self._lastts
+
+    def _skipBody(self, reply):
+        """Reads and discards the body of a reply.
+
+        The length of the body is determined as specified by RFC 2616 (section
+        4.4): chunked transfer-coding first, then Content-Length.
+
+        @param reply: Reply whose body must be skipped.
+        @type reply: L{Reply}
+
+        @return: True if the connection can be used for another request.
+        @rtype: C{bool}
+        """
+        fields = {}
+        for name, value in reply.headers:
+            fields[name.strip().lower()] = value.strip().lower()
+
+        persistent = not reply.status.startswith('HTTP/1.0')
+        connection = fields.get('connection', '')
+        if connection == 'close':
+            persistent = False
+        elif connection == 'keep-alive':
+            persistent = True
+        if not persistent:
+            return False
+
+        code = reply.getCode()
+        if self.probe == 'head' or code[:1] == '1' or code in ('204', '304'):
+            return True
+
+        try:
+            if 'chunked' in fields.get('transfer-encoding', ''):
+                self._skipChunks()
+            elif fields.get('content-length', '').isdigit():
+                self._skip(int(fields['content-length']))
+            else:
+                # The body ends when the server closes the connection.
+                return False
+        except (TimedOut, ConnectionRefused, UnknownReply):
+            return False
+
+        return True
+
+    def _skip(self, num):
+        """Discards the specified amount of bytes from the connection.
+
+        @raise UnknownReply: If the remote end closes the connection.
+        """
+        while self._tail - self._head < num:
+            num -= self._tail - self._head
+            self._consume(self._tail - self._head)
+            if not self._fill(min(num, default_bodybufsize)):
+                raise UnknownReply, 'Connection closed in the middle of a reply'
+        self._consume(num)
+
+    def _readLine(self):
+        """Reads a CRLF terminated line from the connection.
+
+        @raise UnknownReply: If the remote end closes the connection.
+        """
+        offset = 0
+        while True:
+            idx = self._buf.find('\r\n', self._head + offset, self._tail)
             if idx != -1:
-                data = data[:idx]
-                break
+                line = self._view[self._head:idx].tobytes()
+                self._consume(idx + 2 - self._head)
+                return line
 
-        if not data.startswith('HTTP/'):
-            raise UnknownReply, 'Invalid protocol'
+            offset = max(0, self._tail - self._head - 1)
+            if not self._fill(self.bufsize):
+                raise UnknownReply, 'Connection closed in the middle of a reply'
 
-        return timestamp, data
+    def _skipChunks(self):
+        """Discards a body sent using the chunked transfer-coding.
+        """
+        while True:
+            size = self._readLine().split(';', 1)[0].strip()
+            try:
+                size = int(size, 16)
+            except ValueError:
+                raise UnknownReply, 'Invalid chunk size'
+
+            if size == 0:
+                break
+            self._skip(size + 2)
+
+        # Trailer headers.
+        while self._readLine() != '':
+            pass
 
     def __del__(self):
         if self._sock:
             self._sock.close()
 
 
+class AsyncHTTPClient(HTTPClient):
+    """Non-blocking HTTP client.
+
+    Instead of blocking on each network operation, this client exposes its
+    socket so that a single thread can multiplex many of them (see
+    L{Halberd.crew.AsyncCrew}). The caller is expected to invoke
+    L{handleWrite} and L{handleRead} whenever the socket becomes writable or
+    readable respectively.
+
+    @ivar deadline: Time (in seconds since the UNIX Epoch) when the exchange
+    with the server times out.
+    @type deadline: C{float}
+
+    @ivar timestamp: Time when the server's reply started arriving.
+    @type timestamp: C{float}
+    """
+    def __init__(self):
+        HTTPClient.__init__(self)
+
+        self._connected = False
+        self._outbuf = ''
+        self._sent = 0
+        # End of the reply's headers within the receive buffer.
+        self._end = None
+
+        self._started = self._completed = None
+
+        self.deadline = 0
+        self.timestamp = None
+
+    def _newSocket(self):
+        """Allocates a non-blocking socket.
+        """
+        HTTPClient._newSocket(self)
+        self._sock.setblocking(0)
+
+    def fileno(self):
+        """Returns the file descriptor of the underlying socket.
+        """
+        return self._sock.fileno()
+
+    def start(self, address, urlstr):
+        """Starts connecting to the target and queues the HTTP request.
+
+        @param address: The target's network address.
+        @type address: C{str}
+
+        @param urlstr: URL to use.
+        @type urlstr: C{str}
+
+        @raise InvalidURL: In case the URL scheme is not HTTP.
+        @raise ConnectionRefused: If it can't reach the target webserver.
+        """
+        port, self._outbuf = self._makeRequest(urlstr)
+        self._updateTimeout()
+        self._started = time.time()
+        self.deadline = self._started + self.timeout
+        self.connid = _connids.next()
+
+        self._setFamily(address)
+        err = self._sock.connect_ex((address, port))
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            raise ConnectionRefused, 'Connection refused'
+
+    def wantsWrite(self):
+        """Tells whether there is still data waiting to be sent.
+
+        @rtype: C{bool}
+        """
+        return self._outbuf != ''
+
+    def hasExpired(self):
+        """Expiration predicate.
+
+        Each stage of the exchange (connecting, sending the request and
+        waiting for the reply) gets its own timeout, as with blocking sockets.
+        An expired exchange is reported to the estimator (if any).
+
+        @return: True if the server took too long to answer.
+        @rtype: C{bool}
+        """
+        if time.time() < self.deadline:
+            return False
+        if self.estimator:
+            self.estimator.backoff(self.timeout)
+        return True
+
+    def handleWrite(self):
+        """Sends as much of the pending request as the socket accepts.
+
+        @raise ConnectionRefused: If the connection could not be established
+        or was reset by the remote end.
+        """
+        if not self._connected:
+            err = self._sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err != 0:
+                raise ConnectionRefused, 'Connection refused'
+            self._connected = True
+            self._connectts = time.time()
+            self.deadline = self._connectts + self.timeout
+
+        try:
+            sent = self._sock.send(self._outbuf)
+        except socket.error, (err, msg):
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise ConnectionRefused, msg
+
+        self._outbuf = self._outbuf[sent:]
+        self._sent += sent
+        if not self._outbuf:
+            self._sentts = time.time()
+            self.deadline = self._sentts + self.timeout
+
+    def handleRead(self):
+        """Reads available data from the server.
+
+        @return: True once the whole set of MIME headers has been read (or the
+        remote end closed the connection), False otherwise.
+        @rtype: C{bool}
+
+        @raise ConnectionRefused: If the connection was reset.
+        @raise HeadersTooLarge: If the headers don't fit in the buffer.
+        """
+        self._makeRoom()
+        bufsize = min(self.bufsize, len(self._buf) - self._tail)
+        try:
+            num = self._sock.recv_into(self._view[self._tail:], bufsize)
+        except socket.error, (err, msg):
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return False
+            raise ConnectionRefused, msg
+
+        if not num:
+            # The remote end closed the connection.
+            self._end = self._tail
+            self._completed = time.time()
+            return True
+
+        if not self.timestamp:
+            self.timestamp = time.time()
+            if self.estimator and self._sentts:
+                self.estimator.update(self.timestamp - self._sentts)
+
+        # Only the newly arrived bytes (plus a possible partial terminator)
+        # need to be searched.
+        start = max(0, self._tail - 3)
+        self._tail += num
+        idx = self._buf.find('\r\n\r\n', start, self._tail)
+        if idx != -1:
+            self._end = idx
+            self._completed = time.time()
+            return True
+
+        return False
+
+    def getResult(self):
+        """Returns the outcome of the exchange.
+
+        @return: The server's reply.
+        @rtype: L{Reply}
+
+        @raise UnknownReply: If the remote server didn't return a valid HTTP
+        reply.
+        """
+        status, headers = self._splitReply(0, self._end)
+        reply = Reply(status, headers, self.timestamp)
+        reply.started = self._started
+        reply.connected = self._connectts
+        reply.completed = self._completed
+        reply.bytesin = self._tail
+        reply.bytesout = self._sent
+        reply.connid = self.connid
+
+        return reply
+
+
 class HTTPSClient(HTTPClient):
     """Special-purpose HTTPS client.
+
+    All the clients share a single TLS context per key and certificate pair
+    (see L{_getContext}). The ssl module offers no way to resume a previous
+    session, so every new connection goes through a full handshake: use
+    keep-alive connections to avoid them.
+
+    @ivar keyfile: Path to an SSL key file.
+    @type keyfile: C{str}
+
+    @ivar certfile: Path to an SSL certificate.
+    @type certfile: C{str}
     """
 
     def __init__(self):
@@ -306,14 +1195,23 @@ class HTTPSClient(HTTPClient):
 
         self.default_port = 443
 
-        self._recv = None
-        self._sslsock = None
-        self._timeout_exceptions.append(socket.sslerror)
-
         # Path to an SSL key file and certificate.
         self.keyfile = None
         self.certfile = None
 
+        # Name sent to the server during the handshake (SNI).
+        self._servername = None
+
+    def _getHostAndPort(self, netloc):
+        """Determine the hostname and port to connect to from an URL.
+
+        The hostname is remembered so it can be sent during the handshake.
+        """
+        hostname, port = HTTPClient._getHostAndPort(self, netloc)
+        self._servername = hostname.strip('[]')
+
+        return hostname, port
+
     def _connect(self, addr):
         """Connect to the target web server.
 
@@ -324,42 +1222,288 @@ class HTTPSClient(HTTPClient):
         negotiation.
         """
         HTTPClient._connect(self, addr)
+
+        context = _getContext(self.keyfile, self.certfile)
+
+        started = time.time()
         try:
-            self._sslsock = socket.ssl(self._sock, self.keyfile, self.certfile)
-        except socket.sslerror, msg:
+            sslsock = context.wrap_socket(self._sock,
+                                          server_hostname=self._servername)
+        except socket.timeout:
+            raise self._timedOut('timed out during the TLS handshake')
+        except socket.error, msg:
             raise HTTPSError, msg
 
-        self._recv = self._sslsock.read
+        self._handshake = 'full'
 
-    def _sendAll(self, data):
-        """Sends a string to the socket.
+        tracer = Halberd.tracer.active
+        if tracer:
+            tracer.addSpan('tls', started, time.time(),
+                           handshake=self._handshake)
+
+        self._sock = sslsock
+        self._recvInto = sslsock.recv_into
+
+class TLSClient(HTTPSClient):
+    """Fingerprints HTTPS servers by their TLS handshake alone.
+
+    No HTTP request is ever sent: the connection is closed as soon as the
+    handshake is over. Real servers are told apart by the negotiated protocol
+    version and cipher suite plus the certificate they present, which are
+    returned as the MIME headers of a pseudo-reply so the result can be turned
+    into a regular clue.
+
+    The handshake provides no clock information, so the local time is used as
+    the remote one (i.e. all the replies seem to come from synchronized
+    servers).
+    """
+
+    def __init__(self):
+        HTTPSClient.__init__(self)
+
+        self.schemes = ['https']
+
+    def getHeaders(self, address, urlstr):
+        """Performs a TLS handshake with the target.
+
+        @param address: The target's network address.
+        @type address: C{tuple}
+
+        @param urlstr: URL to use.
+        @type urlstr: C{str}
+
+        @return: Pseudo-reply describing the handshake.
+        @rtype: L{Reply}
         """
-        # xxx - currently we don't make sure everything is sent.
-        self._sslsock.write(data)
-        
+        started = time.time()
+        port, req = self._makeRequest(urlstr)
+        if self.estimator:
+            self._updateTimeout()
+            self._sock.settimeout(self.timeout)
+        # The handshake is the only exchange, so it's what the estimator
+        # learns from.
+        self._sentts = started
+        self._connect((address, port))
 
-def clientFactory(scantask):
-    """HTTP/HTTPS client factory.
+        timestamp = time.time()
+        headers = [('Date', ' ' + rfc822.formatdate(timestamp))]
+        headers.extend(self._fingerprint())
 
-    @param scantask: Object describing where the target is and how to reach it.
-    @type scantask: C{instanceof(ScanTask)}
+        reply = Reply('TLS', headers, timestamp)
+        reply.completed = timestamp
+        reply.connid = self.connid
+        self._account(reply, started, self._received, 0)
 
-    @return: The appropriate client class for the specified URL.
-    @rtype: C{class}
+        self._reopen()
+
+        return reply
+
+    def _fingerprint(self):
+        """Describes the parameters negotiated during the handshake.
+
+        @return: Sequence of (name, value) tuples.
+        @rtype: C{list}
+        """
+        name, protocol, bits = self._sock.cipher()
+        cert = self._sock.getpeercert(True)
+        if cert:
+            digest = hashlib.sha1(cert).hexdigest()
+        else:
+            digest = 'none'
+
+        return [('TLS-Version', ' ' + str(self._sock.version())),
+                ('TLS-Cipher', ' %s %s' % (name, bits)),
+                ('TLS-Certificate', ' ' + digest)]
+
+def getEstimator(address):
+    """Returns the timeout estimator shared by all the clients of a target.
+
+    @param address: The target's network address.
+    @type address: C{str}
+
+    @rtype: L{RTTEstimator}
+    """
+    _estimators_lock.acquire()
+    try:
+        estimator = _estimators.get(address)
+        if estimator is None:
+            estimator = _estimators[address] = RTTEstimator()
+    finally:
+        _estimators_lock.release()
+
+    return estimator
+
+def _getContext(keyfile=None, certfile=None):
+    """Returns the TLS context shared by all the clients.
+
+    Certificates are not verified: we are interested in the server's replies,
+    not in its identity.
+
+    @param keyfile: Path to an SSL key file.
+    @type keyfile: C{str}
+
+    @param certfile: Path to an SSL certificate.
+    @type certfile: C{str}
+
+    @rtype: C{ssl.SSLContext}
+
+    @raise HTTPSError: If the key or the certificate can't be loaded.
+    """
+    _contexts_lock.acquire()
+    try:
+        context = _contexts.get((keyfile, certfile))
+        if context is None:
+            context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            if certfile:
+                try:
+                    context.load_cert_chain(certfile, keyfile)
+                except (ssl.SSLError, IOError), msg:
+                    raise HTTPSError, msg
+            _contexts[(keyfile, certfile)] = context
+    finally:
+        _contexts_lock.release()
+
+    return context
+
+def _newClient(scantask):
+    """Instantiates the appropriate client class for the task's URL.
     """
     url = scantask.url
     keyfile = scantask.keyfile
     certfile = scantask.certfile
 
-    if url.startswith('http://'):
-        return HTTPClient()
+    if scantask.probe == 'tls':
+        if not url.startswith('https://'):
+            raise InvalidURL, 'TLS fingerprinting requires an https URL'
+        client = TLSClient()
+        client.keyfile = keyfile
+        client.certfile = certfile
+    elif url.startswith('http://'):
+        client = HTTPClient()
     elif url.startswith('https://'):
-        httpsclient = HTTPSClient()
-        httpsclient.keyfile = keyfile
-        httpsclient.certfile = certfile
-        return httpsclient
+        client = HTTPSClient()
+        client.keyfile = keyfile
+        client.certfile = certfile
     else:
         raise InvalidURL
 
+    return client
+
+def clientFactory(scantask, probe=None):
+    """HTTP/HTTPS client factory.
+
+    @param scantask: Object describing where the target is and how to reach it.
+    @type scantask: C{instanceof(ScanTask)}
+
+    @param probe: Probing strategy, usually chosen once per scan (see
+    L{selectProbe}, which is called if it isn't given).
+    @type probe: C{str}
+
+    @return: The appropriate client class for the specified URL.
+    @rtype: C{class}
+    """
+    client = _newClient(scantask)
+    client.keepalive = scantask.keepalive
+    client.estimator = getEstimator(scantask.addr)
+    client.probe = probe or selectProbe(scantask)
+
+    return client
+
+def selectProbe(scantask):
+    """Chooses the probing strategy for a scan.
+
+    If the task asks for it to be selected automatically, the cheapest
+    strategy tolerated by the target is used. Each target (address, scheme and
+    network location) is only examined once and the result is remembered for
+    subsequent scans. Detection doesn't block the scans of other targets and
+    if it's inconclusive (the target timed out or couldn't be reached) regular
+    requests are used and it is tried again next time, up to
+    C{_maxdetections} times.
+
+    @param scantask: Object describing where the target is and how to reach it.
+    @type scantask: C{instanceof(ScanTask)}
+
+    @return: One of L{probes}.
+    @rtype: C{str}
+    """
+    if scantask.probe != 'auto':
+        return scantask.probe
+
+    key = (scantask.addr,) + urlparse.urlparse(scantask.url)[:2]
+
+    _tolerated_lock.acquire()
+    entry = _tolerated.get(key)
+    if entry is None:
+        done = _tolerated[key] = threading.Event()
+    _tolerated_lock.release()
+
+    if entry is None:
+        probe = None
+        try:
+            probe = _detectProbe(scantask)
+        finally:
+            _tolerated_lock.acquire()
+            if probe is None:
+                failures = _inconclusive.get(key, 0) + 1
+                if failures < _maxdetections:
+                    _inconclusive[key] = failures
+                    del _tolerated[key]
+                else:
+                    _inconclusive.pop(key, None)
+                    _tolerated[key] = 'get'
+            else:
+                _inconclusive.pop(key, None)
+                _tolerated[key] = probe
+            _tolerated_lock.release()
+            done.set()
+        return probe or 'get'
+
+    if isinstance(entry, str):
+        return entry
+
+    # Someone else is finding it out. Waiting in small steps keeps us
+    # responsive to signals.
+    while not entry.isSet():
+        entry.wait(0.25)
+
+    _tolerated_lock.acquire()
+    probe = _tolerated.get(key)
+    _tolerated_lock.release()
+
+    if isinstance(probe, str):
+        return probe
+    return 'get'
+
+def _detectProbe(scantask):
+    """Finds out the cheapest probing strategy tolerated by the target.
+
+    HEAD requests are tolerated if they get the same status code as regular
+    requests, range requests if the server honours them (status code 206).
+    Resetting connections always works. Targets which don't give a valid
+    reply only tolerate regular requests.
+
+    @return: One of L{probes} or C{None} if the target couldn't be examined
+    (e.g. it timed out).
+    @rtype: C{str}
+    """
+    def status(probe):
+        client = _newClient(scantask)
+        client.probe = probe
+        return client.getHeaders(scantask.addr, scantask.url).getCode()
+
+    try:
+        baseline = status('abort')
+        if status('head') == baseline:
+            return 'head'
+        if status('range') == '206':
+            return 'range'
+        return 'abort'
+    except UnknownReply:
+        return 'get'
+    except HTTPError:
+        return None
+
 
 # vim: ts=4 sw=4 et
@@ -29,76 +29,197 @@ import time
 import types
 import rfc822
 import hashlib
+import UserDict
 
 import Halberd.util
+import Halberd.clientlib
 
 
-class Clue:
+class ClueInfo(UserDict.DictMixin):
+    """Generic server info (sometimes useful for distinguising servers).
+
+    Clues keep this information in their own slots. This is a dictionary-like
+    view on them with the keys C{server}, C{contloc}, C{cookies} (a tuple),
+    C{date} and C{digest}.
+    """
+    __slots__ = ('_clue',)
+
+    _fields = {
+        'server': '_server',
+        'contloc': '_contloc',
+        'cookies': '_cookies',
+        'date': '_date',
+        'digest': '_digest',
+    }
+
+    def __init__(self, clue):
+        self._clue = clue
+
+    def __getitem__(self, key):
+        return getattr(self._clue, self._fields[key])
+
+    def __setitem__(self, key, value):
+        setattr(self._clue, self._fields[key], value)
+
+    def keys(self):
+        return self._fields.keys()
+
+
+class Clue(object):
     """A clue is what we use to tell real servers behind a virtual IP. 
 
     Clues are gathered during several connections to a web server and they
     allow us to try to identify patterns in its responses. Those patterns could
     allow us to find out which real servers are behind a VIP
+
+    Long scans and big archives produce lots of clues, so they are kept
+    compact: there is no per-instance dictionary, header names and values are
+    interned, identical header lists are shared between clues (they are
+    stored as tuples) and so are digests.
     """
+    __slots__ = ('_count', '_local', '_remote', 'diff', 'headers', '_conns',
+                 '_server', '_contloc', '_cookies', '_date', '_digest',
+                 '__sha')
+
     def __init__(self):
         # Number of times this clue has been found.
         self._count = 1
 
-        # Generic server info (sometimes useful for distinguising servers).
-        self.info = {
-            'server': '',
-            'contloc': '',
-            'cookies': [],
-            'date': '',
-            'digest': ''
-        }
+        # Generic server info (see ClueInfo).
+        self._server = self._contloc = self._date = self._digest = ''
+        self._cookies = ()
 
         # Local time and remote time (in seconds since the Epoch)
         self._local, self._remote = 0, 0
 
         self.diff = None
 
-        # We store the headers we're interested in digesting in a string and
-        # calculate its hash _after_ the header processing takes place. This
-        # way we incur in less computational overhead.
-        self.__tmphdrs = ''
+        # The headers we're interested in digesting are fed to this hash while
+        # they are processed. It's only around during the parsing (hash
+        # objects can't be copied or pickled along with the clue).
+        self.__sha = None
 
         # Original MIME headers. They're useful during analysis and reporting.
         self.headers = None
 
+        # Connections (identified as in Halberd.clientlib.HTTPClient.connid)
+        # where this clue was found along with the number of hits on each one.
+        # Most clues never get any, so the dictionary is created on demand.
+        self._conns = None
+
+    def _getInfo(self):
+        return ClueInfo(self)
+
+    info = property(_getInfo, doc="""Generic server info (see L{ClueInfo}).""")
+
+    def _getConns(self):
+        if self._conns is None:
+            self._conns = {}
+        return self._conns
+
+    def _setConns(self, conns):
+        self._conns = conns
+
+    conns = property(_getConns, _setConns, doc="""Connections where this
+    clue was found along with the number of hits on each one.""")
+
+    def __getstate__(self):
+        return (self._count, self._local, self._remote, self.diff,
+                self.headers, self._conns, self._server, self._contloc,
+                self._cookies, self._date, self._digest)
+
+    def __setstate__(self, state):
+        (self._count, self._local, self._remote, self.diff, self.headers,
+         self._conns, self._server, self._contloc, self._cookies, self._date,
+         self._digest) = state
+        self.__sha = None
+
+
+    # Normalized header name -> handler (see the _get_* methods below).
+    _handlers = {}
 
-    def parse(self, headers):
+    # Header name -> normalized header name.
+    _names = {}
+
+    # Maximum number of header names remembered in _names.
+    maxnames = 1024
+
+    # Header list -> the same header list, so identical ones are shared.
+    _headersets = {}
+
+    # Maximum number of header lists remembered in _headersets (the oldest
+    # ones are forgotten all at once).
+    maxheadersets = 4096
+
+    def parse(self, headers, ignored=()):
         """Extracts all relevant information from the MIME headers replied by
         the target.
 
         @param headers: A set of MIME headers (a string as replied by the
-        webserver or a previously parsed sequence of name, value tuples).
-        @type headers: C{str}, C{list} or C{tuple}
+        webserver, a previously parsed sequence of name, value tuples or a
+        reply coming straight from L{Halberd.clientlib}, in which case the
+        local timestamp is taken from it too).
+        @type headers: C{str}, C{list}, C{tuple} or L{Halberd.clientlib.Reply}
+
+        @param ignored: Normalized names of the headers without a handler
+        which should be left out of the digest (see
+        L{Halberd.clues.analysis.ignore_changing_fields}).
+        @type ignored: C{set}
 
         @raise TypeError: If headers is neither a string nor a sequence.
         """
-        if isinstance(headers, basestring):
+        if isinstance(headers, Halberd.clientlib.Reply):
+            # The client already split the headers for us.
+            self.setTimestamp(headers.timestamp)
+            headers = headers.headers
+        elif isinstance(headers, basestring):
             # We parse the server's response into a sequence of name, value
             # tuples instead of a dictionary because with this approach we keep
             # the header's order as sent by the target, This is a relevant
             # piece of information we can't afford to miss.
-            self.headers = [tuple(line.split(':', 1)) \
-                            for line in headers.splitlines() if line != '']
-        elif isinstance(headers, types.ListType):
-            self.headers = headers
-        else:
+            headers = [tuple(line.split(':', 1)) \
+                       for line in headers.splitlines() if line != '']
+        elif not isinstance(headers, (types.ListType, types.TupleType)):
             raise TypeError, 'Unable to parse headers of type %s' \
                              % type(headers).__name__
 
+        # Header lists seen before are shared (their strings are interned
+        # already). The caches are shared by every scanning thread: entries
+        # are added with setdefault (atomic) and whatever it returns is used,
+        # so racing threads all end up sharing the same tuple.
+        headers = tuple(headers)
+        headersets = Clue._headersets
+        self.headers = headersets.get(headers)
+        if self.headers is None:
+            fields = []
+            for name, value in headers:
+                if type(name) is str:
+                    name = intern(name)
+                if type(value) is str:
+                    value = intern(value)
+                fields.append((name, value))
+
+            if len(headersets) >= Clue.maxheadersets:
+                headersets.clear()
+            fields = tuple(fields)
+            self.headers = headersets.setdefault(fields, fields)
+
         # We examine each MIME field and try to find an appropriate handler. If
         # there is none we simply digest the info it provides.
-        self.__tmphdrs = ''
+        handlers, names = self._handlers, Clue._names
+        self.__sha = sha = hashlib.sha1()
         for name, value in self.headers:
-            try:
-                handlerfn = getattr(self, '_get_' + Clue.normalize(name))
-                handlerfn(value)
-            except AttributeError:
-                self.__tmphdrs += '%s: %s ' % (name, value)
+            normal = names.get(name)
+            if normal is None:
+                normal = Clue.normalize(name)
+                if len(names) < Clue.maxnames:
+                    normal = names.setdefault(name, normal)
+
+            handler = handlers.get(normal)
+            if handler is not None:
+                handler(self, value)
+            elif normal not in ignored:
+                sha.update('%s: %s ' % (name, value))
 
         self._updateDigest()
         self._calcDiff()
@@ -127,10 +248,9 @@ class Clue:
     def _updateDigest(self):
         """Updates header fingerprint.
         """
-        assert self.__tmphdrs != None
-        fingerprint = hashlib.sha1(self.__tmphdrs)
-        self.__tmphdrs = None
-        self.info['digest'] = fingerprint.hexdigest()
+        assert self.__sha != None
+        self._digest = intern(self.__sha.hexdigest())
+        self.__sha = None
 
     def _calcDiff(self):
         """Compute the time difference between the remote and local clocks.
@@ -161,6 +281,14 @@ class Clue:
         """
         return self._count
 
+    def getDigest(self):
+        """Retrieve the fingerprint of the headers (same as C{info['digest']}).
+
+        @return: SHA-1 digest of the headers in hexadecimal.
+        @rtype: C{str}
+        """
+        return self._digest
+
 
     def setTimestamp(self, timestamp):
         """Sets the local clock attribute.
@@ -176,7 +304,7 @@ class Clue:
         if self.diff != other.diff:
             return False
 
-        if self.info['digest'] != other.info['digest']:
+        if self._digest != other._digest:
             return False
 
         return True
@@ -184,12 +312,15 @@ class Clue:
     def __ne__(self, other):
         return not self == other
 
+    # Clues are mutable (see incCount) so they can't be hashed.
+    __hash__ = None
+
     def __repr__(self):
-        if not (self.diff or self.info['digest']):
+        if not (self.diff or self._digest):
             return "<Clue at %x>" % id(self)
         return "<Clue at %x diff=%d found=%d digest='%s'>" \
                 % (id(self), self.diff, self._count,
-                   self.info['digest'][:4] + '...')
+                   self._digest[:4] + '...')
 
     # ==================================================================
     # The following methods extract relevant data from the MIME headers.
@@ -197,22 +328,37 @@ class Clue:
 
     def _get_server(self, field):
         """Server:"""
-        self.info['server'] = field
-        self.__tmphdrs += field     # Make sure this gets hashed too.
+        self._server = field
+        self.__sha.update(field)    # Make sure this gets hashed too.
 
     def _get_date(self, field):
         """Date:"""
-        self.info['date'] = field
+        self._date = field
         self._remote = time.mktime(rfc822.parsedate(field))
 
     def _get_content_location(self, field):
         """Content-location:"""
-        self.info['contloc'] = field
-        self.__tmphdrs += field
+        self._contloc = field
+        self.__sha.update(field)
 
     def _get_set_cookie(self, field):
         """Set-cookie:"""
-        self.info['cookies'].append(field)
+        self._cookies += (field,)
+
+    # TLS handshake fingerprints (see Halberd.clientlib.TLSClient). They are
+    # always hashed since they are all we know about each real server.
+
+    def _get_tls_version(self, field):
+        """TLS-Version:"""
+        self.__sha.update(field)
+
+    def _get_tls_cipher(self, field):
+        """TLS-Cipher:"""
+        self.__sha.update(field)
+
+    def _get_tls_certificate(self, field):
+        """TLS-Certificate:"""
+        self.__sha.update(field)
 
     # ====================================================
     # Ignored headers (they don't contribute to the hash).
@@ -246,5 +392,14 @@ class Clue:
         """Content-type:"""
         pass
 
+    def _get_content_range(self, field):
+        """Content-range:"""
+        pass
+
+
+Clue._handlers = dict([(name[len('_get_'):], handler)
+                       for name, handler in Clue.__dict__.items()
+                       if name.startswith('_get_')])
+
 
 # vim: ts=4 sw=4 et
@@ -25,6 +25,7 @@ analysis and storage of clues.
 __all__ = [
     'Clue',
     'analysis',
+    'store',
     'file'
 ]
 
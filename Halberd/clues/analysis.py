@@ -23,6 +23,7 @@
 import copy
 
 import Halberd.logger
+from Halberd.clues.store import ClueStore
 
 
 logger = Halberd.logger.getLogger()
@@ -88,23 +89,18 @@ def ignore_changing_fields(clues):
 
     different = diff_fields(clues)
 
-    # First alter Clue to be able to cope with the varying fields.
-    ignored = []
+    # The varying fields are left out of the digests of these clues only: a
+    # MIME field causing trouble for the current scan might be the source of
+    # precious information for another scan (maybe running at the same time).
+    ignored = set()
     for field in different:
-        method = '_get_' + Clue.normalize(field)
-        if not hasattr(Clue, method):
+        name = Clue.normalize(field)
+        if not hasattr(Clue, '_get_' + name):
             logger.debug('ignoring %s', field)
-            ignored.append(method)
-            setattr(Clue, method, lambda s, f: None)
+            ignored.add(name)
 
     for clue in clues:
-        Clue.parse(clue, clue.headers)
-
-    for method in ignored:
-        # We want to leave the Clue class as before because a MIME field
-        # causing trouble for the current scan might be the source of precious
-        # information for another scan.
-        delattr(Clue, method)
+        Clue.parse(clue, clue.headers, ignored)
 
     return clues
 
@@ -118,7 +114,7 @@ def get_digest(clue):
     @return: The digest of a clue's parsed headers.
     @rtype: C{str}
     """
-    return clue.info['digest']
+    return clue.getDigest()
 
 def clusters(clues, step=3):
     """Finds clusters of clues.
@@ -127,15 +123,21 @@ def clusters(clues, step=3):
     between each other.
 
     @param clues: A sequence of clues to analyze
-    @type clues: C{list} or C{tuple}
+    @type clues: C{list}, C{tuple} or L{ClueStore}
 
     @param step: Maximum difference between the time differences of the
     cluster's clues.
     @type step: C{int}
 
-    @return: A sequence with merged clusters.
+    @return: A sequence with merged clusters (a L{ClueStore} per cluster when
+    given a store).
     @rtype: C{tuple}
     """
+    if isinstance(clues, ClueStore):
+        for cluster in clues.clusters(step):
+            yield cluster
+        return
+
     def iscluster(clues, num):
         """Determines if a list of clues form a cluster of the specified size.
         """
@@ -193,8 +195,11 @@ def merge(clues):
     @rtype: L{Clue}
     """
     merged = copy.copy(clues[0])
+    merged.conns = merged.conns.copy()
     for clue in clues[1:]:
         merged.incCount(clue.getCount())
+        for connid, hits in clue.conns.items():
+            merged.conns[connid] = merged.conns.get(connid, 0) + hits
     return merged
 
 def classify(seq, *classifiers):
@@ -346,7 +351,7 @@ def filter_proxies(clues, maxdelta=3):
     """Detect and merge clues pointing to a proxy cache on the remote end.
 
     @param clues: Sequence of clues to analyze
-    @type clues: C{list}
+    @type clues: C{list} or L{ClueStore}
 
     @param maxdelta: Maximum difference allowed between a clue's time
     difference and the previous one.
@@ -354,8 +359,11 @@ def filter_proxies(clues, maxdelta=3):
 
     @return: Sequence where all irrelevant clues pointing out to proxy caches
     have been filtered out.
-    @rtype: C{list}
+    @rtype: C{list} or L{ClueStore}
     """
+    if isinstance(clues, ClueStore):
+        return clues.filterProxies(maxdelta)
+
     results = []
 
     # Classify clues by remote time and digest.
@@ -372,14 +380,12 @@ def filter_proxies(clues, maxdelta=3):
 
         diffs = [c.diff for c in cur_clues]
 
-        # We find the indices of those clues which differ from the rest in
-        # more than maxdelta seconds.
-        indices = [idx for idx, delta in enumerate(deltas(diffs))
+        # We find the indices of those clues which differ from the previous
+        # one in more than maxdelta seconds (each of them starts a piece).
+        indices = [idx + 1 for idx, delta in enumerate(deltas(diffs))
                        if abs(delta) > maxdelta]
 
         for piece in slices(0, indices):
-            if cur_clues[piece] == []:
-                break
             results.append(merge(cur_clues[piece]))
 
     return results
@@ -392,12 +398,15 @@ def uniq(clues):
     clue with the aggregated number of hits.
 
     @param clues: A sequence containing the clues to analyze.
-    @type clues: C{list}
+    @type clues: C{list} or L{ClueStore}
 
     @return: Filtered sequence of clues where no clue has the same digest and
     time difference.
-    @rtype: C{list}
+    @rtype: C{list} or L{ClueStore}
     """
+    if isinstance(clues, ClueStore):
+        return clues.uniq()
+
     results = []
 
     get_diff = lambda c: c.diff
@@ -408,6 +417,34 @@ def uniq(clues):
 
     return results
 
+def balancing(clues):
+    """Tells whether the load balancer works per connection or per request.
+
+    Requires clues gathered using persistent connections. If one connection
+    was answered by more than one real server, the balancer distributes each
+    request (layer 7). If every connection stuck to the same real server even
+    though there are several of them, it distributes connections (layer 4).
+
+    @param clues: Analyzed clues (i.e. one per real server).
+    @type clues: C{list}
+
+    @return: C{'L7'}, C{'L4'} or C{None} if there's not enough evidence.
+    @rtype: C{str}
+    """
+    servers = {}
+    reused = False
+    for idx, clue in enumerate(clues):
+        for connid, hits in clue.conns.items():
+            if servers.setdefault(connid, idx) != idx:
+                return 'L7'
+            if hits > 1:
+                reused = True
+
+    if reused and len(clues) > 1:
+        return 'L4'
+
+    return None
+
 def hits(clues):
     """Compute the total number of hits in a sequence of clues.
 
@@ -423,11 +460,14 @@ def analyze(clues):
     """Draw conclusions from the clues obtained during the scanning phase.
 
     @param clues: Unprocessed clues obtained during the scanning stage.
-    @type clues: C{list}
+    @type clues: C{list} or L{ClueStore}
 
     @return: Coherent list of clues identifying real web servers.
-    @rtype: C{list}
+    @rtype: C{list} or L{ClueStore}
     """
+    if isinstance(clues, ClueStore):
+        return clues.analyze()
+
     results = []
 
     clues = uniq(clues)
@@ -25,10 +25,12 @@ Provides functionality needed to store clues on disk.
 import os
 import csv
 import types
+import socket
 import shutil
 
 import Halberd.util
 from Halberd.clues.Clue import Clue
+from Halberd.clues.store import ClueStore
 
 
 class InvalidFile(Exception):
@@ -61,6 +63,41 @@ def save(filename, clues):
     cluefp.close()
 
 
+def _read(filename):
+    """Reads clues from a file one at a time.
+
+    @raise InvalidFile: In case there's a problem while reinterpreting the
+    clues.
+    """
+    cluefp = open(filename, 'r')
+    reader = csv.reader(cluefp)
+
+    try:
+        for tup in reader:
+            try:
+                count, localtime, headers = tup
+            except ValueError:
+                raise InvalidFile, 'Cannot unpack fields'
+
+            # Recreate the current clue.
+            clue = Clue()
+            try:
+                clue._count = int(count)
+                clue._local = float(localtime)
+            except ValueError:
+                raise InvalidFile, 'Could not convert fields'
+
+            # This may be risky from a security standpoint.
+            clue.headers = eval(headers, {}, {})
+            if not (isinstance(clue.headers, types.ListType) or
+                    isinstance(clue.headers, types.TupleType)):
+                raise InvalidFile, 'Wrong clue header field'
+            clue.parse(clue.headers)
+
+            yield clue
+    finally:
+        cluefp.close()
+
 def load(filename):
     """Load clues from file.
 
@@ -73,35 +110,30 @@ def load(filename):
     @raise InvalidFile: In case there's a problem while reinterpreting the
     clues.
     """
-    cluefp = open(filename, 'r')
-    reader = csv.reader(cluefp)
+    return list(_read(filename))
 
-    clues = []
-    for tup in reader:
-        try:
-            count, localtime, headers = tup
-        except ValueError:
-            raise InvalidFile, 'Cannot unpack fields'
+def loadStore(filename, store=None):
+    """Load clues from file into a columnar store.
 
-        # Recreate the current clue.
-        clue = Clue()
-        try:
-            clue._count = int(count)
-            clue._local = float(localtime)
-        except ValueError:
-            raise InvalidFile, 'Could not convert fields'
+    Clues are added to the store as they are read so big files can be loaded
+    without holding all of them as L{Clue} objects.
 
-        # This may be risky from a security standpoint.
-        clue.headers = eval(headers, {}, {})
-        if not (isinstance(clue.headers, types.ListType) or
-                isinstance(clue.headers, types.TupleType)):
-            raise InvalidFile, 'Wrong clue header field'
-        clue.parse(clue.headers)
+    @param filename: Name of the files where the clues are stored.
+    @type filename: C{str}
 
-        clues.append(clue)
+    @param store: Store where the clues are added (a new one by default).
+    @type store: L{Halberd.clues.store.ClueStore}
 
-    cluefp.close()
-    return clues
+    @return: Store holding the clues.
+    @rtype: L{Halberd.clues.store.ClueStore}
+
+    @raise InvalidFile: In case there's a problem while reinterpreting the
+    clues.
+    """
+    if store is None:
+        store = ClueStore()
+    store.extend(_read(filename))
+    return store
 
 
 class ClueDir:
@@ -116,6 +148,7 @@ class ClueDir:
         http___www_microsoft_com/207_46_134_221.clu
         http___www_microsoft_com/207_46_156_220.clu
         http___www_microsoft_com/207_46_156_252.clu
+        http___www_microsoft_com/2a01_111_f100_3000__a83e_1a85.clu
                 .
                 .
                 .
@@ -138,6 +171,23 @@ class ClueDir:
         """
         return url.translate(Halberd.util.table)
 
+    def _addrName(self, addr):
+        """Turns a network address into a file name.
+
+        IPv6 addresses can be written in several ways so they are put in
+        canonical form first (otherwise the same address could end up in
+        different files).
+        """
+        if Halberd.util.addressFamily(addr) == socket.AF_INET6:
+            try:
+                addr = socket.inet_ntop(socket.AF_INET6,
+                                        socket.inet_pton(socket.AF_INET6, addr))
+            except (socket.error, ValueError):
+                # E.g. scoped addresses (fe80::1%eth0).
+                pass
+
+        return self._sanitize(addr)
+
     def _mkdir(self, dest):
         """Creates a directory to store clues.
 
@@ -172,7 +222,7 @@ class ClueDir:
         assert url and addr
         
         urldir = self._mkdir(os.path.join(self.root, self._sanitize(url)))
-        filename = self._sanitize(addr) + os.extsep + self.ext
+        filename = self._addrName(addr) + os.extsep + self.ext
         cluefile = os.path.join(urldir, filename)
 
         Halberd.clues.file.save(cluefile, clues)
@@ -0,0 +1,676 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Columnar storage of clues.
+
+Long monitoring runs produce millions of observations. Keeping each of them
+as a L{Halberd.clues.Clue.Clue} object (and copying them around during the
+analysis) takes too much memory and time, so a L{ClueStore} keeps them in
+parallel arrays instead: hit count, local time, remote time, time difference
+and the identifiers of their digest and header set. Digests and header sets
+(along with the server information extracted from them) are only stored once
+in tables shared by all the stores derived from the same one.
+
+The analysis steps (see L{Halberd.clues.analysis}) work directly on the
+arrays:
+
+    >>> store = ClueStore(clues)
+    >>> analyzed = store.analyze().toClues()
+
+When NumPy is available they are carried out as array operations (the
+C{numpy} backend) which give the same results as the pure Python code (the
+C{python} backend) much faster on large stores.
+
+@var backends: Analysis backends available.
+@type backends: C{tuple}
+
+@var default_backend: Backend used unless told otherwise (C{numpy} if it is
+available).
+@type default_backend: C{str}
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import array
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from Halberd.clues.Clue import Clue
+
+
+__all__ = ['ClueStore']
+
+
+if numpy is None:
+    backends = ('python',)
+else:
+    backends = ('numpy', 'python')
+
+default_backend = backends[0]
+
+
+class _Table:
+    """Interned values, each one identified by its position.
+    """
+    def __init__(self):
+        self.values = []
+        self._ids = {}
+
+    def getId(self, value):
+        """Returns the identifier of a value, adding it if needed.
+        """
+        ident = self._ids.get(value)
+        if ident is None:
+            ident = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return ident
+
+
+class ClueStore:
+    """A set of clues stored by columns.
+
+    Each clue is a row. Rows hold parsed clues only (i.e. their time
+    difference and digest are known).
+
+    @ivar counts: Number of times each clue was found.
+    @type counts: C{array.array}
+
+    @ivar local: Local time of each clue.
+    @type local: C{array.array}
+
+    @ivar remote: Remote time of each clue.
+    @type remote: C{array.array}
+
+    @ivar diffs: Time difference of each clue.
+    @type diffs: C{array.array}
+
+    @ivar digestids: Digest of each clue (as an index of L{digests}).
+    @type digestids: C{array.array}
+
+    @ivar headerids: Headers of each clue (as an index of L{headersets}).
+    @type headerids: C{array.array}
+
+    @ivar digests: Table of digests.
+    @type digests: C{list}
+
+    @ivar headersets: Table of header sets, each one along with the server
+    information found in it: (headers, server, content location, cookies,
+    date).
+    @type headersets: C{list}
+
+    @ivar conns: Connections where each clue was found (only for the rows
+    which have any).
+    @type conns: C{dict}
+
+    @ivar backend: How the analysis is carried out (see L{backends}). Stores
+    derived from this one use the same backend.
+    @type backend: C{str}
+    """
+    def __init__(self, clues=(), tables=None, backend=None):
+        """Initializes the store.
+
+        @param clues: Clues to store.
+        @type clues: C{list}
+
+        @param tables: Digest and header set tables to share with another
+        store.
+        @type tables: C{tuple}
+
+        @param backend: Analysis backend (L{default_backend} if not given).
+        @type backend: C{str}
+
+        @raise ValueError: If the backend is not available.
+        """
+        backend = backend or default_backend
+        if backend not in backends:
+            raise ValueError, 'analysis backend %s not available' % backend
+        self.backend = backend
+
+        self._tables = tables or (_Table(), _Table())
+        self.digests = self._tables[0].values
+        self.headersets = self._tables[1].values
+
+        self.clear()
+        self.extend(clues)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def clear(self):
+        """Removes all the clues.
+
+        The digest and header set tables are kept (see L{pack}).
+        """
+        self.counts = array.array('l')
+        self.local = array.array('d')
+        self.remote = array.array('d')
+        self.diffs = array.array('l')
+        self.digestids = array.array('l')
+        self.headerids = array.array('l')
+        self.conns = {}
+
+    def append(self, clue):
+        """Adds a clue.
+
+        @type clue: L{Halberd.clues.Clue.Clue}
+        """
+        digests, headersets = self._tables
+        info = clue.info
+        headerset = (tuple(clue.headers), info['server'], info['contloc'],
+                     info['cookies'], info['date'])
+
+        if clue._conns:
+            self.conns[len(self.counts)] = clue.conns.copy()
+        self.counts.append(clue.getCount())
+        self.local.append(clue._local)
+        self.remote.append(clue._remote)
+        self.diffs.append(clue.diff)
+        self.digestids.append(digests.getId(clue.getDigest()))
+        self.headerids.append(headersets.getId(headerset))
+
+    def extend(self, clues):
+        """Adds a sequence of clues.
+
+        @type clues: C{list}
+        """
+        for clue in clues:
+            self.append(clue)
+
+    def getClue(self, row):
+        """Rebuilds one of the clues.
+
+        @param row: Position of the clue in the store.
+        @type row: C{int}
+
+        @rtype: L{Halberd.clues.Clue.Clue}
+        """
+        headers, server, contloc, cookies, date = \
+            self.headersets[self.headerids[row]]
+
+        clue = Clue()
+        clue._count = self.counts[row]
+        clue._local = self.local[row]
+        clue._remote = self.remote[row]
+        clue.diff = self.diffs[row]
+        clue.headers = headers
+        if row in self.conns:
+            clue.conns = self.conns[row].copy()
+
+        info = clue.info
+        info['server'], info['contloc'] = server, contloc
+        info['cookies'], info['date'] = cookies, date
+        info['digest'] = self.digests[self.digestids[row]]
+
+        return clue
+
+    def toClues(self):
+        """Rebuilds all the clues.
+
+        @rtype: C{list}
+        """
+        return [self.getClue(row) for row in xrange(len(self))]
+
+    def pack(self, sent=(0, 0)):
+        """Describes the store with strings and tuples (e.g. to send it to
+        another process).
+
+        A store sent repeatedly (cleared in between, see L{clear}) only needs
+        to send each digest and header set once: those before the given
+        positions are left out, the receiver must have them already (see
+        L{unpack}).
+
+        @param sent: Number of digests and header sets already sent.
+        @type sent: C{tuple}
+
+        @return: The packed store and the number of digests and header sets
+        sent so far (to be passed to the next call).
+        @rtype: C{tuple}
+        """
+        ndigests, nheadersets = sent
+        packed = (tuple(self.digests[ndigests:]),
+                  tuple(self.headersets[nheadersets:]),
+                  self.counts.tostring(), self.local.tostring(),
+                  self.remote.tostring(), self.diffs.tostring(),
+                  self.digestids.tostring(), self.headerids.tostring(),
+                  self.conns)
+        return packed, (len(self.digests), len(self.headersets))
+
+    def unpack(self, packed):
+        """Adds the clues of a packed store (see L{pack}).
+
+        This store must have received every earlier packed store coming
+        from the same sender, and nothing else.
+
+        @param packed: Store packed by L{pack}.
+        @type packed: C{tuple}
+        """
+        digests, headersets, counts, local, remote, diffs, digestids, \
+            headerids, conns = packed
+
+        for table, values in zip(self._tables, (digests, headersets)):
+            for value in values:
+                table.getId(value)
+
+        offset = len(self)
+        for row, rowconns in conns.iteritems():
+            self.conns[offset + row] = rowconns
+        self.counts.fromstring(counts)
+        self.local.fromstring(local)
+        self.remote.fromstring(remote)
+        self.diffs.fromstring(diffs)
+        self.digestids.fromstring(digestids)
+        self.headerids.fromstring(headerids)
+
+    def getDigest(self, row):
+        """Returns the digest of one of the clues.
+
+        @rtype: C{str}
+        """
+        return self.digests[self.digestids[row]]
+
+    def _derive(self):
+        """Creates an empty store sharing the tables and backend of this one.
+
+        @rtype: L{ClueStore}
+        """
+        return ClueStore(tables=self._tables, backend=self.backend)
+
+    def _merge(self, groups):
+        """Builds a new store merging each group of rows into a single one.
+
+        The first row of each group is kept (with the hits and connections
+        of the whole group), just like L{Halberd.clues.analysis.merge} does.
+
+        @param groups: Sequence of lists of rows.
+        @type groups: C{list}
+
+        @rtype: L{ClueStore}
+        """
+        merged = self._derive()
+        for rows in groups:
+            first = rows[0]
+            if len(rows) == 1:
+                count = self.counts[first]
+            else:
+                count = sum([self.counts[row] for row in rows])
+
+            conns = None
+            for row in rows:
+                if row in self.conns:
+                    if conns is None:
+                        conns = {}
+                    for connid, hits in self.conns[row].iteritems():
+                        conns[connid] = conns.get(connid, 0) + hits
+            if conns:
+                merged.conns[len(merged.counts)] = conns
+
+            merged.counts.append(count)
+            merged.local.append(self.local[first])
+            merged.remote.append(self.remote[first])
+            merged.diffs.append(self.diffs[first])
+            merged.digestids.append(self.digestids[first])
+            merged.headerids.append(self.headerids[first])
+
+        return merged
+
+    def _group(self, *columns):
+        """Groups rows by the values of some columns.
+
+        @return: Lists of rows in order of first appearance.
+        @rtype: C{list}
+        """
+        groups = {}
+        ordered = []
+        for row, key in enumerate(itertools.izip(*columns)):
+            rows = groups.get(key)
+            if rows is None:
+                rows = groups[key] = []
+                ordered.append(rows)
+            rows.append(row)
+        return ordered
+
+    def _sortByDiff(self, rows):
+        """Sorts rows according to their time difference.
+        """
+        return sorted(rows, key=self.diffs.__getitem__)
+
+    def uniq(self):
+        """Merges the clues having the same time difference and digest.
+
+        See L{Halberd.clues.analysis.uniq}.
+
+        @rtype: L{ClueStore}
+        """
+        if self.backend == 'numpy' and len(self):
+            return _uniq(self)
+        return self._merge(self._group(self.digestids, self.diffs))
+
+    def filterProxies(self, maxdelta=3):
+        """Detects and merges clues pointing to a proxy cache.
+
+        See L{Halberd.clues.analysis.filter_proxies}.
+
+        @param maxdelta: Maximum difference allowed between a clue's time
+        difference and the previous one.
+        @type maxdelta: C{int}
+
+        @rtype: L{ClueStore}
+        """
+        if self.backend == 'numpy' and len(self):
+            return _filterProxies(self, maxdelta)
+
+        diffs = self.diffs
+        pieces = []
+        for rows in self._group(self.remote, self.digestids):
+            if len(rows) == 1:
+                pieces.append(rows)
+                continue
+
+            rows = self._sortByDiff(rows)
+            piece = [rows[0]]
+            for prev, row in zip(rows, rows[1:]):
+                if abs(diffs[row] - diffs[prev]) > maxdelta:
+                    pieces.append(piece)
+                    piece = []
+                piece.append(row)
+            pieces.append(piece)
+
+        return self._merge(pieces)
+
+    def _clusters(self, rows, step):
+        """Splits rows into clusters.
+
+        See L{Halberd.clues.analysis.clusters}.
+
+        @return: Lists of rows.
+        @rtype: C{list}
+        """
+        rows = self._sortByDiff(rows)
+
+        found = []
+        start = 0
+        for size in _sweep([self.diffs[row] for row in rows], step):
+            found.append(rows[start:start + size])
+            start += size
+
+        return found
+
+    def clusters(self, step=3):
+        """Finds clusters of clues.
+
+        See L{Halberd.clues.analysis.clusters}.
+
+        @param step: Maximum number of clues in a cluster.
+        @type step: C{int}
+
+        @return: A store per cluster.
+        @rtype: C{list}
+        """
+        if self.backend == 'numpy' and len(self):
+            return _clusters(self, step)
+        return [self._merge([[row] for row in rows])
+                for rows in self._clusters(range(len(self)), step)]
+
+    def analyze(self):
+        """Draws conclusions from the clues.
+
+        See L{Halberd.clues.analysis.analyze}.
+
+        @return: A clue per real server.
+        @rtype: L{ClueStore}
+        """
+        store = self.uniq().filterProxies()
+        if store.backend == 'numpy' and len(store):
+            return _analyze(store)
+
+        clusters = []
+        for rows in store._group(store.digestids):
+            clusters.extend(store._clusters(rows, 3))
+
+        return store._merge(clusters)
+
+
+def _sweep(diffs, step):
+    """Splits a sorted sequence of time differences into clusters.
+
+    See L{Halberd.clues.analysis.clusters}.
+
+    @param diffs: Time differences in ascending order.
+    @type diffs: C{list}
+
+    @return: Size of each cluster.
+    @rtype: C{list}
+    """
+    sizes = []
+    start = 0
+    while start < len(diffs):
+        for num in xrange(step, 0, -1):
+            end = start + num
+            if end <= len(diffs) and abs(diffs[start] - diffs[end - 1]) <= num:
+                sizes.append(num)
+                start = end
+                break
+    return sizes
+
+
+# NumPy backend.
+#
+# Rows are sorted (with stable sorts) so the rows of every group end up
+# together, in the same order the python backend uses. Each run of rows (or
+# each piece of it) then becomes a row of the resulting store, and those are
+# put in the order the python backend would have produced them: groups by
+# first appearance (see _build).
+
+def _column(values):
+    """Views a column of a store as a NumPy array (without copying it).
+    """
+    return numpy.frombuffer(values, dtype=values.typecode)
+
+def _key(*columns):
+    """Combines several columns into a single integer key.
+
+    Rows get the same key if and only if they have the same values in all
+    the columns.
+
+    @rtype: C{numpy.ndarray}
+    """
+    key = numpy.zeros(len(columns[0]), dtype=numpy.int64)
+    size = 1
+    for values in columns:
+        num = len(values) + 1
+        if values.dtype.kind in 'iu':
+            low = int(values.min())
+            num = int(values.max()) - low + 1
+            codes = values.astype(numpy.int64) - low
+        if num > len(values):
+            # Floats or integers spread over a wide range.
+            uniq, codes = numpy.unique(values, return_inverse=True)
+            num, codes = len(uniq), codes.ravel()
+
+        if size * num >= 2 ** 62:
+            uniq, key = numpy.unique(key, return_inverse=True)
+            size, key = len(uniq), key.ravel().astype(numpy.int64)
+
+        key = key * num + codes
+        size *= num
+
+    return key
+
+def _runs(values):
+    """Finds where each run of equal values starts.
+
+    @rtype: C{numpy.ndarray}
+    """
+    return numpy.flatnonzero(numpy.concatenate(([True],
+                                                values[1:] != values[:-1])))
+
+def _groups(store, key, bydiff):
+    """Sorts the rows of a store by group.
+
+    @param key: Group of each row (see L{_key}).
+    @type key: C{numpy.ndarray}
+
+    @param bydiff: Whether rows are sorted by time difference within each
+    group (otherwise they keep their order).
+    @type bydiff: C{bool}
+
+    @return: Rows in order, position where each group starts and rank of
+    each group by first appearance.
+    @rtype: C{tuple}
+    """
+    if bydiff:
+        order = numpy.lexsort((_column(store.diffs), key))
+    else:
+        order = numpy.argsort(key, kind='mergesort')
+    starts = _runs(key[order])
+
+    first = numpy.minimum.reduceat(order, starts)
+    rank = numpy.empty(len(starts), dtype=numpy.intp)
+    rank[numpy.argsort(first)] = numpy.arange(len(starts))
+
+    return order, starts, rank
+
+def _pieceOrder(order, groupstarts, rank, starts):
+    """Orders runs which are pieces of groups by group rank.
+
+    @param starts: Position where each piece starts.
+    @type starts: C{numpy.ndarray}
+
+    @rtype: C{numpy.ndarray}
+    """
+    marks = numpy.zeros(len(order), dtype=numpy.intp)
+    marks[groupstarts[1:]] = 1
+    groups = numpy.cumsum(marks)[starts]
+    return numpy.argsort(rank[groups], kind='mergesort')
+
+def _build(store, order, starts, runorder=None):
+    """Builds a new store merging runs of rows.
+
+    @param order: Rows of the store.
+    @type order: C{numpy.ndarray}
+
+    @param starts: Position in C{order} where each run starts. The first
+    row of every run is kept along with the hits and connections of the
+    whole run.
+    @type starts: C{numpy.ndarray}
+
+    @param runorder: Order of the runs in the new store (as found in
+    C{order} by default).
+    @type runorder: C{numpy.ndarray}
+
+    @rtype: L{ClueStore}
+    """
+    if runorder is None:
+        runorder = numpy.arange(len(starts))
+
+    merged = store._derive()
+
+    first = order[starts][runorder]
+    for name in ('local', 'remote', 'diffs', 'digestids', 'headerids'):
+        values = getattr(store, name)
+        getattr(merged, name).fromstring(
+            _column(values)[first].astype(values.typecode).tobytes())
+
+    counts = numpy.add.reduceat(_column(store.counts)[order], starts)[runorder]
+    merged.counts.fromstring(counts.astype(store.counts.typecode).tobytes())
+
+    if store.conns:
+        # Position of each row in the new store.
+        marks = numpy.zeros(len(order), dtype=numpy.intp)
+        marks[starts[1:]] = 1
+        newpos = numpy.empty(len(starts), dtype=numpy.intp)
+        newpos[runorder] = numpy.arange(len(starts))
+        position = numpy.full(len(store), -1, dtype=numpy.intp)
+        position[order] = newpos[numpy.cumsum(marks)]
+
+        for row, conns in sorted(store.conns.iteritems()):
+            pos = int(position[row])
+            if pos < 0:
+                continue
+            target = merged.conns.setdefault(pos, {})
+            for connid, hits in conns.iteritems():
+                target[connid] = target.get(connid, 0) + hits
+
+    return merged
+
+def _uniq(store):
+    """See L{ClueStore.uniq}.
+    """
+    key = _key(_column(store.digestids), _column(store.diffs))
+    order, starts, rank = _groups(store, key, False)
+    return _build(store, order, starts, numpy.argsort(rank))
+
+def _filterProxies(store, maxdelta):
+    """See L{ClueStore.filterProxies}.
+    """
+    key = _key(_column(store.remote), _column(store.digestids))
+    order, groupstarts, rank = _groups(store, key, True)
+
+    diffs = _column(store.diffs)[order].astype(numpy.int64)
+    cuts = numpy.abs(numpy.diff(diffs)) > maxdelta
+    cuts[groupstarts[1:] - 1] = True
+    starts = numpy.flatnonzero(numpy.concatenate(([True], cuts)))
+
+    return _build(store, order, starts,
+                  _pieceOrder(order, groupstarts, rank, starts))
+
+def _clusterStarts(diffs, groupstarts, step):
+    """Finds the clusters within each group of sorted rows.
+
+    @return: Position where each cluster starts.
+    @rtype: C{numpy.ndarray}
+    """
+    diffs = diffs.tolist()
+    bounds = groupstarts.tolist() + [len(diffs)]
+
+    found = []
+    for start, end in zip(bounds, bounds[1:]):
+        for size in _sweep(diffs[start:end], step):
+            found.append(start)
+            start += size
+
+    return numpy.array(found, dtype=numpy.intp)
+
+def _clusters(store, step):
+    """See L{ClueStore.clusters}.
+    """
+    order = numpy.argsort(_column(store.diffs), kind='mergesort')
+    found = _clusterStarts(_column(store.diffs)[order], numpy.array([0]), step)
+    bounds = found.tolist() + [len(order)]
+
+    return [_build(store, order[start:end], numpy.arange(end - start))
+            for start, end in zip(bounds, bounds[1:])]
+
+def _analyze(store):
+    """Finds the clusters of every digest of an already filtered store.
+
+    See L{ClueStore.analyze}.
+    """
+    key = _key(_column(store.digestids))
+    order, groupstarts, rank = _groups(store, key, True)
+
+    starts = _clusterStarts(_column(store.diffs)[order], groupstarts, 3)
+
+    return _build(store, order, starts,
+                  _pieceOrder(order, groupstarts, rank, starts))
+
+
+# vim: ts=4 sw=4 et
@@ -41,6 +41,20 @@ of what they do:
 
     - Scanner: Performs a load-balancer scan from the current machine.
 
+Alternatively, an L{AsyncCrew} can be used. Instead of spawning a thread per
+in-flight request it multiplexes many non-blocking connections from the main
+thread, which allows for much higher degrees of parallelism. Use
+L{crewFactory} to obtain the kind of crew requested by a L{ScanTask}.
+
+When parsing and hashing replies keeps a single CPU busy, a L{ProcessCrew}
+spreads the scanners over several processes. Each of them merges its own
+clues and periodically sends them to the parent, which merges them again.
+
+Hosts resolving to several addresses can be scanned at once with a
+L{MultiCrew}: it drives one crew per address, each with its own L{ScanState},
+so a failure in one of them (e.g. an unreachable address) doesn't stop the
+others.
+
 The following is a diagram showing the way it works::
 
                                      .--> Manager --.
@@ -75,23 +89,60 @@ import sys
 import time
 import math
 import copy
+import Queue
+import errno
+import select
 import signal
 import threading
+import multiprocessing
 
+import Halberd.pacer
+import Halberd.tracer
+import Halberd.metrics
 import Halberd.logger
 import Halberd.clues.Clue
+import Halberd.clues.store
 import Halberd.clientlib as clientlib
 
 
-__all__ = ['WorkCrew']
+__all__ = ['WorkCrew', 'AsyncCrew', 'ProcessCrew', 'MultiCrew', 'crewFactory']
 
 
 class ScanState:
     """Shared state among scanner threads.
 
+    Clues are indexed by their time difference and digest (the same fields
+    compared by C{Clue.__eq__}) so merging a new one takes constant time no
+    matter how many different clues there are. Scanners usually accumulate
+    clues in a L{ClueBuffer} and insert them in batches.
+
     @ivar shouldstop: Signals when the threads should stop scanning.
     @type shouldstop: C{threading.Event}
 
+    @ivar changed: Set whenever new results come in or an error happens (so
+    the L{Manager} doesn't need to poll).
+    @type changed: C{threading.Event}
+
+    @ivar pipelining: Whether requests should still be pipelined (it's
+    disabled as soon as the target is found not to support it).
+    @type pipelining: C{bool}
+
+    @ivar pacer: Limits the rate at which requests are sent (C{None} if
+    there are no limits).
+    @type pacer: L{Halberd.pacer.Pacer}
+
+    @ivar tuner: Decides how many requests can be in flight (C{None} if the
+    amount of parallelism is fixed).
+    @type tuner: L{Tuner}
+
+    @ivar metrics: Accounts for latencies, traffic and errors (C{None} unless
+    metrics were requested).
+    @type metrics: L{Halberd.metrics.TargetMetrics}
+
+    @ivar probe: Probing strategy chosen for the whole scan (C{None} until
+    it's known).
+    @type probe: C{str}
+
     caught with an exception).
     """
     def __init__(self):
@@ -99,41 +150,103 @@ class ScanState:
         """
         self.__mutex = threading.Lock()
         self.shouldstop = threading.Event()
+        self.changed = threading.Event()
         self.__error = None
+        self.__reason = None
+        # Clues indexed by (diff, digest) and in order of arrival.
+        self.__index = {}
         self.__clues = []
 
         self.__missed = 0
         self.__replies = 0
+        self.__refused = 0
+
+        self.pipelining = True
+        self.__batches = 0
+        self.__pipelined = 0
+
+        self.pacer = None
+        self.tuner = None
+        self.metrics = None
+        self.probe = None
+
+        self.__handshakes = 0
 
     def getStats(self):
         """Provides statistics about the scanning process.
 
+        The counters are read without taking the lock (reading an integer is
+        atomic), so this never makes the scanners wait. The figures may be
+        slightly out of sync with each other.
+
         @return: Number of clues gathered so far, number of successful requests
         and number of unsuccessful ones (missed replies).
         @rtype: C{tuple}
         """
-        # xxx - I badly need read/write locks.
-        self.__mutex.acquire()
-        nclues = len(self.__clues)
-        replies = self.__replies
-        missed = self.__missed
-        self.__mutex.release()
-
-        return (nclues, replies, missed)
+        return (len(self.__clues), self.__replies, self.__missed)
 
     def insertClue(self, clue):
         """Inserts a clue in the list if it is new.
         """
+        self.insertClues([clue])
+
+    def insertClues(self, clues, counted=False):
+        """Inserts a batch of clues, merging those already known.
+
+        @param clues: Clues to insert. They must not be used by the caller
+        afterwards.
+        @type clues: C{list}
+
+        @param counted: Whether the replies the clues come from have already
+        been accounted for (see L{addReplies}).
+        @type counted: C{bool}
+        """
         self.__mutex.acquire()
+        for clue in clues:
+            if not counted:
+                self.__replies += clue.getCount()
+            key = clueKey(clue)
+            known = self.__index.get(key)
+            if known is None:
+                self.__index[key] = clue
+                self.__clues.append(clue)
+            else:
+                mergeClue(known, clue)
+        self.__mutex.release()
+
+        self.changed.set()
+
+    def storeClues(self, store, start=0):
+        """Copies the clues gathered so far into a clue store.
+
+        The copy is made under the lock, so the clues can't be merged with
+        new ones halfway.
+
+        @param store: Where to copy the clues.
+        @type store: L{Halberd.clues.store.ClueStore}
 
-        count = clue.getCount()
-        self.__replies += count
+        @param start: Number of clues (in order of arrival) to skip because
+        the store already has them.
+        @type start: C{int}
+        """
+        self.__mutex.acquire()
         try:
-            idx = self.__clues.index(clue)
-            self.__clues[idx].incCount(count)
-        except ValueError:
-            self.__clues.append(clue)
+            store.extend(self.__clues[start:])
+        finally:
+            self.__mutex.release()
+
+    def addReplies(self, num):
+        """Accounts for replies whose clues will be inserted later.
 
+        Missed replies are accounted for right away, so successful ones must
+        be too or the miss ratio seen by the L{Tuner} would be skewed while
+        their clues are buffered.
+
+        @param num: Number of replies.
+        @type num: C{int}
+        """
+        self.__mutex.acquire()
+        self.__replies += num
         self.__mutex.release()
 
     def getClues(self):
@@ -148,13 +261,122 @@ class ScanState:
 
         return clues
 
-    def incMissed(self):
+    def addBatch(self, replies):
+        """Account for a batch of pipelined requests.
+
+        @param replies: Number of replies obtained in the batch.
+        @type replies: C{int}
+        """
+        self.__mutex.acquire()
+        self.__batches += 1
+        self.__pipelined += replies
+        self.__mutex.release()
+
+    def getPipelineStats(self):
+        """Provides statistics about pipelining.
+
+        @return: Number of batches of pipelined requests sent and total number
+        of replies obtained from them.
+        @rtype: C{tuple}
+        """
+        self.__mutex.acquire()
+        stats = (self.__batches, self.__pipelined)
+        self.__mutex.release()
+
+        return stats
+
+    def addHandshake(self):
+        """Account for a TLS handshake.
+        """
+        self.__mutex.acquire()
+        self.__handshakes += 1
+        self.__mutex.release()
+
+    def getHandshakes(self):
+        """Number of TLS handshakes performed.
+
+        @rtype: C{int}
+        """
+        self.__mutex.acquire()
+        handshakes = self.__handshakes
+        self.__mutex.release()
+
+        return handshakes
+
+    def disablePipelining(self):
+        """Stop pipelining requests.
+
+        @return: True if pipelining was enabled until now.
+        @rtype: C{bool}
+        """
+        self.__mutex.acquire()
+        enabled = self.pipelining
+        self.pipelining = False
+        self.__mutex.release()
+
+        return enabled
+
+    def incMissed(self, num=1):
         """Increase the counter of missed replies.
         """
         self.__mutex.acquire()
-        self.__missed += 1
+        self.__missed += num
+        self.__mutex.release()
+
+        self.changed.set()
+
+    def waitForChange(self, timeout):
+        """Waits until something happens or a timeout expires.
+
+        @param timeout: Maximum time to wait (in seconds).
+        @type timeout: C{float}
+
+        @return: True if there are new results or an error happened.
+        @rtype: C{bool}
+        """
+        self.changed.wait(timeout)
+        changed = self.changed.isSet()
+        self.changed.clear()
+
+        return changed
+
+    def drain(self):
+        """Takes away the clues gathered so far.
+
+        @return: Clues obtained and number of missed replies since the last
+        call.
+        @rtype: C{tuple}
+        """
+        self.__mutex.acquire()
+        clues, self.__clues = self.__clues, []
+        self.__index = {}
+        missed, self.__missed = self.__missed, 0
+        self.__replies = 0
+        self.__mutex.release()
+
+        return clues, missed
+
+    def incRefused(self):
+        """Increase the counter of refused connections.
+        """
+        self.__mutex.acquire()
+        self.__refused += 1
+        self.__mutex.release()
+
+    def getRefused(self):
+        """Number of connections refused by the target.
+
+        Refusals are only tolerated (instead of being treated as fatal errors)
+        while tuning the amount of parallelism.
+
+        @rtype: C{int}
+        """
+        self.__mutex.acquire()
+        refused = self.__refused
         self.__mutex.release()
 
+        return refused
+
     def setError(self, err):
         """Signal an error condition.
         """
@@ -167,6 +389,34 @@ class ScanState:
         self.shouldstop.set()
         self.__mutex.release()
 
+        self.changed.set()
+
+    def setStopReason(self, reason):
+        """Records why the scan stopped (only the first reason counts).
+
+        @param reason: Human-readable explanation.
+        @type reason: C{str}
+        """
+        self.__mutex.acquire()
+        if self.__reason is None and self.__error is None:
+            self.__reason = reason
+        self.__mutex.release()
+
+    def getStopReason(self):
+        """Tells why the scan stopped.
+
+        @return: Explanation (the error message if there was an error).
+        @rtype: C{str}
+        """
+        self.__mutex.acquire()
+        if self.__error is not None:
+            reason = str(self.__error)
+        else:
+            reason = self.__reason or ''
+        self.__mutex.release()
+
+        return reason
+
     def getError(self):
         """Returns the reason of the error condition.
         """
@@ -180,6 +430,243 @@ class ScanState:
         return err
 
 
+def clueKey(clue):
+    """Key identifying equal clues (see C{Clue.__eq__}).
+
+    @rtype: C{tuple}
+    """
+    return (clue.diff, clue.getDigest())
+
+def mergeClue(clue, other):
+    """Adds the hits (and connections) of a clue to an equal one.
+
+    @param clue: Clue to be updated.
+    @type clue: C{Clue}
+
+    @param other: Clue equal to the first one.
+    @type other: C{Clue}
+    """
+    clue.incCount(other.getCount())
+    conns = clue.conns
+    for connid, hits in other.conns.iteritems():
+        conns[connid] = conns.get(connid, 0) + hits
+
+
+class ClueBuffer:
+    """Accumulates the clues found by a single scanner.
+
+    Clues are merged locally (without locking) and handed over to the shared
+    L{ScanState} in batches, either when L{size} different clues have been
+    buffered or L{interval} seconds after the last batch. The replies they
+    come from are accounted for at once, though.
+    """
+    size = 64
+    interval = 0.25
+
+    def __init__(self, state):
+        self.state = state
+        self._index = {}
+        self._clues = []
+        self._next = time.time() + self.interval
+
+    def add(self, clue):
+        """Buffers a clue (flushing the buffer if it's time to).
+        """
+        self.state.addReplies(clue.getCount())
+
+        key = clueKey(clue)
+        known = self._index.get(key)
+        if known is None:
+            self._index[key] = clue
+            self._clues.append(clue)
+        else:
+            mergeClue(known, clue)
+
+        if len(self._clues) >= self.size or time.time() >= self._next:
+            self.flush()
+
+    def flush(self):
+        """Inserts the buffered clues in the shared state.
+        """
+        if self._clues:
+            started = time.time()
+            self.state.insertClues(self._clues, True)
+
+            tracer = Halberd.tracer.active
+            if tracer:
+                tracer.addSpan('clue insert', started, time.time(),
+                               clues=len(self._clues))
+
+            self._index = {}
+            self._clues = []
+        self._next = time.time() + self.interval
+
+
+class ConvergenceRule:
+    """Decides when a scan has found all the real servers it is going to.
+
+    The clues obtained so far are analyzed every now and then and a scan is
+    considered to have converged once the number of real servers hasn't
+    changed for L{window} seconds. Scans are never stopped before getting
+    L{minsamples} replies and spending L{mintime} seconds.
+
+    Only the clues which arrived since the last check are copied (into a
+    L{Halberd.clues.store.ClueStore}), and the columnar analysis of the
+    store doesn't touch the live clues.
+
+    @ivar reason: Explanation of the decision to stop.
+    @type reason: C{str}
+    """
+    # Minimum time (in seconds) between analyses.
+    period = 0.5
+
+    def __init__(self, window, minsamples, mintime):
+        self.window = window
+        self.minsamples = minsamples
+        self.mintime = mintime
+        self.reason = ''
+
+        self._started = self._lastnew = time.time()
+        self._next = 0
+        self._store = Halberd.clues.store.ClueStore()
+        self._servers = 0
+
+    def hasConverged(self, state, now=None):
+        """Checks whether the scan can be stopped.
+
+        @param state: State of the scan.
+        @type state: L{ScanState}
+
+        @rtype: C{bool}
+        """
+        if now is None:
+            now = time.time()
+
+        nclues, replies, missed = state.getStats()
+        if nclues != len(self._store) and now >= self._next:
+            self._next = now + self.period
+            state.storeClues(self._store, len(self._store))
+            servers = len(self._store.analyze())
+            if servers != self._servers:
+                self._servers = servers
+                self._lastnew = now
+
+        if replies < self.minsamples or now - self._started < self.mintime:
+            return False
+        if now - self._lastnew < self.window:
+            return False
+
+        self.reason = 'converged after %.1f seconds (no new real servers ' \
+                      'for %.1f seconds)' % (now - self._started, self.window)
+        return True
+
+
+class Tuner:
+    """Tunes the number of requests in flight during a scan.
+
+    The limit follows an additive-increase/multiplicative-decrease policy:
+    it grows by one after every period in which less than L{max_missratio}
+    of the requests were missed or refused and the latency (as smoothed by
+    the target's L{clientlib.RTTEstimator}) stayed within L{max_latency}
+    times the best one seen (increases below L{latency_slack} seconds are
+    considered noise). It is held while latency is high and halved when too
+    many requests are lost.
+
+    @ivar limit: Current number of requests allowed in flight.
+    @type limit: C{int}
+
+    @ivar trajectory: Sequence of (elapsed seconds, limit) tuples recorded
+    every time the limit changes.
+    @type trajectory: C{list}
+    """
+    # Minimum time (in seconds) between adjustments.
+    period = 0.25
+    max_missratio = 0.05
+    max_latency = 2.0
+    latency_slack = 0.01
+
+    def __init__(self, state, estimator, initial, ceiling):
+        self.state = state
+        self.estimator = estimator
+        self.ceiling = max(ceiling, 1)
+        self.limit = min(max(initial, 1), self.ceiling)
+
+        self.__cond = threading.Condition()
+
+        self._started = time.time()
+        self._next = self._started + self.period
+        self._answered = 0
+        self._failed = 0
+        self._bestrtt = None
+
+        self.trajectory = [(0.0, self.limit)]
+
+    def update(self, now=None):
+        """Adjusts the limit according to what happened since the last call.
+
+        @return: The new limit.
+        @rtype: C{int}
+        """
+        if now is None:
+            now = time.time()
+        if now < self._next:
+            return self.limit
+
+        nclues, replies, missed = self.state.getStats()
+        failed = missed + self.state.getRefused()
+        answered = replies - self._answered
+        lost = failed - self._failed
+        if answered + lost < self.limit:
+            # Not enough samples yet.
+            return self.limit
+        self._answered, self._failed = replies, failed
+        self._next = now + self.period
+
+        rtt = self.estimator.srtt
+        if rtt is not None and (self._bestrtt is None or rtt < self._bestrtt):
+            self._bestrtt = rtt
+
+        if lost > self.max_missratio * (answered + lost):
+            limit = max(self.limit // 2, 1)
+        elif rtt is not None and rtt > max(self.max_latency * self._bestrtt,
+                                           self._bestrtt + self.latency_slack):
+            limit = self.limit
+        else:
+            limit = min(self.limit + 1, self.ceiling)
+
+        if limit != self.limit:
+            self.__cond.acquire()
+            self.limit = limit
+            self.__cond.notifyAll()
+            self.__cond.release()
+            self.trajectory.append((now - self._started, limit))
+
+        return limit
+
+    def admit(self, index):
+        """Blocks a scanner while it exceeds the limit.
+
+        @param index: Position of the scanner in the crew (starting at 0).
+        @type index: C{int}
+
+        @return: False if the scan was stopped while waiting.
+        @rtype: C{bool}
+        """
+        self.__cond.acquire()
+        while index >= self.limit and not self.state.shouldstop.isSet():
+            self.__cond.wait()
+        self.__cond.release()
+
+        return not self.state.shouldstop.isSet()
+
+    def release(self):
+        """Wakes up every waiting scanner (once the scan is over).
+        """
+        self.__cond.acquire()
+        self.__cond.notifyAll()
+        self.__cond.release()
+
+
 class WorkCrew:
     """Pool of scanners working in parallel.
 
@@ -189,6 +676,10 @@ class WorkCrew:
     @ivar working: Indicates whether the crew is working or idle.
     @type working: C{bool}
 
+    @ivar standalone: Whether the crew handles SIGINT and reports how the
+    scan ended by itself (it doesn't when driven by a L{MultiCrew}).
+    @type standalone: C{bool}
+
     @ivar prev: Previous SIGINT handler.
     """
     def __init__(self, scantask):
@@ -197,13 +688,32 @@ class WorkCrew:
 
         self.state = ScanState()
 
+        pacer = Halberd.pacer.Pacer(scantask.rate, scantask.bandwidth,
+                                    scantask.jitter)
+        if pacer.isActive():
+            self.state.pacer = pacer
+
+        if scantask.metrics:
+            registry = Halberd.metrics.getRegistry()
+            self.state.metrics = registry.getTarget(scantask.url, scantask.addr)
+
+        if scantask.autoparallelism:
+            self.state.tuner = Tuner(self.state,
+                                     clientlib.getEstimator(scantask.addr),
+                                     scantask.parallelism,
+                                     scantask.max_parallelism)
+
         self.working = False
+        self.standalone = True
 
         self.prev = None
         
     def _setupSigHandler(self):
         """Performs what's needed to catch SIGINT.
         """
+        if not self.standalone:
+            return
+
         def interrupt(signum, frame):
             """SIGINT handler
             """
@@ -214,13 +724,34 @@ class WorkCrew:
     def _restoreSigHandler(self):
         """Restore previous SIGINT handler.
         """
-        signal.signal(signal.SIGINT, self.prev)
+        if self.standalone:
+            signal.signal(signal.SIGINT, self.prev)
+
+    def _selectProbe(self):
+        """Chooses the probing strategy (see L{clientlib.selectProbe}).
+
+        @return: Probing strategy.
+        @rtype: C{str}
+        """
+        probe = clientlib.selectProbe(self.task)
+        if self.task.probe == 'auto':
+            logger = Halberd.logger.getLogger()
+            logger.info('probing %s using %s requests', self.task.addr, probe)
+
+        return probe
 
     def _initLocal(self):
         """Initializes conventional (local) scanner threads.
+
+        When tuning the amount of parallelism there are as many scanners as
+        the upper bound allows but only L{Tuner.limit} of them work at a time.
         """
-        for i in xrange(self.task.parallelism):
-            worker = Scanner(self.state, self.task)
+        if self.state.tuner:
+            num = self.state.tuner.ceiling
+        else:
+            num = self.task.parallelism
+        for i in xrange(num):
+            worker = Scanner(self.state, self.task, i)
             self.workers.append(worker)
 
     def scan(self):
@@ -229,6 +760,8 @@ class WorkCrew:
         self.working = True
         self._setupSigHandler()
 
+        # Find out the probing strategy once, before the scanners need it.
+        self.state.probe = self._selectProbe()
         self._initLocal()
 
         for worker in self.workers:
@@ -239,21 +772,55 @@ class WorkCrew:
         manager = Manager(self.state, self.task)
         manager.run()
 
+        if self.state.tuner:
+            self.state.tuner.release()
         for worker in self.workers:
             worker.join()
 
-        # Display status information for the last time.
+        if self.standalone:
+            # Display status information for the last time.
+            self.showSummary(manager)
+
+        self._finish()
+
+        return self._getClues()
+
+    def showSummary(self, manager):
+        """Displays the final statistics of the scan.
+
+        @param manager: Manager of the scan.
+        @type manager: L{Manager}
+        """
         manager.showStats()
-        sys.stdout.write('\n\n')
+        manager.showPipelineStats()
+        manager.showHandshakeStats()
+        manager.showPacingStats()
+        manager.showConcurrencyStats()
 
+    def _finish(self):
+        """Restores the SIGINT handler and tells whether the scan failed.
+        """
         self._restoreSigHandler()
         self.working = False
 
+        if not self.standalone:
+            return
+
+        sys.stdout.write('\n\n')
         err = self.state.getError()
         if err is not None:
             sys.stderr.write('*** finished (%s) ***\n\n' % err)
 
-        return self._getClues()
+    def getTrajectory(self):
+        """Returns the evolution of the number of requests in flight.
+
+        @return: Sequence of (elapsed seconds, parallel requests) tuples
+        (empty if the amount of parallelism was fixed).
+        @rtype: C{list}
+        """
+        if self.state.tuner:
+            return self.state.tuner.trajectory[:]
+        return []
 
     def _getClues(self):
         """Returns a sequence of clues obtained during the scan.
@@ -263,6 +830,614 @@ class WorkCrew:
         return self.state.getClues()
 
 
+class AsyncCrew(WorkCrew):
+    """Scans the target multiplexing non-blocking connections in one thread.
+
+    The crew keeps up to C{task.parallelism} requests in flight at the same
+    time, all of them driven by an event loop running in the main thread (so
+    signals are still correctly caught). Every request uses a connection of
+    its own: HTTPS, keep-alive connections and pipelining are left to the
+    other engines (see L{crewFactory}).
+    """
+    def scan(self):
+        """Perform a parallel load-balancer scan.
+        """
+        self.working = True
+        self._setupSigHandler()
+
+        manager = Manager(self.state, self.task)
+        manager.setTimeout(self.task.scantime)
+
+        self._loop(manager)
+
+        if self.standalone:
+            # Display status information for the last time.
+            self.showSummary(manager)
+
+        self._finish()
+
+        return self._getClues()
+
+    def showSummary(self, manager):
+        """Displays the final statistics of the scan.
+
+        @param manager: Manager of the scan.
+        @type manager: L{Manager}
+        """
+        manager.showStats()
+        manager.showPacingStats()
+        manager.showConcurrencyStats()
+
+    def _loop(self, manager):
+        """Event loop driving all the in-flight requests.
+
+        @param manager: Takes care of expiring the scan and showing stats.
+        @type manager: L{Manager}
+        """
+        fatal_exceptions = (
+            clientlib.ConnectionRefused,
+            clientlib.UnknownReply,
+        )
+
+        poller = _Poller()
+        clients = {}
+        nextstats = 0
+        pacer = self.state.pacer
+        tuner = self.state.tuner
+        metrics = self.state.metrics
+
+        probe = self._selectProbe()
+        estimator = clientlib.getEstimator(self.task.addr)
+
+        while not self.state.shouldstop.isSet():
+            if tuner:
+                parallelism = tuner.update()
+            else:
+                parallelism = self.task.parallelism
+
+            timeout = manager.refresh_interval
+            try:
+                while len(clients) < parallelism:
+                    if pacer:
+                        wait = pacer.delay()
+                        if wait > 0:
+                            timeout = min(timeout, wait)
+                            break
+                        pacer.reserve()
+                    client = clientlib.AsyncHTTPClient()
+                    client.probe = probe
+                    client.estimator = estimator
+                    client.start(self.task.addr, self.task.url)
+                    clients[client.fileno()] = client
+                    poller.register(client.fileno(), True)
+            except fatal_exceptions, msg:
+                self.state.setError(msg)
+                break
+
+            for fd, readable, writable in poller.poll(timeout):
+                client = clients.get(fd)
+                if client is None:
+                    continue
+
+                try:
+                    if writable and client.wantsWrite():
+                        client.handleWrite()
+                        if not client.wantsWrite():
+                            poller.modify(fd, False)
+                    if readable and client.handleRead():
+                        reply = client.getResult()
+                        if pacer:
+                            pacer.consume(reply.bytesin + reply.bytesout)
+                        if metrics:
+                            metrics.addReply(reply)
+                        self.state.insertClue(makeClue(reply))
+                    else:
+                        continue
+                except clientlib.ConnectionRefused, msg:
+                    if metrics:
+                        metrics.addError(msg)
+                    if not _tolerateRefusal(self.state):
+                        self.state.setError(msg)
+                except fatal_exceptions, msg:
+                    if metrics:
+                        metrics.addError(msg)
+                    self.state.setError(msg)
+
+                poller.unregister(fd)
+                del clients[fd]
+                client.close()
+
+            now = time.time()
+            for fd, client in clients.items():
+                if client.hasExpired():
+                    self.state.incMissed()
+                    if metrics:
+                        metrics.addError(clientlib.TimedOut())
+                    poller.unregister(fd)
+                    del clients[fd]
+                    client.close()
+
+            if now >= nextstats:
+                manager.showStats()
+                nextstats = now + manager.refresh_interval
+            if manager.checkStop():
+                self.state.shouldstop.set()
+
+        for client in clients.values():
+            client.close()
+
+
+class ProcessCrew(WorkCrew):
+    """Spreads the scanners over several worker processes.
+
+    Every process runs its share of scanner threads (see L{_scanProcess})
+    and sends back the clues it finds, packed as a clue store, along with
+    the traffic it has accounted for every L{Manager.refresh_interval}
+    seconds. All of them stop at the same moment, computed by the parent,
+    and since clue timestamps come from the system clock shared by every
+    process, time differences are comparable no matter where a clue was
+    found.
+
+    @ivar processes: Number of worker processes.
+    @type processes: C{int}
+    """
+    def __init__(self, scantask):
+        WorkCrew.__init__(self, scantask)
+
+        self.processes = scantask.processes or multiprocessing.cpu_count()
+        self.processes = max(1, min(self.processes, scantask.parallelism))
+
+        if self.state.tuner:
+            logger = Halberd.logger.getLogger()
+            logger.warn('parallelism can not be tuned by the processes '
+                        'engine, using %d requests.', scantask.parallelism)
+            self.state.tuner = None
+
+    def scan(self):
+        """Perform a parallel load-balancer scan.
+        """
+        self.working = True
+        self._setupSigHandler()
+
+        # Worked out here so the children don't have to.
+        probe = self._selectProbe()
+
+        manager = Manager(self.state, self.task)
+        manager.setTimeout(self.task.scantime)
+
+        # The workers do the pacing, ours just adds up what they report.
+        if self.state.pacer:
+            self.state.pacer.start()
+
+        queue = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        for i in xrange(self.processes):
+            # Parallelism is distributed as evenly as possible.
+            num = self.task.parallelism // self.processes
+            if i < self.task.parallelism % self.processes:
+                num += 1
+            worker = multiprocessing.Process(target=_scanProcess,
+                        args=(i, self.task, probe, num, self.processes,
+                              manager.timeout, queue, stop))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+        self._collect(manager, queue, stop)
+
+        for worker in self.workers:
+            worker.join()
+
+        if self.standalone:
+            # Display status information for the last time.
+            self.showSummary(manager)
+
+        self._finish()
+
+        return self._getClues()
+
+    def showSummary(self, manager):
+        """Displays the final statistics of the scan.
+
+        @param manager: Manager of the scan.
+        @type manager: L{Manager}
+        """
+        manager.showStats()
+        manager.showPacingStats()
+
+    def _collect(self, manager, queue, stop):
+        """Merges what the worker processes send until all of them finish.
+        """
+        # Each worker's clues are unpacked with tables of their own.
+        inboxes = [Halberd.clues.store.ClueStore() for w in self.workers]
+        pacer = self.state.pacer
+
+        running = len(self.workers)
+        while running:
+            if manager.checkStop():
+                stop.set()
+
+            try:
+                index, packed, missed, traffic, err, done = \
+                    queue.get(True, manager.refresh_interval)
+            except (Queue.Empty, IOError):
+                # IOError: interrupted system call (i.e. SIGINT).
+                if not [w for w in self.workers if w.is_alive()]:
+                    break
+            else:
+                inbox = inboxes[index]
+                inbox.unpack(packed)
+                if len(inbox):
+                    self.state.insertClues(inbox.toClues())
+                    inbox.clear()
+                if pacer:
+                    requests, nbytes = traffic
+                    pacer.consume(nbytes, requests)
+                if missed:
+                    self.state.incMissed(missed)
+                if err is not None:
+                    self.state.setError(err)
+                if done:
+                    running -= 1
+
+            manager.showStats()
+
+        stop.set()
+
+
+class MultiCrew:
+    """Scans every address of a host at the same time.
+
+    There is a crew (of the kind given by L{crewFactory}) per address, each
+    one with its own L{ScanState}, so errors and statistics are kept apart:
+    an address which can't be reached stops its own scan only. The crews run
+    in separate threads while the main thread catches SIGINT and displays a
+    status line adding up all of them.
+
+    @ivar tasks: One scan task per address.
+    @type tasks: C{list}
+
+    @ivar crews: One crew per scan task (in the same order).
+    @type crews: C{list}
+
+    @ivar prev: Previous SIGINT handler.
+    """
+    # Indicates how often the status line must be refreshed (in seconds).
+    refresh_interval = 0.25
+
+    def __init__(self, scantasks):
+        """Sets up a crew per address.
+
+        @param scantasks: Tasks describing how to scan each address.
+        @type scantasks: C{list}
+        """
+        self.tasks = scantasks
+        self.crews = []
+        for task in scantasks:
+            if len(scantasks) > 1:
+                # Status lines and errors are displayed by the MultiCrew.
+                task = copy.copy(task)
+                task.verbose = False
+                workcrew = crewFactory(task)
+                workcrew.standalone = False
+            else:
+                workcrew = crewFactory(task)
+            self.crews.append(workcrew)
+
+        self.prev = None
+
+    def _setupSigHandler(self):
+        """Performs what's needed to catch SIGINT.
+        """
+        def interrupt(signum, frame):
+            """SIGINT handler
+            """
+            for workcrew in self.crews:
+                workcrew.state.setError('received SIGINT')
+
+        self.prev = signal.signal(signal.SIGINT, interrupt)
+
+    def _restoreSigHandler(self):
+        """Restore previous SIGINT handler.
+        """
+        signal.signal(signal.SIGINT, self.prev)
+
+    def scan(self):
+        """Scans all the addresses in parallel.
+
+        @return: Sequence of clues obtained from each address (in the same
+        order as L{tasks}).
+        @rtype: C{list}
+        """
+        if len(self.crews) == 1:
+            return [self.crews[0].scan()]
+
+        results = [[] for workcrew in self.crews]
+
+        def work(idx):
+            results[idx] = self.crews[idx].scan()
+
+        self._setupSigHandler()
+
+        threads = []
+        for idx in xrange(len(self.crews)):
+            thread = threading.Thread(target=work, args=(idx,), name='Crew')
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+
+        # Joining with a timeout keeps the main thread responsive to signals.
+        started = time.time()
+        for thread in threads:
+            while thread.isAlive():
+                self.showStats(time.time() - started)
+                thread.join(self.refresh_interval)
+
+        self._restoreSigHandler()
+
+        self.showSummary()
+
+        return results
+
+    def showStats(self, elapsed):
+        """Displays the overall progress of the scan.
+
+        @param elapsed: Seconds since the scan started.
+        @type elapsed: C{float}
+        """
+        if not self.tasks[0].verbose:
+            return
+
+        scantime = self.tasks[0].scantime
+        done = min(int(elapsed * 10 / scantime), 10)
+        statbar = '[' + '#' * done + ' ' * (10 - done) + ']'
+
+        nclues = replies = missed = failed = 0
+        for workcrew in self.crews:
+            stats = workcrew.state.getStats()
+            nclues += stats[0]
+            replies += stats[1]
+            missed += stats[2]
+            if workcrew.state.getError() is not None:
+                failed += 1
+
+        sys.stdout.write('\r%d addresses  %s  clues: %3d | replies: %3d | '
+                         'missed: %3d | failed: %d' % (len(self.crews), statbar,
+                                                       nclues, replies, missed,
+                                                       failed))
+        sys.stdout.flush()
+
+    def showSummary(self):
+        """Displays the final statistics and errors of every address.
+        """
+        if self.tasks[0].verbose:
+            sys.stdout.write('\n')
+            for task, workcrew in zip(self.tasks, self.crews):
+                manager = Manager(workcrew.state, task)
+                workcrew.showSummary(manager)
+                sys.stdout.write('\n')
+            sys.stdout.write('\n')
+
+        for task, workcrew in zip(self.tasks, self.crews):
+            err = workcrew.state.getError()
+            if err is not None:
+                sys.stderr.write('*** %s finished (%s) ***\n' % (task.addr, err))
+
+
+def _scanProcess(index, task, probe, parallelism, share, deadline, queue,
+                 stop):
+    """Body of the worker processes of a L{ProcessCrew}.
+
+    @param index: Position of the process in its crew.
+    @type index: C{int}
+
+    @param task: The scan task (its parallelism is ignored).
+    @type task: L{ScanTask}
+
+    @param probe: Probing strategy chosen by the parent.
+    @type probe: C{str}
+
+    @param parallelism: Number of scanner threads to run.
+    @type parallelism: C{int}
+
+    @param share: Number of processes the pacing limits are divided among.
+    @type share: C{int}
+
+    @param deadline: Time when the scan ends.
+    @type deadline: C{float}
+
+    @param queue: Where to send (index, packed clues, missed, traffic,
+    error, done) tuples. Clues are packed as a clue store (see
+    L{Halberd.clues.store.ClueStore.pack}) and traffic is the number of
+    requests and bytes accounted for since the previous message.
+    @type queue: C{multiprocessing.Queue}
+
+    @param stop: Set by the parent when the scan must be stopped early.
+    @type stop: C{multiprocessing.Event}
+    """
+    # The parent takes care of SIGINT.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    task.probe = probe
+    task.verbose = False
+    state = ScanState()
+    state.probe = probe
+    pacer = Halberd.pacer.Pacer(float(task.rate) / share,
+                                float(task.bandwidth) / share, task.jitter)
+    if pacer.isActive():
+        state.pacer = pacer
+
+    outbox = Halberd.clues.store.ClueStore()
+    # Digests and header sets sent so far (see ClueStore.pack) and traffic
+    # reported so far.
+    sent = [(0, 0), (0, 0)]
+
+    def report(err=None, done=False):
+        clues, missed = state.drain()
+        totals = pacer.getTotals()
+        traffic = (totals[0] - sent[1][0], totals[1] - sent[1][1])
+        if not (clues or missed or traffic[0] or done):
+            return
+
+        outbox.extend(clues)
+        packed, sent[0] = outbox.pack(sent[0])
+        outbox.clear()
+        sent[1] = totals
+        queue.put((index, packed, missed, traffic, err, done))
+
+    scanners = [Scanner(state, task, i) for i in xrange(parallelism)]
+    for scanner in scanners:
+        scanner.start()
+
+    while not state.shouldstop.isSet():
+        stop.wait(Manager.refresh_interval)
+        if stop.is_set() or time.time() >= deadline:
+            state.shouldstop.set()
+        report()
+
+    for scanner in scanners:
+        scanner.join()
+
+    # Exceptions don't survive the trip to the parent, their messages do.
+    err = state.getError()
+    if err is not None:
+        err = str(err)
+
+    report(err, True)
+
+
+class _Poller:
+    """Thin wrapper around the best I/O multiplexing mechanism available.
+
+    C{select.poll} is used when present. Otherwise (i.e. win32) we fall back
+    to C{select.select}, which is limited to C{FD_SETSIZE} descriptors.
+    """
+    def __init__(self):
+        if hasattr(select, 'poll'):
+            self._poll = select.poll()
+        else:
+            self._poll = None
+        self._fds = {}
+
+    def _mask(self, writable):
+        mask = select.POLLIN | select.POLLPRI
+        if writable:
+            mask |= select.POLLOUT
+        return mask
+
+    def register(self, fd, writable):
+        """Starts watching a descriptor.
+
+        @param writable: Whether we are interested in writability too.
+        @type writable: C{bool}
+        """
+        self._fds[fd] = writable
+        if self._poll:
+            self._poll.register(fd, self._mask(writable))
+
+    def modify(self, fd, writable):
+        """Changes the events we are interested in for a descriptor.
+        """
+        self.register(fd, writable)
+
+    def unregister(self, fd):
+        """Stops watching a descriptor.
+        """
+        del self._fds[fd]
+        if self._poll:
+            self._poll.unregister(fd)
+
+    def poll(self, timeout):
+        """Waits for events.
+
+        @param timeout: Maximum time to wait (in seconds).
+        @type timeout: C{float}
+
+        @return: Sequence of (descriptor, readable, writable) tuples.
+        @rtype: C{list}
+        """
+        try:
+            if not self._poll:
+                return self._select(timeout)
+            events = self._poll.poll(timeout * 1000)
+        except select.error, (err, msg):
+            if err == errno.EINTR:
+                # Interrupted by a signal (e.g. SIGINT).
+                return []
+            raise
+
+        # Errors and hangups are reported as readability so the client gets to
+        # find out what happened by itself.
+        return [(fd, bool(ev & ~select.POLLOUT), bool(ev & select.POLLOUT))
+                for fd, ev in events]
+
+    def _select(self, timeout):
+        """Fallback for systems lacking C{select.poll}.
+        """
+        wanted = [fd for fd, writable in self._fds.items() if writable]
+        r, w, x = select.select(self._fds.keys(), wanted, [], timeout)
+        return [(fd, fd in r, fd in w) for fd in set(r + w)]
+
+
+def crewFactory(scantask):
+    """Work crew factory.
+
+    @param scantask: Object describing the target and how to scan it.
+    @type scantask: C{instanceof(ScanTask)}
+
+    @return: The kind of crew requested by the scan task.
+    @rtype: L{WorkCrew}
+    """
+    if scantask.engine == 'processes':
+        return ProcessCrew(scantask)
+    if scantask.engine == 'async':
+        if scantask.url.startswith('https://'):
+            unsupported = 'HTTPS'
+        elif scantask.keepalive:
+            unsupported = 'keep-alive connections'
+        elif scantask.pipeline > 1:
+            unsupported = 'pipelining'
+        else:
+            return AsyncCrew(scantask)
+
+        logger = Halberd.logger.getLogger()
+        logger.warn('the async engine does not support %s, '
+                    'falling back to threads.', unsupported)
+        return WorkCrew(scantask)
+
+    return WorkCrew(scantask)
+
+
+def _tolerateRefusal(state):
+    """Decides whether a refused connection is just a sign of overload.
+
+    While tuning the amount of parallelism, refusals happening once the
+    target has already answered are accounted for (so the tuner backs off)
+    instead of aborting the scan.
+
+    @return: True if the refusal was accounted for.
+    @rtype: C{bool}
+    """
+    if state.tuner is None or state.getStats()[1] == 0:
+        return False
+    state.incRefused()
+    return True
+
+def makeClue(reply):
+    """Compose a clue object.
+
+    @param reply: Reply obtained from the target.
+    @type reply: L{clientlib.Reply}
+
+    @return: A valid clue
+    @rtype: C{Clue}
+    """
+    clue = Halberd.clues.Clue.Clue()
+    clue.parse(reply)
+
+    return clue
+
+
 class BaseScanner(threading.Thread):
     """Base class for load balancer scanning threads.
 
@@ -336,11 +1511,46 @@ class BaseScanner(threading.Thread):
 
 class Scanner(BaseScanner):
     """Scans the target host from the local machine.
+
+    @ivar client: Client whose connection is being reused (only when the task
+    requests keep-alive connections).
+    @type client: L{clientlib.HTTPClient}
+
+    @ivar index: Position of the scanner in its crew.
+    @type index: C{int}
+
+    @ivar buffer: Clues found and not yet inserted into the shared state.
+    @type buffer: L{ClueBuffer}
     """
+    def __init__(self, state, scantask, index=0):
+        BaseScanner.__init__(self, state, scantask)
+        self.setName('Scanner-%d' % index)
+        self.client = None
+        self.index = index
+        self.buffer = ClueBuffer(state)
+
+    def run(self):
+        """Perform the scan.
+        """
+        try:
+            BaseScanner.run(self)
+        finally:
+            self.buffer.flush()
+
     def process(self):
         """Gathers clues connecting directly to the target web server.
         """
-        client = clientlib.clientFactory(self.task)
+        tuner = self.state.tuner
+        if tuner and self.index >= tuner.limit:
+            # Don't keep clues to ourselves while waiting.
+            self.buffer.flush()
+            if not tuner.admit(self.index):
+                return
+
+        if self.client is None:
+            client = clientlib.clientFactory(self.task, self.state.probe)
+        else:
+            client = self.client
 
         fatal_exceptions = (
             clientlib.ConnectionRefused,
@@ -348,58 +1558,219 @@ class Scanner(BaseScanner):
             clientlib.HTTPSError,
         )
 
+        pipelining = self.task.pipeline > 1 and self.state.pipelining \
+                     and self.task.probe != 'tls'
+
+        pacer = self.state.pacer
+        if pacer:
+            pacer.acquire(pipelining and self.task.pipeline or 1,
+                          self.state.shouldstop)
+            if self.state.shouldstop.isSet():
+                return
+
+        metrics = self.state.metrics
+        started = time.time()
         try:
-            ts, hdrs = client.getHeaders(self.task.addr, self.task.url)
+            if pipelining:
+                replies = self._pipeline(client)
+            else:
+                replies = [client.getHeaders(self.task.addr, self.task.url)]
+        except clientlib.ConnectionRefused, msg:
+            if metrics:
+                metrics.addError(msg)
+            if not _tolerateRefusal(self.state):
+                self.state.setError(msg)
+            self.client = None
         except fatal_exceptions, msg:
+            if metrics:
+                metrics.addError(msg)
             self.state.setError(msg)
         except clientlib.TimedOut, msg:
+            if metrics:
+                metrics.addError(msg)
             self.state.incMissed()
+            # Don't reuse a connection in an unknown state.
+            self.client = None
         else:
-            self.state.insertClue(self.makeClue(ts, hdrs))
+            if pacer:
+                pacer.consume(sum([r.bytesin + r.bytesout for r in replies]),
+                              len(replies))
+            for reply in replies:
+                if metrics:
+                    metrics.addReply(reply)
+                if reply.handshake:
+                    self.state.addHandshake()
+                clue = self.makeClue(reply)
+                if client.keepalive:
+                    clue.conns[reply.connid] = 1
+                    self.client = client
+                self.buffer.add(clue)
+
+        tracer = Halberd.tracer.active
+        if tracer:
+            tracer.addSpan('probe', started, time.time(), url=self.task.url,
+                           addr=self.task.addr)
+
+    def _pipeline(self, client):
+        """Sends a batch of pipelined requests.
+
+        If the target doesn't properly support pipelining, it gets disabled for
+        the rest of the scan and we fall back to persistent connections.
+
+        @param client: Client to use.
+        @type client: L{clientlib.HTTPClient}
+
+        @return: Sequence of replies.
+        @rtype: C{list} of L{clientlib.Reply}
+        """
+        client.keepalive = True
+        replies = client.getPipelined(self.task.addr, self.task.url,
+                                      self.task.pipeline)
+        self.state.addBatch(len(replies))
 
-    def makeClue(self, timestamp, headers):
-        """Compose a clue object.
+        if len(replies) < self.task.pipeline:
+            if self.state.disablePipelining():
+                self.logger.warn('%s does not support pipelining, '
+                                 'falling back to persistent connections.',
+                                 self.task.addr)
 
-        @param timestamp: Time when the reply was received.
-        @type timestamp: C{float}
+        return replies
 
-        @param headers: MIME headers coming from an HTTP response.
-        @type headers: C{str}
+    def makeClue(self, reply):
+        """Compose a clue object.
+
+        @param reply: Reply obtained from the target.
+        @type reply: L{clientlib.Reply}
 
         @return: A valid clue
         @rtype: C{Clue}
         """
-        clue = Halberd.clues.Clue.Clue()
-        clue.setTimestamp(timestamp)
-        clue.parse(headers)
-
-        return clue
+        return makeClue(reply)
 
 
 class Manager(BaseScanner):
     """Performs management tasks during the scan.
+
+    @ivar rule: Early stopping rule (C{None} if the whole scan time must be
+    used).
+    @type rule: L{ConvergenceRule}
     """
-    # Indicates how often the state must be refreshed (in seconds).
+    # Indicates how often the status line must be refreshed (in seconds).
     refresh_interval = 0.25
 
+    def __init__(self, state, scantask):
+        BaseScanner.__init__(self, state, scantask)
+
+        self.rule = None
+        if scantask.converge_window > 0:
+            self.rule = ConvergenceRule(scantask.converge_window,
+                                        scantask.converge_samples,
+                                        scantask.converge_time)
+        self._nextstats = 0
+
     def process(self):
         """Controls the whole scanning process.
 
-        This method checks when the timeout has expired and notifies the rest
+        This method checks when the scan should be over and notifies the rest
         of the scanning threads that they should stop. It also displays (in
         case the user asked for it) detailed information regarding the process.
+
+        Instead of polling, the manager sleeps until the scanners report new
+        results (see L{ScanState.waitForChange}) or something is due: the
+        deadline, the next status line or the next tuning period.
         """
-        self.showStats()
+        now = time.time()
+        if now >= self._nextstats:
+            self.showStats()
+            self._nextstats = now + self.refresh_interval
 
-        if self.hasExpired():
+        if self.state.tuner:
+            self.state.tuner.update()
+
+        if self.checkStop():
             self.state.shouldstop.set()
+            return
+
+        timeout = self.timeout - now
+        if self.task.verbose:
+            timeout = min(timeout, self._nextstats - now)
+        if self.state.tuner:
+            timeout = min(timeout, self.state.tuner.period)
         try:
-            time.sleep(self.refresh_interval)
+            self.state.waitForChange(max(timeout, 0))
         except IOError:
             # Catch interrupted system call exception (it happens when
             # CONTROL-C is pressed on win32 systems).
             self.state.shouldstop.set()
 
+    def checkStop(self):
+        """Decides whether the scan is over, recording the reason.
+
+        @return: True if the scan must be stopped.
+        @rtype: C{bool}
+        """
+        if self.state.shouldstop.isSet():
+            return True
+        if self.hasExpired():
+            self.state.setStopReason('scan time (%d seconds) elapsed'
+                                     % self.task.scantime)
+            return True
+        if self.rule and self.rule.hasConverged(self.state):
+            self.state.setStopReason(self.rule.reason)
+            return True
+        return False
+
+    def showPipelineStats(self):
+        """Displays how many replies were obtained per round trip.
+        """
+        if not self.task.verbose:
+            return
+
+        batches, replies = self.state.getPipelineStats()
+        if batches:
+            sys.stdout.write('\npipelining: %.2f samples per round trip'
+                             % (replies / float(batches)))
+
+    def showHandshakeStats(self):
+        """Displays how many TLS handshakes were needed.
+        """
+        if not self.task.verbose:
+            return
+
+        handshakes = self.state.getHandshakes()
+        replies = self.state.getStats()[1]
+        if handshakes and replies:
+            sys.stdout.write('\ntls: %d handshakes (%.2f per reply)'
+                             % (handshakes, handshakes / float(replies)))
+
+    def showPacingStats(self):
+        """Displays the achieved rates against the requested ones.
+        """
+        pacer = self.state.pacer
+        if not (self.task.verbose and pacer):
+            return
+
+        rate, bandwidth = pacer.getStats()
+        line = '\npacing: %.1f req/s' % rate
+        if pacer.rate:
+            line += ' (target %.1f)' % pacer.rate
+        line += ', %.0f bytes/s' % bandwidth
+        if pacer.bandwidth:
+            line += ' (cap %.0f)' % pacer.bandwidth
+        sys.stdout.write(line)
+
+    def showConcurrencyStats(self):
+        """Displays how the number of parallel requests evolved.
+        """
+        tuner = self.state.tuner
+        if not (self.task.verbose and tuner):
+            return
+
+        limits = [limit for elapsed, limit in tuner.trajectory]
+        sys.stdout.write('\nparallelism: %d -> %d (min %d, max %d, %d changes)'
+                         % (limits[0], limits[-1], min(limits), max(limits),
+                            len(limits) - 1))
+
     def showStats(self):
         """Displays certain statistics while the scan is happening.
         """
@@ -421,10 +1792,15 @@ class Manager(BaseScanner):
         else:
             remaining = self.remaining()
 
+        timeout = clientlib.getEstimator(self.task.addr).getTimeout()
+
         statusline = '\r' + self.task.addr.ljust(15) + \
                     '  %s  clues: %3d | replies: %3d | missed: %3d' \
+                    ' | timeout: %5.2fs' \
                     % (statbar(remaining, self.task.scantime),
-                       nclues, replies, missed)
+                       nclues, replies, missed, timeout)
+        if self.state.tuner:
+            statusline += ' | parallel: %3d' % self.state.tuner.limit
         sys.stdout.write(statusline)
         sys.stdout.flush()
 
@@ -0,0 +1,416 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Instrumentation of scans.
+
+Every target being scanned gets a L{TargetMetrics} object accounting for its
+replies, traffic, errors and latencies (kept in fixed-bucket histograms so
+memory use doesn't depend on the length of the scan). An L{Exporter}
+periodically writes a snapshot of all of them to a file, either as JSON or in
+the Prometheus text format, so it can be scraped or graphed while the scan is
+running.
+
+    >>> metrics = getRegistry().getTarget('http://www.example.com/', '10.0.0.1')
+    >>> metrics.addReply(reply)
+    >>> exporter = Exporter('halberd.prom', 'prometheus', 5)
+    >>> exporter.start()
+
+@var default_buckets: Upper bounds (in seconds) of the latency histograms.
+@type default_buckets: C{tuple}
+
+@var default_interval: Seconds between snapshots.
+@type default_interval: C{float}
+
+@var formats: Supported output formats.
+@type formats: C{tuple}
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import os
+import time
+import json
+import bisect
+import threading
+
+import Halberd.logger
+
+
+__all__ = ['Histogram', 'TargetMetrics', 'Registry', 'Exporter',
+           'getRegistry']
+
+
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+
+default_interval = 5
+
+formats = ('json', 'prometheus')
+
+
+class Histogram:
+    """Counts observations falling within fixed buckets.
+
+    @ivar bounds: Upper bound of every bucket (there is an extra one for
+    anything larger).
+    @type bounds: C{tuple}
+
+    @ivar counts: Number of observations in each bucket (not cumulative).
+    @type counts: C{list}
+
+    @ivar total: Sum of all the observations.
+    @type total: C{float}
+    """
+    def __init__(self, bounds=default_buckets):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        """Records an observation.
+
+        @param value: Observed value.
+        @type value: C{float}
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    def getCount(self):
+        """Returns the number of observations.
+
+        @rtype: C{int}
+        """
+        return sum(self.counts)
+
+    def getCumulative(self):
+        """Returns the cumulative count of observations per upper bound.
+
+        @return: Sequence of (bound, count) tuples, the last bound being
+        C{None} (i.e. infinity).
+        @rtype: C{list}
+        """
+        result, acc = [], 0
+        for bound, count in zip(self.bounds + (None,), self.counts):
+            acc += count
+            result.append((bound, acc))
+        return result
+
+    def getPercentile(self, fraction):
+        """Estimates a percentile as the upper bound of its bucket.
+
+        @param fraction: Percentile wanted (between 0 and 1).
+        @type fraction: C{float}
+
+        @return: Upper bound of the bucket holding the percentile (C{None}
+        if it lies beyond the last bound or there are no observations).
+        @rtype: C{float}
+        """
+        total = self.getCount()
+        if total == 0:
+            return None
+        for bound, acc in self.getCumulative():
+            if acc >= fraction * total:
+                return bound
+
+
+class TargetMetrics:
+    """Accounts for the exchanges with a target.
+
+    The rate of replies is computed between the first and the last exchanges
+    so it doesn't decay once the scan is over.
+
+    Latencies are measured from the moment a request (or batch of pipelined
+    requests) starts: the time needed to connect (only when a new connection
+    is opened), until the first byte of the reply arrives and until its
+    headers are complete.
+
+    @ivar url: URL being scanned.
+    @type url: C{str}
+
+    @ivar addr: Address of the target.
+    @type addr: C{str}
+
+    @ivar replies: Number of replies received.
+    @type replies: C{int}
+
+    @ivar bytesin: Bytes received.
+    @type bytesin: C{int}
+
+    @ivar bytesout: Bytes sent.
+    @type bytesout: C{int}
+
+    @ivar errors: Number of errors per exception class name.
+    @type errors: C{dict}
+
+    @ivar latencies: Histogram of each latency (C{connect}, C{firstbyte} and
+    C{headers}).
+    @type latencies: C{dict}
+    """
+    def __init__(self, url, addr):
+        self.url = url
+        self.addr = addr
+
+        self.__mutex = threading.Lock()
+        # Time of the first and last exchanges.
+        self.started = self.last = None
+        self.replies = 0
+        self.bytesin = 0
+        self.bytesout = 0
+        self.errors = {}
+        self.latencies = {
+            'connect': Histogram(),
+            'firstbyte': Histogram(),
+            'headers': Histogram(),
+        }
+
+    def addReply(self, reply):
+        """Accounts for a reply.
+
+        @param reply: Reply obtained from the target.
+        @type reply: L{Halberd.clientlib.Reply}
+        """
+        self.__mutex.acquire()
+        if self.started is None:
+            self.started = reply.started
+        self.last = reply.completed or reply.started
+        self.replies += 1
+        self.bytesin += reply.bytesin
+        self.bytesout += reply.bytesout
+        if reply.connected:
+            self.latencies['connect'].observe(reply.connected - reply.started)
+        if reply.timestamp:
+            self.latencies['firstbyte'].observe(reply.timestamp - reply.started)
+        if reply.completed:
+            self.latencies['headers'].observe(reply.completed - reply.started)
+        self.__mutex.release()
+
+    def addError(self, err):
+        """Accounts for a failed exchange.
+
+        @param err: Exception raised by the client.
+        @type err: C{Exception}
+        """
+        name = err.__class__.__name__
+        self.__mutex.acquire()
+        self.last = time.time()
+        if self.started is None:
+            self.started = self.last
+        self.errors[name] = self.errors.get(name, 0) + 1
+        self.__mutex.release()
+
+    def getSnapshot(self):
+        """Provides a copy of the current values.
+
+        @return: Values ready to be serialized (see L{Exporter}).
+        @rtype: C{dict}
+        """
+        self.__mutex.acquire()
+        snapshot = {
+            'url': self.url,
+            'addr': self.addr,
+            'replies': self.replies,
+            'bytes_in': self.bytesin,
+            'bytes_out': self.bytesout,
+            'errors': self.errors.copy(),
+            'rate': 0.0,
+            'latency': {},
+        }
+        if self.started is not None and self.last > self.started:
+            snapshot['rate'] = self.replies / (self.last - self.started)
+        for name, hist in self.latencies.items():
+            snapshot['latency'][name] = {
+                'buckets': hist.getCumulative(),
+                'sum': hist.total,
+                'count': hist.getCount(),
+            }
+        self.__mutex.release()
+
+        return snapshot
+
+
+class Registry:
+    """Collection of the metrics of every target scanned.
+    """
+    def __init__(self):
+        self.__mutex = threading.Lock()
+        self._targets = {}
+
+    def getTarget(self, url, addr):
+        """Returns the metrics of a target (creating them if needed).
+
+        @rtype: L{TargetMetrics}
+        """
+        self.__mutex.acquire()
+        metrics = self._targets.get((url, addr))
+        if metrics is None:
+            metrics = self._targets[(url, addr)] = TargetMetrics(url, addr)
+        self.__mutex.release()
+
+        return metrics
+
+    def getSnapshot(self):
+        """Provides the current values of every target.
+
+        @rtype: C{list}
+        """
+        self.__mutex.acquire()
+        targets = self._targets.values()
+        self.__mutex.release()
+
+        return [metrics.getSnapshot() for metrics in targets]
+
+
+def _formatJSON(snapshots, now):
+    """Serializes snapshots as a JSON document.
+    """
+    return json.dumps({'timestamp': now, 'targets': snapshots},
+                      sort_keys=True, indent=1) + '\n'
+
+def _escape(value):
+    """Escapes a Prometheus label value (backslashes, double quotes and
+    line feeds).
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+                     .replace('\n', '\\n')
+
+def _formatPrometheus(snapshots):
+    """Serializes snapshots in the Prometheus text exposition format.
+    """
+    def labels(snapshot, **extra):
+        pairs = [('url', snapshot['url']), ('addr', snapshot['addr'])]
+        pairs += sorted(extra.items())
+        return '{' + ','.join(['%s="%s"' % (name, _escape(value))
+                               for name, value in pairs]) + '}'
+
+    lines = []
+    for name, kind, text in (
+            ('replies', 'counter', 'Replies received.'),
+            ('bytes_in', 'counter', 'Bytes received.'),
+            ('bytes_out', 'counter', 'Bytes sent.'),
+            ('rate', 'gauge', 'Replies per second.')):
+        metric = 'halberd_' + name
+        if kind == 'counter':
+            metric += '_total'
+        lines.append('# HELP %s %s' % (metric, text))
+        lines.append('# TYPE %s %s' % (metric, kind))
+        for snapshot in snapshots:
+            lines.append('%s%s %s' % (metric, labels(snapshot),
+                                      repr(snapshot[name])))
+
+    lines.append('# HELP halberd_errors_total Failed exchanges.')
+    lines.append('# TYPE halberd_errors_total counter')
+    for snapshot in snapshots:
+        for cls, count in sorted(snapshot['errors'].items()):
+            lines.append('halberd_errors_total%s %d'
+                         % (labels(snapshot, error=cls), count))
+
+    for name in ('connect', 'firstbyte', 'headers'):
+        metric = 'halberd_%s_seconds' % name
+        lines.append('# HELP %s Latency until %s.' % (metric, name))
+        lines.append('# TYPE %s histogram' % metric)
+        for snapshot in snapshots:
+            hist = snapshot['latency'][name]
+            for bound, count in hist['buckets']:
+                if bound is None:
+                    bound = '+Inf'
+                lines.append('%s_bucket%s %d'
+                             % (metric, labels(snapshot, le=bound), count))
+            lines.append('%s_sum%s %r' % (metric, labels(snapshot),
+                                          hist['sum']))
+            lines.append('%s_count%s %d' % (metric, labels(snapshot),
+                                            hist['count']))
+
+    return '\n'.join(lines) + '\n'
+
+
+class Exporter(threading.Thread):
+    """Periodically writes the metrics of all the targets to a file.
+
+    The file is replaced atomically so readers never see a partial snapshot.
+
+    @ivar filename: Where to write the snapshots.
+    @type filename: C{str}
+
+    @ivar format: Either C{json} or C{prometheus}.
+    @type format: C{str}
+
+    @ivar interval: Seconds between snapshots.
+    @type interval: C{float}
+    """
+    def __init__(self, filename, format='json', interval=default_interval,
+                 registry=None):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+
+        if format not in formats:
+            raise ValueError, 'unknown metrics format %s' % format
+
+        self.filename = filename
+        self.format = format
+        self.interval = interval
+        self.registry = registry or getRegistry()
+
+        self._done = threading.Event()
+
+    def write(self):
+        """Writes a snapshot right away.
+        """
+        now = time.time()
+        snapshots = self.registry.getSnapshot()
+        if self.format == 'json':
+            data = _formatJSON(snapshots, now)
+        else:
+            data = _formatPrometheus(snapshots)
+
+        tmpname = self.filename + '.tmp'
+        fp = open(tmpname, 'w')
+        fp.write(data)
+        fp.close()
+        os.rename(tmpname, self.filename)
+
+    def run(self):
+        while not self._done.isSet():
+            self._done.wait(self.interval)
+            try:
+                self.write()
+            except (IOError, OSError), msg:
+                # The disk may be full only for a while: keep trying.
+                logger = Halberd.logger.getLogger()
+                logger.warn('unable to write metrics to %s: %s',
+                            self.filename, msg)
+
+    def stop(self):
+        """Stops the exporter, writing a last snapshot.
+        """
+        self._done.set()
+        if self.isAlive():
+            self.join()
+        else:
+            self.write()
+
+
+_registry = Registry()
+
+def getRegistry():
+    """Returns the registry shared by the whole program.
+
+    @rtype: L{Registry}
+    """
+    return _registry
+
+
+# vim: ts=4 sw=4 et
@@ -0,0 +1,227 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Request pacing.
+
+The amount of parallelism alone doesn't determine how hard a target is hit:
+the request rate swings with its latency. A L{Pacer} shared by all the
+scanners of a crew spaces requests out so a fixed rate (and/or bandwidth) is
+not exceeded no matter how many of them are working.
+
+    >>> pacer = Pacer(rate=10, bandwidth=16384, jitter=0.5)
+    >>> pacer.acquire()
+    >>> pacer.consume(1024)
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import time
+import random
+import threading
+
+
+__all__ = ['Pacer']
+
+
+class Pacer:
+    """Token bucket limiting the rate at which requests are sent.
+
+    Requests are given evenly spaced time slots (optionally jittered so they
+    don't look as mechanical). Bandwidth is accounted for once the size of
+    each exchange is known: a bucket holding up to one second worth of bytes
+    is drained and, while it is in debt, no further requests are allowed.
+
+    @ivar rate: Maximum number of requests per second (0 means unlimited).
+    @type rate: C{float}
+
+    @ivar bandwidth: Maximum number of bytes per second (0 means unlimited).
+    @type bandwidth: C{float}
+
+    @ivar jitter: Randomization of the spacing between requests, as a
+    fraction of the spacing itself (between 0 and 1).
+    @type jitter: C{float}
+    """
+    def __init__(self, rate=0, bandwidth=0, jitter=0):
+        if rate < 0 or bandwidth < 0 or not 0 <= jitter <= 1:
+            raise ValueError, 'invalid pacing parameters'
+
+        self.rate = rate
+        self.bandwidth = bandwidth
+        self.jitter = jitter
+
+        self.__mutex = threading.Lock()
+
+        # Time slot for the next request.
+        self._next = 0
+        # Bytes left in the bucket and time when it was last refilled. It
+        # starts empty so the first second doesn't exceed the cap.
+        self._tokens = 0
+        self._refilled = None
+
+        self._started = None
+        self._requests = 0
+        self._bytes = 0
+
+    def isActive(self):
+        """Tells whether any limit is being enforced.
+
+        @rtype: C{bool}
+        """
+        return bool(self.rate or self.bandwidth)
+
+    def delay(self, now=None):
+        """Computes how long to wait before the next request can be sent.
+
+        @return: Seconds to wait (0 if a request can be sent right away).
+        @rtype: C{float}
+        """
+        if now is None:
+            now = time.time()
+
+        self.__mutex.acquire()
+        wait = self._delay(now)
+        self.__mutex.release()
+
+        return wait
+
+    def reserve(self, count=1, now=None):
+        """Reserves time slots for a number of requests.
+
+        @param count: Number of requests to be sent at once (e.g. pipelined).
+        @type count: C{int}
+
+        @return: Seconds to wait before sending them.
+        @rtype: C{float}
+        """
+        if now is None:
+            now = time.time()
+
+        self.__mutex.acquire()
+        if self._started is None:
+            self._started = now
+
+        wait = self._delay(now)
+        if self.rate:
+            spacing = count / float(self.rate)
+            if self.jitter:
+                spacing *= random.uniform(1 - self.jitter, 1 + self.jitter)
+            self._next = max(self._next, now) + spacing
+        self.__mutex.release()
+
+        return wait
+
+    def acquire(self, count=1, stop=None):
+        """Blocks until a number of requests can be sent.
+
+        @param count: Number of requests to be sent at once.
+        @type count: C{int}
+
+        @param stop: If given, waiting is interrupted as soon as it is set.
+        @type stop: C{threading.Event}
+        """
+        wait = self.reserve(count)
+        if wait <= 0:
+            return
+        if stop is not None:
+            stop.wait(wait)
+        else:
+            time.sleep(wait)
+
+    def consume(self, nbytes, count=1, now=None):
+        """Accounts for completed exchanges with the target.
+
+        @param nbytes: Number of bytes sent plus received.
+        @type nbytes: C{int}
+
+        @param count: Number of requests answered.
+        @type count: C{int}
+        """
+        if now is None:
+            now = time.time()
+
+        self.__mutex.acquire()
+        self._requests += count
+        self._bytes += nbytes
+        if self.bandwidth:
+            self._refill(now)
+            self._tokens -= nbytes
+        self.__mutex.release()
+
+    def start(self, now=None):
+        """Starts measuring the achieved rates (see L{getStats}).
+
+        Otherwise they are measured from the first request on, which never
+        comes for pacers accounting for exchanges made elsewhere (e.g. by
+        other processes).
+        """
+        if now is None:
+            now = time.time()
+
+        self.__mutex.acquire()
+        if self._started is None:
+            self._started = now
+        self.__mutex.release()
+
+    def getTotals(self):
+        """Provides the traffic accounted for so far.
+
+        @return: Number of answered requests and bytes sent plus received.
+        @rtype: C{tuple}
+        """
+        self.__mutex.acquire()
+        totals = (self._requests, self._bytes)
+        self.__mutex.release()
+
+        return totals
+
+    def getStats(self, now=None):
+        """Provides the rates achieved so far.
+
+        @return: Answered requests per second and bytes per second.
+        @rtype: C{tuple}
+        """
+        if now is None:
+            now = time.time()
+
+        self.__mutex.acquire()
+        if self._started is None or now <= self._started:
+            stats = (0.0, 0.0)
+        else:
+            elapsed = now - self._started
+            stats = (self._requests / elapsed, self._bytes / elapsed)
+        self.__mutex.release()
+
+        return stats
+
+    def _delay(self, now):
+        wait = 0
+        if self.rate:
+            wait = max(wait, self._next - now)
+        if self.bandwidth:
+            self._refill(now)
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / float(self.bandwidth))
+        return wait
+
+    def _refill(self, now):
+        if self._refilled is not None:
+            self._tokens += (now - self._refilled) * self.bandwidth
+            self._tokens = min(self._tokens, self.bandwidth)
+        self._refilled = now
+
+
+# vim: ts=4 sw=4 et
@@ -0,0 +1,177 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Sampling profiler.
+
+Deterministic profilers slow a scan down so much that its behaviour changes.
+A L{Sampler} instead looks at the stacks of every thread a number of times
+per second (through C{sys._current_frames}) and counts how often each stack
+shows up. Samples are written in the collapsed stack format understood by
+flame graph tools, one line per stack, rooted at the role of the thread it
+belongs to (C{Scanner}, C{Manager}, C{main}...)::
+
+    Scanner;run (crew.py:1290);process (crew.py:1303);getHeaders (clientlib.py:395) 42
+
+    >>> sampler = Sampler()
+    >>> sampler.start()
+    >>> sampler.stop()
+    >>> sampler.write('halberd.folded')
+
+@var default_interval: Seconds between samples.
+@type default_interval: C{float}
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import os
+import sys
+import threading
+
+
+__all__ = ['Sampler']
+
+
+default_interval = 0.02
+
+
+def threadRole(thread):
+    """Names the role of a thread.
+
+    Threads are named after their class (e.g. C{Scanner} or C{Manager}) unless
+    they are plain C{threading.Thread} objects, in which case their name is
+    used without its sequence number. The main thread is called C{main}.
+
+    @type thread: C{threading.Thread}
+
+    @rtype: C{str}
+    """
+    if isinstance(thread, threading._MainThread):
+        return 'main'
+    if thread.__class__ is not threading.Thread:
+        return thread.__class__.__name__
+    return thread.getName().rstrip('-0123456789') or 'Thread'
+
+def _codeName(code):
+    """Describes the function a code object belongs to.
+    """
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                           code.co_firstlineno)
+
+
+class Sampler(threading.Thread):
+    """Periodically samples the stacks of all the other threads.
+
+    @ivar interval: Seconds between samples.
+    @type interval: C{float}
+
+    @ivar stacks: Number of times each stack was seen, keyed by the role of
+    its thread and the code objects in it (innermost first). They are only
+    turned into text when written out, so sampling stays cheap.
+    @type stacks: C{dict}
+
+    @ivar samples: Number of samples taken per thread role.
+    @type samples: C{dict}
+    """
+    def __init__(self, interval=default_interval):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+
+        self.interval = interval
+        self.stacks = {}
+        self.samples = {}
+
+        self._done = threading.Event()
+
+    def sample(self):
+        """Takes a sample of the stack of every thread but this one.
+        """
+        roles = {}
+        for thread in threading.enumerate():
+            roles[thread.ident] = threadRole(thread)
+
+        me = threading.currentThread().ident
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+
+            role = roles.get(ident, 'unknown')
+            stack = (role, tuple(codes))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples[role] = self.samples.get(role, 0) + 1
+
+    def run(self):
+        while not self._done.isSet():
+            self.sample()
+            self._done.wait(self.interval)
+
+    def stop(self):
+        """Stops sampling.
+        """
+        self._done.set()
+        if self.isAlive():
+            self.join()
+
+    def write(self, filename):
+        """Writes the samples in collapsed stack format.
+
+        @param filename: Name of the output file.
+        @type filename: C{str}
+        """
+        lines = []
+        for (role, codes), count in self.stacks.items():
+            names = [_codeName(code) for code in reversed(codes)]
+            lines.append('%s %d\n' % (';'.join([role] + names), count))
+        lines.sort()
+
+        fp = open(filename, 'w')
+        fp.writelines(lines)
+        fp.close()
+
+    def getSummary(self, top=3):
+        """Summarizes where each kind of thread spends its time.
+
+        @param top: Number of functions to show per role.
+        @type top: C{int}
+
+        @return: A line per thread role with its share of the samples and the
+        functions most often found at the top of its stacks.
+        @rtype: C{list}
+        """
+        total = sum(self.samples.values())
+        leaves = {}
+        for (role, codes), count in self.stacks.items():
+            counts = leaves.setdefault(role, {})
+            counts[codes[0]] = counts.get(codes[0], 0) + count
+
+        lines = []
+        for role, count in sorted(self.samples.items(),
+                                  key=lambda item: -item[1]):
+            hottest = sorted(leaves[role].items(), key=lambda item: -item[1])
+            lines.append('%s: %d samples (%.1f%%), %s' % (role, count,
+                         100.0 * count / total,
+                         ', '.join(['%s %.1f%%' % (_codeName(code),
+                                                   100.0 * num / count)
+                                    for code, num in hottest[:top]])))
+        return lines
+
+
+# vim: ts=4 sw=4 et
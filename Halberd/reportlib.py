@@ -21,7 +21,9 @@
 
 
 import sys
+import socket
 
+import Halberd.util
 import Halberd.logger
 import Halberd.clues.analysis as analysis
 
@@ -49,6 +51,24 @@ def report(scantask):
     out.write(': %d real server(s)\n'  % len(clues))
     out.write('=' * 70 + '\n')
 
+    if scantask.stopreason:
+        out.write('scan stopped: %s\n' % scantask.stopreason)
+
+    layer = analysis.balancing(clues)
+    if layer == 'L7':
+        out.write('load balancing: per request (layer 7)\n')
+    elif layer == 'L4':
+        out.write('load balancing: per connection (layer 4)\n')
+
+    if scantask.concurrency:
+        limits = [limit for elapsed, limit in scantask.concurrency]
+        out.write('parallelism: tuned from %d to %d (peak %d)\n'
+                  % (limits[0], limits[-1], max(limits)))
+        if scantask.debug:
+            out.write('parallelism trajectory: %s\n'
+                      % ' '.join(['%d@%.2fs' % (limit, elapsed)
+                                  for elapsed, limit in scantask.concurrency]))
+
     for num, clue in enumerate(clues):
         assert hits > 0
         info = clue.info
@@ -88,4 +108,50 @@ def report(scantask):
             pprint.pprint(clue.headers, out)
 
 
+def reportDualStack(scantasks):
+    """Tells whether the IPv4 and IPv6 addresses of a host lead to the same
+    real servers.
+
+    Real servers are told apart by their header fingerprints. Nothing is
+    displayed unless addresses of both families were scanned.
+
+    @param scantasks: Analyzed scans of every address of the same URL.
+    @type scantasks: C{list}
+    """
+    servers = {}
+    for scantask in scantasks:
+        family = Halberd.util.addressFamily(scantask.addr)
+        found = servers.setdefault(family, {})
+        for clue in scantask.analyzed:
+            found[clue.info['digest']] = clue.info['server']
+
+    if len(servers) < 2:
+        return
+
+    if scantasks[0].out:
+        out = open(scantasks[0].out, 'a')
+    else:
+        out = sys.stdout
+
+    v4, v6 = servers[socket.AF_INET], servers[socket.AF_INET6]
+
+    out.write('=' * 70 + '\n')
+    if sorted(v4) == sorted(v6):
+        out.write('%s: IPv4 and IPv6 lead to the same %d real server(s)\n'
+                  % (scantasks[0].url, len(v4)))
+        out.write('=' * 70 + '\n')
+        return
+
+    out.write('%s: IPv4 and IPv6 lead to different real servers\n'
+              % scantasks[0].url)
+    out.write('=' * 70 + '\n')
+    for title, only, other in (('IPv4 only', v4, v6), ('IPv6 only', v6, v4)):
+        digests = [digest for digest in only if digest not in other]
+        out.write('%s: %d real server(s)\n' % (title, len(digests)))
+        for digest in sorted(digests):
+            out.write('  %s (%s)\n' % (digest, only[digest].lstrip()))
+    shared = [digest for digest in v4 if digest in v6]
+    out.write('both: %d real server(s)\n' % len(shared))
+
+
 # vim: ts=4 sw=4 et
@@ -0,0 +1,290 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Name resolution.
+
+Looking hostnames up one at a time, right before scanning them, stalls the
+scan whenever the DNS server is slow. A L{Resolver} looks names up in a pool
+of threads so they can be requested in advance (see L{Resolver.prefetch}),
+keeps the results for a while and never looks up the same name twice at the
+same time.
+
+    >>> resolver = getResolver()
+    >>> resolver.prefetch('www.example.com')
+    >>> addrs = resolver.resolve('www.example.com')
+
+@var default_workers: Number of lookups done at the same time.
+@type default_workers: C{int}
+
+@var default_ttl: Seconds during which resolved names are remembered.
+@type default_ttl: C{float}
+
+@var default_negative_ttl: Seconds during which names that don't exist are
+remembered (temporary failures aren't remembered at all).
+@type default_negative_ttl: C{float}
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import time
+import Queue
+import socket
+import threading
+
+
+__all__ = ['Resolver', 'getResolver']
+
+
+default_workers = 8
+
+default_ttl = 300
+
+default_negative_ttl = 30
+
+# getaddrinfo errors meaning that the name doesn't exist (as opposed to
+# temporary failures).
+_unknown = [socket.EAI_NONAME]
+if hasattr(socket, 'EAI_NODATA'):
+    _unknown.append(socket.EAI_NODATA)
+
+
+class Resolver:
+    """Caching resolver backed by a pool of threads.
+
+    The standard library doesn't tell how long a DNS answer is valid, so
+    results are kept for a fixed amount of time. Both IPv4 and IPv6 addresses
+    are returned unless a specific address family is requested.
+
+    @ivar workers: Number of lookups done at the same time.
+    @type workers: C{int}
+
+    @ivar ttl: Seconds during which resolved names are remembered.
+    @type ttl: C{float}
+
+    @ivar negative_ttl: Seconds during which names that don't exist are
+    remembered.
+    @type negative_ttl: C{float}
+    """
+
+    # Maximum number of answers remembered (expired ones are forgotten first,
+    # then all of them at once).
+    maxentries = 4096
+
+    def __init__(self, workers=default_workers, ttl=default_ttl,
+                 negative_ttl=default_negative_ttl):
+        self.workers = workers
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self.__mutex = threading.Lock()
+        # (host, family) -> (addresses, expiration time)
+        self._cache = {}
+        # (host, family) -> event set when the lookup is done
+        self._pending = {}
+        self._queue = Queue.Queue()
+        self._threads = []
+
+        self._hits = 0
+        self._lookups = 0
+
+    def _startWorkers(self):
+        """Launches the lookup threads the first time they are needed.
+        """
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name='Resolver')
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        """Looks up the names queued by L{prefetch}.
+        """
+        while True:
+            key = self._queue.get()
+            try:
+                addrs = self._lookup(*key)
+            except socket.gaierror:
+                # Temporary failures (e.g. EAI_AGAIN) aren't remembered so the
+                # next request looks the name up again.
+                addrs, ttl = (), None
+            except Exception:
+                # Names the system chokes on (e.g. invalid IDNA labels) are
+                # remembered as unresolvable.
+                addrs, ttl = (), self.negative_ttl
+            else:
+                if addrs:
+                    ttl = self.ttl
+                else:
+                    ttl = self.negative_ttl
+
+            # Whoever is waiting for the answer must always get one.
+            self.__mutex.acquire()
+            if ttl is not None:
+                if len(self._cache) >= self.maxentries:
+                    self._purge()
+                self._cache[key] = (addrs, time.time() + ttl)
+            self._lookups += 1
+            done = self._pending.pop(key)
+            self.__mutex.release()
+
+            done.set()
+
+    def _purge(self):
+        """Makes room in the cache.
+
+        The caller must hold the lock.
+        """
+        now = time.time()
+        for key, (addrs, expiration) in self._cache.items():
+            if expiration <= now:
+                del self._cache[key]
+
+        if len(self._cache) >= self.maxentries:
+            self._cache.clear()
+
+    def _lookup(self, host, family):
+        """Looks a name up.
+
+        @return: Addresses of the host in the order given by the system (no
+        duplicates) or an empty tuple if it doesn't exist.
+        @rtype: C{tuple}
+
+        @raise socket.gaierror: If the lookup failed for any other reason
+        (e.g. the DNS server didn't answer in time).
+        """
+        try:
+            infos = socket.getaddrinfo(host, None, family, socket.SOCK_STREAM)
+        except socket.gaierror, msg:
+            if msg.args and msg.args[0] in _unknown:
+                return ()
+            raise
+
+        addrs = []
+        for info in infos:
+            addr = info[4][0]
+            if addr not in addrs:
+                addrs.append(addr)
+
+        return tuple(addrs)
+
+    def _request(self, key):
+        """Queues a lookup unless the answer is known or on its way.
+
+        The caller must hold the lock.
+
+        @return: Event set once the lookup is done (C{None} if the cached
+        answer is still valid).
+        @rtype: C{threading.Event}
+        """
+        entry = self._cache.get(key)
+        if entry and entry[1] > time.time():
+            return None
+
+        done = self._pending.get(key)
+        if done is None:
+            done = self._pending[key] = threading.Event()
+            self._startWorkers()
+            self._queue.put(key)
+
+        return done
+
+    def prefetch(self, host, family=socket.AF_UNSPEC):
+        """Starts looking up a name in the background.
+
+        @param host: Hostname to resolve.
+        @type host: C{str}
+
+        @param family: Address family (C{socket.AF_UNSPEC} means any).
+        @type family: C{int}
+        """
+        self.__mutex.acquire()
+        self._request((host, family))
+        self.__mutex.release()
+
+    def resolve(self, host, family=socket.AF_UNSPEC, timeout=None):
+        """Gets the addresses of a host.
+
+        @param host: Hostname to resolve.
+        @type host: C{str}
+
+        @param family: Address family (C{socket.AF_UNSPEC} means any).
+        @type family: C{int}
+
+        @param timeout: Maximum number of seconds to wait for an answer.
+        @type timeout: C{float}
+
+        @return: Network addresses (an empty tuple if the host couldn't be
+        resolved in time).
+        @rtype: C{tuple}
+        """
+        key = (host, family)
+
+        self.__mutex.acquire()
+        done = self._request(key)
+        if done is None:
+            self._hits += 1
+        self.__mutex.release()
+
+        if done is not None:
+            # Waiting in small steps keeps us responsive to signals.
+            if timeout is not None:
+                deadline = time.time() + timeout
+            while not done.isSet():
+                wait = 0.25
+                if timeout is not None:
+                    wait = min(wait, deadline - time.time())
+                    if wait <= 0:
+                        return ()
+                done.wait(wait)
+
+        self.__mutex.acquire()
+        entry = self._cache.get(key)
+        self.__mutex.release()
+
+        if entry is None:
+            # Forgotten to make room right after being looked up.
+            return ()
+        return entry[0]
+
+    def getStats(self):
+        """Provides the number of answers taken from the cache and the
+        number of lookups done.
+
+        @rtype: C{tuple}
+        """
+        return self._hits, self._lookups
+
+
+_resolver = None
+_resolver_mutex = threading.Lock()
+
+def getResolver():
+    """Returns the resolver shared by the whole program.
+
+    @rtype: L{Resolver}
+    """
+    global _resolver
+
+    _resolver_mutex.acquire()
+    if _resolver is None:
+        _resolver = Resolver()
+    _resolver_mutex.release()
+
+    return _resolver
+
+
+# vim: ts=4 sw=4 et
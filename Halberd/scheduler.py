@@ -0,0 +1,244 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Scheduling of scans over many targets.
+
+Scanning a long list of sites one at a time takes as many times the scan time
+as there are sites. A L{Scheduler} keeps several targets in flight at once
+while bounding the total number of parallel requests (the budget) and how
+many targets are scanned at the same time on any given host or address, so
+no single one of them gets hammered.
+
+    >>> scheduler = Scheduler(budget=32, maxperhost=1, maxperaddr=1)
+    >>> scheduler.run(tasks, finished)
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import copy
+import Queue
+import signal
+import threading
+
+import Halberd.util
+import Halberd.crew
+import Halberd.logger
+
+
+__all__ = ['Scheduler']
+
+
+class Scheduler:
+    """Runs the scans of many targets concurrently.
+
+    Targets are taken in the order they are given (so the caller decides
+    their priority) but one which can't be started yet because its host or
+    address is busy is passed over in favour of the next ones. Each target
+    is scanned by its own crew (see L{Halberd.crew.crewFactory}) in a
+    separate thread while the calling thread catches SIGINT and hands the
+    finished targets back as soon as they are done.
+
+    @ivar budget: Maximum number of parallel requests adding up all the
+    targets being scanned (a target is always started when nothing else is
+    running, even if it needs more than that). Targets tuning their own
+    parallelism count as many requests as they may reach.
+    @type budget: C{int}
+
+    @ivar maxperhost: Maximum number of targets scanned at once per host and
+    address family (so the IPv4 and IPv6 front-ends of a host are scanned at
+    the same time).
+    @type maxperhost: C{int}
+
+    @ivar maxperaddr: Maximum number of targets scanned at once per address.
+    @type maxperaddr: C{int}
+
+    @ivar interrupted: Whether the user asked to stop (pending targets are
+    dropped and the running ones stopped).
+    @type interrupted: C{bool}
+
+    @ivar prev: Previous SIGINT handler.
+    """
+    # Number of targets read in advance looking for one which can be started.
+    lookahead = 16
+
+    def __init__(self, budget, maxperhost=1, maxperaddr=1):
+        if budget < 1 or maxperhost < 1 or maxperaddr < 1:
+            raise ValueError, 'invalid scheduling limits'
+
+        self.budget = budget
+        self.maxperhost = maxperhost
+        self.maxperaddr = maxperaddr
+
+        self.interrupted = False
+        self.prev = None
+
+        self._waiting = []
+        self._running = {}
+        self._done = Queue.Queue()
+        self._load = 0
+        self._hosts = {}
+        self._addrs = {}
+
+        self.logger = Halberd.logger.getLogger()
+
+    def _setupSigHandler(self):
+        """Performs what's needed to catch SIGINT.
+        """
+        def interrupt(signum, frame):
+            """SIGINT handler
+            """
+            self.interrupted = True
+            for workcrew in self._running.values():
+                workcrew.state.setError('received SIGINT')
+
+        self.prev = signal.signal(signal.SIGINT, interrupt)
+
+    def _restoreSigHandler(self):
+        """Restore previous SIGINT handler.
+        """
+        signal.signal(signal.SIGINT, self.prev)
+
+    def isAdmissible(self, task):
+        """Tells whether a target can be started right now.
+
+        @param task: Target waiting to be scanned.
+        @type task: L{Halberd.ScanTask.ScanTask}
+
+        @rtype: C{bool}
+        """
+        if not self._running:
+            return True
+        if self._load + self._cost(task) > self.budget:
+            return False
+        if self._hosts.get(self._hostKey(task), 0) >= self.maxperhost:
+            return False
+        if self._addrs.get(task.addr, 0) >= self.maxperaddr:
+            return False
+        return True
+
+    def _hostKey(self, task):
+        """Identifies the host (and address family) of a target.
+        """
+        return (Halberd.util.hostname(task.url),
+                Halberd.util.addressFamily(task.addr))
+
+    def _cost(self, task):
+        """Maximum number of parallel requests sent by a target.
+        """
+        if task.autoparallelism:
+            return max(task.parallelism, task.max_parallelism)
+        return task.parallelism
+
+    def _account(self, task, sign):
+        """Updates the load of the host and address of a target.
+        """
+        host = self._hostKey(task)
+        self._load += sign * self._cost(task)
+        self._hosts[host] = self._hosts.get(host, 0) + sign
+        self._addrs[task.addr] = self._addrs.get(task.addr, 0) + sign
+
+    def _start(self, task):
+        """Launches the scan of a target in a new thread.
+        """
+        # Several scans run at once so no status lines are displayed.
+        quiet = copy.copy(task)
+        quiet.verbose = False
+        workcrew = Halberd.crew.crewFactory(quiet)
+        workcrew.standalone = False
+
+        def work():
+            try:
+                task.clues = workcrew.scan()
+            except Exception, msg:
+                # Make sure the scheduler hears back from this target.
+                workcrew.state.setError(str(msg))
+                task.clues = []
+            task.concurrency = workcrew.getTrajectory()
+            task.stopreason = workcrew.state.getStopReason()
+            self._done.put((task, workcrew))
+
+        self.logger.info('scanning %s (%s)', task.url, task.addr)
+
+        self._running[task] = workcrew
+        self._account(task, 1)
+
+        thread = threading.Thread(target=work, name='Crew')
+        thread.setDaemon(True)
+        thread.start()
+
+    def _schedule(self, tasks):
+        """Starts as many waiting targets as the limits allow.
+
+        @return: False once there are no more targets to read.
+        @rtype: C{bool}
+        """
+        more = True
+        while more and len(self._waiting) < self.lookahead:
+            try:
+                self._waiting.append(tasks.next())
+            except StopIteration:
+                more = False
+
+        for task in self._waiting[:]:
+            if self.isAdmissible(task):
+                self._waiting.remove(task)
+                self._start(task)
+
+        return more
+
+    def run(self, tasks, finished):
+        """Scans all the targets.
+
+        @param tasks: Targets to scan by decreasing priority. It's read
+        lazily, so it may be a generator.
+        @type tasks: C{iter}
+
+        @param finished: Called from the calling thread with the scan task
+        and its crew whenever a target is done.
+        @type finished: C{callable}
+        """
+        tasks = iter(tasks)
+        more = True
+
+        self._setupSigHandler()
+        try:
+            while True:
+                if self.interrupted:
+                    more = False
+                    self._waiting = []
+                elif more or self._waiting:
+                    more = self._schedule(tasks)
+
+                if not self._running:
+                    if not (more or self._waiting):
+                        break
+                    continue
+
+                try:
+                    # Waiting with a timeout keeps us responsive to signals.
+                    task, workcrew = self._done.get(True, 0.25)
+                except Queue.Empty:
+                    continue
+
+                del self._running[task]
+                self._account(task, -1)
+                finished(task, workcrew)
+        finally:
+            self._restoreSigHandler()
+
+
+# vim: ts=4 sw=4 et
@@ -24,9 +24,13 @@ basic functionality so more complex stuff can be built upon this.
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 
+import copy
+
 import Halberd.crew
 import Halberd.logger
+import Halberd.resolver
 import Halberd.reportlib
+import Halberd.scheduler
 import Halberd.clues.file
 import Halberd.clues.analysis as analysis
 
@@ -67,8 +71,38 @@ class BaseStrategy:
 
         self.task.clues = []
         self.task.analyzed = []
-        crew = Halberd.crew.WorkCrew(self.task)
+        crew = Halberd.crew.crewFactory(self.task)
         self.task.clues = crew.scan()
+        self.task.concurrency = crew.getTrajectory()
+        self.task.stopreason = crew.state.getStopReason()
+
+    def _scanAll(self, addrs):
+        """Scans several addresses of the target at the same time.
+
+        @param addrs: Addresses to scan.
+        @type addrs: C{list}
+
+        @return: A copy of the scan task for each address holding its results.
+        @rtype: C{list}
+        """
+        assert self.task.url and addrs
+
+        tasks = []
+        for addr in addrs:
+            task = copy.copy(self.task)
+            task.addr = addr
+            task.clues = []
+            task.analyzed = []
+            tasks.append(task)
+
+        crew = Halberd.crew.MultiCrew(tasks)
+        results = crew.scan()
+        for task, workcrew, clues in zip(tasks, crew.crews, results):
+            task.clues = clues
+            task.concurrency = workcrew.getTrajectory()
+            task.stopreason = workcrew.state.getStopReason()
+
+        return tasks
 
     def _analyze(self):
         """Performs clue analysis.
@@ -114,13 +148,16 @@ class UniScanStrategy(BaseStrategy):
 
     def execute(self):
         """Scans, analyzes and presents results coming a single target.
+
+        All of its addresses are scanned at once, then the results of each one
+        are reported separately (followed by a comparison of IPv4 and IPv6
+        when the host has both kinds of addresses).
         """
         if self.task.save:
             cluedir = Halberd.clues.file.ClueDir(self.task.save)
 
-        for self.task.addr in self.addrs:
-            self._scan()
-
+        tasks = self._scanAll(self.addrs)
+        for self.task in tasks:
             self._analyze()
             Halberd.reportlib.report(self.task)
 
@@ -129,9 +166,19 @@ class UniScanStrategy(BaseStrategy):
                              self.task.addr,
                              self.task.clues)
 
+        Halberd.reportlib.reportDualStack(tasks)
+
 class MultiScanStrategy(BaseStrategy):
     """Scan multiple URLs.
+
+    Several targets are scanned at once (see L{Halberd.scheduler.Scheduler})
+    and the results of each one are saved and reported as soon as it's done.
+    Every line of the URL file may carry a priority after the URL (targets
+    with higher priorities are scanned first, the default is 0).
     """
+    # Number of URLs whose hostnames are resolved in advance.
+    lookahead = 64
+
     def __init__(self, scantask):
         BaseStrategy.__init__(self, scantask)
 
@@ -140,20 +187,64 @@ class MultiScanStrategy(BaseStrategy):
 
         self.urlfp = open(self.task.urlfile, 'r')
 
-    def _targets(self, urlfp):
-        """Obtain target addresses from URLs.
+        # Addresses of each URL still being scanned and the scans of its
+        # addresses already finished.
+        self._pending = {}
+        self._finished = {}
+
+    def _urls(self, urlfp):
+        """Reads the URLs to scan sorted by priority.
 
         @param urlfp: File where the list of URLs is stored.
         @type urlfp: C{file}
 
-        @return: Generator providing the desired addresses.
+        @return: URLs in the order they should be scanned.
+        @rtype: C{list}
         """
-        for url in urlfp:
-            if url == '\n':
+        entries = []
+        for line in urlfp:
+            fields = line.split()
+            if not fields:
                 continue
 
-            # Strip end of line character and whitespaces.
-            url = url[:-1].strip()
+            url, priority = fields[0], 0
+            if len(fields) > 1:
+                try:
+                    priority = float(fields[1])
+                except ValueError:
+                    self.logger.warn('invalid priority for %s', url)
+            entries.append((-priority, len(entries), url))
+
+        entries.sort()
+        return [url for priority, idx, url in entries]
+
+    def _prefetch(self, urls):
+        """Starts resolving the hosts of some URLs in the background.
+
+        @param urls: URLs to be scanned soon.
+        @type urls: C{list}
+        """
+        resolver = Halberd.resolver.getResolver()
+        for url in urls:
+            host = Halberd.util.hostname(url)
+            if host:
+                resolver.prefetch(host)
+
+    def _targets(self, urls):
+        """Obtain target addresses from URLs.
+
+        Hostnames are resolved L{lookahead} URLs ahead of the one being
+        handed out so lookups overlap with the scans.
+
+        @param urls: URLs to scan.
+        @type urls: C{list}
+
+        @return: Generator providing the desired addresses.
+        """
+        self._prefetch(urls[:self.lookahead])
+
+        for idx, url in enumerate(urls):
+            self._prefetch(urls[idx + self.lookahead:idx + self.lookahead + 1])
 
             host = Halberd.util.hostname(url)
             if not host:
@@ -167,26 +258,83 @@ class MultiScanStrategy(BaseStrategy):
                 raise ScanError, 'interrupted by the user'
             self.logger.info('host lookup done.')
 
+            self._pending[url] = self._pending.get(url, 0) + len(addrs)
             for addr in addrs:
                 yield (url, addr)
 
+    def _limits(self):
+        """Splits the parallel requests among the targets scanned at once.
+
+        Both the budget and the maximum parallelism bound the requests of all
+        the targets together, so each target scanned at the same time gets an
+        equal share of them (which is as far as its parallelism may be tuned).
+
+        @return: Overall number of parallel requests, initial and maximum
+        number of parallel requests of each target.
+        @rtype: C{tuple}
+        """
+        total = min(self.task.budget, self.task.max_parallelism)
+        parallelism = max(1, min(self.task.parallelism, total))
+        share = total // (total // parallelism)
+        return total, parallelism, share
+
+    def _tasks(self, targets, parallelism, share):
+        """Makes a scan task for every target.
+
+        @param targets: Sequence of (URL, address) tuples.
+
+        @param parallelism: Initial number of parallel requests per target.
+        @type parallelism: C{int}
+
+        @param share: Maximum number of parallel requests per target.
+        @type share: C{int}
+
+        @return: Generator providing the scan tasks.
+        """
+        for url, addr in targets:
+            task = copy.copy(self.task)
+            task.url = url
+            task.addr = addr
+            task.parallelism = parallelism
+            task.max_parallelism = share
+            task.clues = []
+            task.analyzed = []
+            yield task
+
     def execute(self):
         """Launch a multiple URL scan.
         """
         cluedir = Halberd.clues.file.ClueDir(self.task.save)
 
-        for url, addr in self._targets(self.urlfp):
-            self.task.url = url
-            self.task.addr = addr
-            self.logger.info('scanning %s (%s)', url, addr)
-            self._scan()
+        def finished(task, crew):
+            err = crew.state.getError()
+            if err is not None:
+                self.logger.warn('%s (%s) finished (%s)',
+                                 task.url, task.addr, err)
 
-            cluedir.save(url, addr, self.task.clues)
+            cluedir.save(task.url, task.addr, task.clues)
 
+            self.task = task
             self._analyze()
 
             Halberd.reportlib.report(self.task)
 
+            # Once every address of the URL is done, compare IPv4 and IPv6.
+            self._finished.setdefault(task.url, []).append(task)
+            self._pending[task.url] -= 1
+            if self._pending[task.url] == 0:
+                del self._pending[task.url]
+                Halberd.reportlib.reportDualStack(
+                                        self._finished.pop(task.url))
+
+        total, parallelism, share = self._limits()
+        scheduler = Halberd.scheduler.Scheduler(total,
+                                                self.task.maxperhost,
+                                                self.task.maxperaddr)
+        urls = self._urls(self.urlfp)
+        scheduler.run(self._tasks(self._targets(urls), parallelism, share),
+                      finished)
+
 class ClueReaderStrategy(BaseStrategy):
     """Clue reader strategy.
 
@@ -0,0 +1,177 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Per-request tracing.
+
+Aggregated statistics don't tell why some requests take much longer than
+others (a slow TLS handshake, scanners queueing on the lock of the shared
+state...). When a L{Tracer} is installed, the clients and scanners record a
+span for every phase of each probe (connect, TLS handshake, send, wait for
+the first byte, read the headers and insert the clues) tagged with the thread
+that did the work. The trace is written in the Chrome trace event format, so
+it can be loaded in chrome://tracing or Perfetto.
+
+Spans are kept in a ring buffer: once it is full the oldest ones are
+dropped, so tracing long scans doesn't exhaust the memory.
+
+    >>> tracer = Tracer()
+    >>> install(tracer)
+    >>> # ... scan ...
+    >>> tracer.write('halberd.trace.json')
+
+@var active: Tracer where spans are recorded (C{None} if tracing is off).
+@type active: L{Tracer}
+
+@var default_capacity: Maximum number of spans kept.
+@type default_capacity: C{int}
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import os
+import json
+import threading
+import itertools
+import collections
+
+
+__all__ = ['Tracer', 'install', 'uninstall']
+
+
+default_capacity = 100000
+
+active = None
+
+
+class Tracer:
+    """Records spans in a bounded buffer.
+
+    Appending to a C{collections.deque} (as well as getting the next value
+    of a counter) is atomic, so recording a span doesn't need any locking.
+
+    @ivar capacity: Maximum number of spans kept.
+    @type capacity: C{int}
+    """
+    def __init__(self, capacity=default_capacity):
+        if capacity < 1:
+            raise ValueError, 'invalid trace capacity'
+
+        self.capacity = capacity
+
+        self._seq = itertools.count()
+        self._spans = collections.deque(maxlen=capacity)
+        # Thread identifier -> thread name.
+        self._threads = {}
+
+    def addSpan(self, name, start, end, **args):
+        """Records a span.
+
+        @param name: Phase of the probe (e.g. C{connect}).
+        @type name: C{str}
+
+        @param start: Time when the phase started.
+        @type start: C{float}
+
+        @param end: Time when the phase ended.
+        @type end: C{float}
+
+        @param args: Additional information shown along with the span.
+        """
+        thread = threading.currentThread()
+        tid = thread.ident
+        if tid not in self._threads:
+            self._threads[tid] = thread.getName()
+
+        self._spans.append((self._seq.next(), name, start, end, tid, args))
+
+    def getSpans(self):
+        """Returns the spans still in the buffer, oldest first.
+
+        @return: Sequence of (name, start, end, thread id, args) tuples.
+        @rtype: C{list}
+        """
+        return [span[1:] for span in list(self._spans)]
+
+    def getRecorded(self):
+        """Returns the number of spans recorded so far (including the ones
+        already dropped).
+
+        @rtype: C{int}
+        """
+        spans = list(self._spans)
+        if not spans:
+            return 0
+        return max([span[0] for span in spans]) + 1
+
+    def getEvents(self):
+        """Converts the spans into trace events.
+
+        @return: Complete events (one per span) plus metadata events naming
+        the threads.
+        @rtype: C{list}
+        """
+        pid = os.getpid()
+        spans = self.getSpans()
+
+        events = []
+        for tid, name in self._threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                           'tid': tid, 'args': {'name': name}})
+
+        for name, start, end, tid, args in spans:
+            events.append({'name': name, 'cat': 'probe', 'ph': 'X',
+                           'ts': int(start * 1e6),
+                           'dur': max(int((end - start) * 1e6), 0),
+                           'pid': pid, 'tid': tid, 'args': args})
+
+        return events
+
+    def write(self, filename):
+        """Writes the trace in the Chrome trace event format.
+
+        @param filename: Name of the output file.
+        @type filename: C{str}
+        """
+        recorded = self.getRecorded()
+        trace = {
+            'traceEvents': self.getEvents(),
+            'displayTimeUnit': 'ms',
+            'otherData': {'recorded': recorded,
+                          'dropped': max(recorded - self.capacity, 0)},
+        }
+
+        fp = open(filename, 'w')
+        json.dump(trace, fp)
+        fp.close()
+
+
+def install(tracer):
+    """Starts recording spans into a tracer.
+
+    @type tracer: L{Tracer}
+    """
+    global active
+    active = tracer
+
+def uninstall():
+    """Stops tracing.
+    """
+    global active
+    active = None
+
+
+# vim: ts=4 sw=4 et
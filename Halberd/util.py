@@ -27,6 +27,8 @@ import time
 import socket
 import urlparse
 
+import Halberd.resolver
+
 
 table = '________________________________________________0123456789_______ABCDEFGHIJKLMNOPQRSTUVWXYZ______abcdefghijklmnopqrstuvwxyz_____________________________________________________________________________________________________________________________________'
 
@@ -59,25 +61,45 @@ def hostname(url):
     if netloc == '':
         return ''
 
+    if netloc.startswith('['):
+        # IPv6 literal.
+        return netloc[1:].split(']', 1)[0]
+
     return netloc.split(':', 1)[0]
 
-def addresses(host):
+def addressFamily(addr):
+    """Tells the address family of a network address.
+
+    @param addr: IPv4 or IPv6 address.
+    @type addr: C{str}
+
+    @return: C{socket.AF_INET6} for IPv6 addresses, C{socket.AF_INET}
+    otherwise.
+    @rtype: C{int}
+    """
+    if ':' in addr:
+        return socket.AF_INET6
+    return socket.AF_INET
+
+def addresses(host, family=socket.AF_UNSPEC):
     """Get the network addresses to which a given host resolves to.
 
+    Answers come from the shared resolver (see
+    L{Halberd.resolver.getResolver}) so they may have been prefetched.
+
     @param host: Hostname we want to resolve.
     @type host: C{str}
 
+    @param family: Address family (by default both IPv4 and IPv6 addresses
+    are returned).
+    @type family: C{int}
+
     @return: Network addresses.
-    @rtype: C{tuple}
+    @rtype: C{list}
     """
     assert host != ''
 
-    try:
-        name, aliases, addrs = socket.gethostbyname_ex(host)
-    except socket.error:
-        return ()
-
-    return addrs
+    return list(Halberd.resolver.getResolver().resolve(host, family))
 
 
 if __name__ == '__main__':
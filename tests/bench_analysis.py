@@ -0,0 +1,103 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Benchmark of the clue analysis.
+
+Builds a large set of clues out of the C{tests/data} corpora (as if the same
+real servers had been monitored for a long time, with their clocks drifting
+a little) and measures how long L{Halberd.clues.analysis.analyze} takes on a
+list of clues and on a L{Halberd.clues.store.ClueStore} (with each of the
+available backends), along with the memory needed to hold them.
+
+Run it from the top source directory::
+
+    $ PYTHONPATH=. python tests/bench_analysis.py [NUM]
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import os
+import sys
+import copy
+import glob
+import time
+import random
+
+import Halberd.clues.file
+import Halberd.clues.store
+import Halberd.clues.analysis as analysis
+from Halberd.clues.store import ClueStore
+
+from tests.bench_clue import sizeOf
+
+
+def makeClues(num):
+    """Replicates the clues of the corpora.
+    """
+    base = []
+    for filename in sorted(glob.glob(os.path.join('tests', 'data', '*.clu'))):
+        base.extend(Halberd.clues.file.load(filename))
+
+    rand = random.Random(0)
+    clues = []
+    for i in xrange(num):
+        clue = copy.copy(base[i % len(base)])
+        elapsed = i // len(base)
+        clue._local += elapsed
+        clue._remote += elapsed
+        clue.diff += rand.choice((-1, 0, 0, 0, 1))
+        clues.append(clue)
+
+    return clues
+
+def timeIt(func, *args):
+    """Runs a function.
+
+    @return: Seconds taken and the result.
+    @rtype: C{tuple}
+    """
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+def main(argv):
+    num = 100000
+    if len(argv) > 1:
+        num = int(argv[1])
+
+    clues = makeClues(num)
+    elapsed, store = timeIt(ClueStore, clues)
+    sys.stdout.write('%d clues (%.2fs to build the store)\n' % (num, elapsed))
+
+    cases = [('list', clues, None)]
+    for backend in Halberd.clues.store.backends:
+        cases.append(('store (%s)' % backend, store, backend))
+
+    sys.stdout.write('%14s %10s %10s\n' % ('', 'analysis', 'memory'))
+    for name, data, backend in cases:
+        if backend:
+            data.backend = backend
+        elapsed, analyzed = timeIt(analysis.analyze, data)
+        sys.stdout.write('%14s %9.2fs %9.1fM\n'
+                         % (name, elapsed, sizeOf(data, set()) / 1048576.0))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
+
+
+# vim: ts=4 sw=4 et
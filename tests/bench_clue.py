@@ -0,0 +1,152 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Benchmark of the parsing of replies into clues.
+
+Measures how many replies per second L{Halberd.clues.Clue.Clue.parse} gets
+through using the headers stored in the C{tests/data} corpora. The original
+parser (a C{getattr} call per header plus string concatenation before
+hashing) is included for comparison. The memory taken by each clue once all
+of the corpora are loaded is reported too.
+
+Run it from the top source directory::
+
+    $ PYTHONPATH=. python tests/bench_clue.py
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import os
+import sys
+import glob
+import time
+import types
+import hashlib
+
+import Halberd.clues.file
+from Halberd.clues.Clue import Clue
+
+
+class Concatenator:
+    """Accumulates the digested headers in a string, as it used to be done.
+    """
+    def __init__(self):
+        self.data = ''
+
+    def update(self, data):
+        self.data += data
+
+
+class LegacyClue(Clue):
+    """The parser as it was.
+    """
+    def parse(self, headers):
+        self.headers = headers
+
+        self._Clue__sha = acc = Concatenator()
+        for name, value in self.headers:
+            try:
+                handlerfn = getattr(self, '_get_' + Clue.normalize(name))
+                handlerfn(value)
+            except AttributeError:
+                acc.data += '%s: %s ' % (name, value)
+
+        self.info['digest'] = hashlib.sha1(acc.data).hexdigest()
+        self._Clue__sha = None
+        self._calcDiff()
+
+
+def loadReplies(path):
+    """Reads the headers of every clue in the corpora.
+    """
+    replies = []
+    for filename in sorted(glob.glob(os.path.join(path, '*.clu'))):
+        for clue in Halberd.clues.file.load(filename):
+            replies.append(clue.headers)
+    return replies
+
+def sizeOf(obj, seen):
+    """Adds up the memory used by an object and everything it refers to.
+
+    Objects already in C{seen} (i.e. shared with others) are not counted
+    again. Classes and functions are left out.
+    """
+    if id(obj) in seen or isinstance(obj, (types.ClassType, type,
+                                           types.FunctionType)):
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            size += sizeOf(key, seen) + sizeOf(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += sizeOf(item, seen)
+    else:
+        if hasattr(obj, '__dict__'):
+            size += sizeOf(obj.__dict__, seen)
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if name.startswith('__') and not name.endswith('__'):
+                    name = '_%s%s' % (cls.__name__, name)
+                if hasattr(obj, name):
+                    size += sizeOf(getattr(obj, name), seen)
+
+    return size
+
+def run(cls, replies, rounds):
+    """Parses every reply a number of times.
+
+    @return: Replies parsed per second.
+    @rtype: C{float}
+    """
+    start = time.time()
+    for i in xrange(rounds):
+        for headers in replies:
+            cls().parse(headers)
+    elapsed = time.time() - start
+
+    return rounds * len(replies) / elapsed
+
+def main(argv):
+    replies = loadReplies(os.path.join('tests', 'data'))
+
+    for headers in replies:
+        legacy, clue = LegacyClue(), Clue()
+        legacy.parse(headers)
+        clue.parse(headers)
+        assert legacy == clue
+
+    sys.stdout.write('%d replies, %d headers\n'
+                     % (len(replies), sum([len(h) for h in replies])))
+    for name, cls in (('legacy', LegacyClue), ('current', Clue)):
+        sys.stdout.write('%8s %10.0f replies/s\n'
+                         % (name, run(cls, replies, 20)))
+
+    clues = []
+    for filename in sorted(glob.glob(os.path.join('tests', 'data', '*.clu'))):
+        clues.extend(Halberd.clues.file.load(filename))
+    sys.stdout.write('%8s %10.0f bytes/clue\n'
+                     % ('memory', float(sizeOf(clues, set())) / len(clues)))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
+
+
+# vim: ts=4 sw=4 et
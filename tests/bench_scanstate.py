@@ -0,0 +1,122 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Benchmark of the clue accumulator shared by scanner threads.
+
+Measures how many clues per second a number of threads can insert into a
+L{Halberd.crew.ScanState} depending on how many different clues there are.
+The original list based accumulator is included for comparison.
+
+Run it from the top source directory::
+
+    $ PYTHONPATH=. python tests/bench_scanstate.py
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import sys
+import time
+import threading
+
+import Halberd.crew as crew
+import Halberd.clues.Clue
+
+
+class ListState:
+    """The accumulator as it was: a list searched under a single lock.
+    """
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.clues = []
+
+    def insertClue(self, clue):
+        self.mutex.acquire()
+        try:
+            idx = self.clues.index(clue)
+            self.clues[idx].incCount(clue.getCount())
+        except ValueError:
+            self.clues.append(clue)
+        self.mutex.release()
+
+
+def makeClues(num, distinct):
+    clues = []
+    for i in xrange(num):
+        clue = Halberd.clues.Clue.Clue()
+        clue.parse('Server: server-%d\r\n' % (i % distinct))
+        clues.append(clue)
+    return clues
+
+def run(kind, nthreads, clues):
+    """Inserts the clues using a number of threads.
+
+    @return: Clues inserted per second.
+    @rtype: C{float}
+    """
+    if kind == 'list':
+        state = ListState()
+    else:
+        state = crew.ScanState()
+
+    def work(clues):
+        if kind == 'buffered':
+            buf = crew.ClueBuffer(state)
+            for clue in clues:
+                buf.add(clue)
+            buf.flush()
+        else:
+            for clue in clues:
+                state.insertClue(clue)
+
+    share = len(clues) // nthreads
+    threads = [threading.Thread(target=work,
+                                args=(clues[i * share:(i + 1) * share],))
+               for i in xrange(nthreads)]
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    return share * nthreads / elapsed
+
+def main(argv):
+    num = 16000
+    kinds = ('list', 'dict', 'buffered')
+
+    sys.stdout.write('%8s %8s' % ('distinct', 'threads'))
+    for kind in kinds:
+        sys.stdout.write(' %12s' % kind)
+    sys.stdout.write('   (clues/s)\n')
+
+    for distinct in (1, 100, 1000, 4000):
+        for nthreads in (1, 2, 4, 8):
+            sys.stdout.write('%8d %8d' % (distinct, nthreads))
+            for kind in kinds:
+                clues = makeClues(num, distinct)
+                sys.stdout.write(' %12.0f' % run(kind, nthreads, clues))
+                sys.stdout.flush()
+            sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv)
+
+
+# vim: ts=4 sw=4 et
@@ -0,0 +1,150 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Local HTTP server used by the test suite.
+
+The server is bound to localhost only so the tests don't need to connect to
+external hosts.
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import os
+import sys
+import ssl
+import socket
+import threading
+import SocketServer
+import BaseHTTPServer
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Replies to every GET with a small page.
+
+    The way the body is delimited depends on the requested path: C{/chunked}
+    uses the chunked transfer-coding, C{/close} closes the connection and
+    anything else sends a Content-Length header.
+
+    HEAD requests are refused for C{/nohead} and C{/close}, range requests are
+    honoured everywhere but C{/close}.
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    body = '<html><body>halberd</body></html>\n'
+
+    def do_HEAD(self):
+        if self.path in ('/nohead', '/close'):
+            self.send_response(405)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+
+    def do_GET(self):
+        if self.headers.get('Range') == 'bytes=0-0' and self.path != '/close':
+            self.send_response(206)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Range', 'bytes 0-0/%d' % len(self.body))
+            self.send_header('Content-Length', '1')
+            self.end_headers()
+            self.wfile.write(self.body[0])
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        if self.path == '/chunked':
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for piece in (self.body[:10], self.body[10:]):
+                self.wfile.write('%x\r\n%s\r\n' % (len(piece), piece))
+            self.wfile.write('0\r\n\r\n')
+        elif self.path == '/close':
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write(self.body)
+            self.close_connection = 1
+        else:
+            self.send_header('Content-Length', str(len(self.body)))
+            self.end_headers()
+            self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threaded HTTP server listening on an ephemeral port of localhost.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    address = '127.0.0.1'
+
+    def __init__(self, handler=Handler):
+        BaseHTTPServer.HTTPServer.__init__(self, (self.address, 0), handler)
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.setDaemon(True)
+
+    def handle_error(self, request, client_address):
+        # Clients are free to drop connections at any time.
+        if not issubclass(sys.exc_info()[0], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+    def getURL(self):
+        return 'http://localhost:%d/' % self.server_address[1]
+
+    def getAddress(self):
+        return self.server_address[0]
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class Server6(Server):
+    """Same as L{Server} but listening on the IPv6 loopback address.
+    """
+    address_family = socket.AF_INET6
+    address = '::1'
+
+    def getURL(self):
+        return 'http://[::1]:%d/' % self.server_address[1]
+
+
+class SecureServer(Server):
+    """Same as L{Server} but speaking HTTPS with a self-signed certificate.
+    """
+    certfile = os.path.join(os.path.dirname(__file__), 'data', 'localhost.pem')
+
+    def __init__(self, handler=Handler):
+        Server.__init__(self, handler)
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        context.load_cert_chain(self.certfile)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    def getURL(self):
+        return 'https://localhost:%d/' % self.server_address[1]
+
+
+# vim: ts=4 sw=4 et
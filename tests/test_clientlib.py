@@ -20,11 +20,16 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 
+import ssl
+import hashlib
 import unittest
 import urlparse
 
+import Halberd.ScanTask
 import Halberd.clientlib as clientlib
 
+import tests.httpserver as httpserver
+
 # TODO - Implement an HTTPServer so the test suite doesn't need to connect to
 # external hosts.
 # This HTTPServer must be bound only to localhost (for security reasons).
@@ -84,8 +89,8 @@ class TestHTTPClient(unittest.TestCase):
 
     def testSendRequestToRemote(self):
         self.client._putRequest('66.35.250.203', 'http://www.sourceforge.net')
-        timestamp, headers = self.client._getReply()
-        self.failUnless(headers and headers.startswith('HTTP/'))
+        timestamp, status, headers = self.client._getReply()
+        self.failUnless(status.startswith('HTTP/') and headers)
 
     def testGetHeaders(self):
         addr, url = '66.35.250.203', 'http://www.sourceforge.net'
@@ -101,12 +106,189 @@ class TestHTTPClient(unittest.TestCase):
         addr, url = '127.0.0.1', 'http://localhost'
         self.client._putRequest(addr, url)
         try:
-            timestamp, headers = self.client._getReply()
+            timestamp, status, headers = self.client._getReply()
         except clientlib.TimedOut, msg:
             self.fail('Timed out while trying to read terminator')
         self.failUnless(headers)
 
 
+class TestReply(unittest.TestCase):
+
+    def setUp(self):
+        self.server = httpserver.Server()
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def testByteByByte(self):
+        client = clientlib.HTTPClient()
+        client.bufsize = 1
+        reply = client.getHeaders('127.0.0.1', self.server.getURL())
+        self.failUnlessEqual(reply.status, 'HTTP/1.1 200 OK')
+        self.failUnlessEqual([name for name, value in reply.headers],
+                             ['Server', 'Date', 'Content-Type',
+                              'Content-Length'])
+        self.failUnlessEqual(reply.headers[-1], ('Content-Length', ' 34'))
+
+        self.failUnless(reply.started <= reply.connected <= reply.timestamp
+                        <= reply.completed)
+        self.failUnless(reply.bytesin > 0 and reply.bytesout > 0)
+
+    def testHeadersTooLarge(self):
+        class SmallClient(clientlib.HTTPClient):
+            maxheaders = 64
+
+        self.failUnlessRaises(clientlib.HeadersTooLarge,
+                              SmallClient().getHeaders, '127.0.0.1',
+                              self.server.getURL())
+
+    def testBufferGrows(self):
+        class SmallClient(clientlib.HTTPClient):
+            bufsize = 16
+
+        client = SmallClient()
+        self.failUnlessEqual(len(client._buf), 16)
+        reply = client.getHeaders('127.0.0.1', self.server.getURL())
+        self.failUnlessEqual(reply.getCode(), '200')
+        self.failUnless(16 < len(client._buf) <= client.maxheaders)
+
+    def testSplitReply(self):
+        client = clientlib.HTTPClient()
+        data = 'xxHTTP/1.0 200 OK\r\nServer: test\r\nbogus\nX-A:b:c\r\n\r\n'
+        client._buf[:len(data)] = data
+        end = data.index('\r\n\r\n')
+        status, headers = client._splitReply(2, end)
+        self.failUnlessEqual(status, 'HTTP/1.0 200 OK')
+        self.failUnlessEqual(headers, [('Server', ' test'), ('X-A', 'b:c')])
+        self.failUnlessRaises(clientlib.UnknownReply, client._splitReply,
+                              0, end)
+
+
+class TestKeepAlive(unittest.TestCase):
+
+    def setUp(self):
+        self.server = httpserver.Server()
+        self.server.start()
+
+        self.client = clientlib.HTTPClient()
+        self.client.keepalive = True
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def fetch(self, path, times=3):
+        url = self.server.getURL() + path[1:]
+        connids = []
+        for i in xrange(times):
+            reply = self.client.getHeaders('127.0.0.1', url)
+            self.failUnlessEqual(reply.headers[0][0], 'Server')
+            self.failUnlessEqual(reply.connid, self.client.connid)
+            connids.append(reply.connid)
+        return connids
+
+    def testContentLength(self):
+        connids = self.fetch('/')
+        self.failUnlessEqual(len(set(connids)), 1)
+
+    def testChunked(self):
+        connids = self.fetch('/chunked')
+        self.failUnlessEqual(len(set(connids)), 1)
+
+    def testClose(self):
+        connids = self.fetch('/close')
+        self.failUnlessEqual(len(set(connids)), 3)
+
+    def pipeline(self, path, depth=5):
+        url = self.server.getURL() + path[1:]
+        replies = self.client.getPipelined('127.0.0.1', url, depth)
+        for reply in replies:
+            self.failUnlessEqual(reply.headers[0][0], 'Server')
+        return len(replies)
+
+    def testPipelined(self):
+        self.failUnlessEqual(self.pipeline('/'), 5)
+        self.failUnlessEqual(self.pipeline('/chunked'), 5)
+
+    def testPipelineRefused(self):
+        self.failUnlessEqual(self.pipeline('/close'), 1)
+
+
+class TestProbes(unittest.TestCase):
+
+    def setUp(self):
+        self.server = httpserver.Server()
+        self.server.start()
+
+        self.client = clientlib.HTTPClient()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def fetch(self, probe, path='/'):
+        self.client.probe = probe
+        url = self.server.getURL() + path[1:]
+        return self.client.getHeaders('127.0.0.1', url)
+
+    def testHead(self):
+        self.client.keepalive = True
+        for i in xrange(3):
+            self.failUnlessEqual(self.fetch('head').getCode(), '200')
+        self.failUnless(self.client._connected)
+
+    def testRange(self):
+        self.client.keepalive = True
+        for i in xrange(3):
+            self.failUnlessEqual(self.fetch('range').getCode(), '206')
+        self.failUnless(self.client._connected)
+
+    def testAbort(self):
+        self.client.keepalive = True
+        connids = set()
+        for i in xrange(3):
+            self.failUnlessEqual(self.fetch('abort').getCode(), '200')
+            connids.add(self.client.connid)
+        self.failUnlessEqual(len(connids), 3)
+
+    def testSelectProbe(self):
+        task = Halberd.ScanTask.ScanTask()
+        task.addr = '127.0.0.1'
+        task.probe = 'auto'
+
+        task.url = self.server.getURL()
+        self.failUnlessEqual(clientlib._detectProbe(task), 'head')
+        task.url = self.server.getURL() + 'nohead'
+        self.failUnlessEqual(clientlib._detectProbe(task), 'range')
+        task.url = self.server.getURL() + 'close'
+        self.failUnlessEqual(clientlib._detectProbe(task), 'abort')
+
+        # The strategy is remembered for the whole target.
+        self.failUnlessEqual(clientlib.selectProbe(task), 'abort')
+        task.url = self.server.getURL()
+        self.failUnlessEqual(clientlib.selectProbe(task), 'abort')
+
+        task.probe = 'get'
+        self.failUnlessEqual(clientlib.selectProbe(task), 'get')
+
+    def testSelectProbeUnreachable(self):
+        task = Halberd.ScanTask.ScanTask()
+        task.addr = '127.0.0.1'
+        task.probe = 'auto'
+        task.url = 'http://127.0.0.1:1/'
+
+        # Nothing is remembered until the target can be examined...
+        self.failUnlessEqual(clientlib.selectProbe(task), 'get')
+        key = (task.addr, 'http', '127.0.0.1:1')
+        self.failIf(clientlib._tolerated.has_key(key))
+
+        # ...or it has been tried too many times.
+        for i in xrange(clientlib._maxdetections - 1):
+            self.failUnlessEqual(clientlib.selectProbe(task), 'get')
+        self.failUnlessEqual(clientlib._tolerated[key], 'get')
+
+
 class TestHTTPSClient(unittest.TestCase):
 
     def setUp(self):
@@ -131,8 +313,140 @@ class TestHTTPSClient(unittest.TestCase):
 
     def testSendRequestToRemote(self):
         self.client._putRequest('66.35.250.203', 'https://www.sourceforge.net')
-        timestamp, headers = self.client._getReply()
-        self.failUnless(headers != None and headers.startswith('HTTP/'))
+        timestamp, status, headers = self.client._getReply()
+        self.failUnless(status.startswith('HTTP/') and headers)
+
+
+class TestRTTEstimator(unittest.TestCase):
+
+    def setUp(self):
+        self.estimator = clientlib.RTTEstimator(2, 0.25, 30)
+
+    def testUpdate(self):
+        self.estimator.update(1.0)
+        self.failUnlessEqual(self.estimator.getTimeout(), 1.0 + 4 * 0.5)
+
+        for i in xrange(100):
+            self.estimator.update(1.0)
+        self.failUnlessAlmostEqual(self.estimator.srtt, 1.0)
+        self.failUnless(self.estimator.getTimeout() < 1.1)
+
+    def testBounds(self):
+        self.estimator.update(0.001)
+        self.failUnlessEqual(self.estimator.getTimeout(), 0.25)
+        self.estimator.update(100)
+        self.failUnlessEqual(self.estimator.getTimeout(), 30)
+
+    def testBackoff(self):
+        timeout = self.estimator.getTimeout()
+        # Several operations expiring at once only count once.
+        for i in xrange(5):
+            self.estimator.backoff(timeout)
+        self.failUnlessEqual(self.estimator.getTimeout(), 2 * timeout)
+
+        # A new sample resets the timeout.
+        self.estimator.update(0.5)
+        self.failUnlessEqual(self.estimator.getTimeout(), 0.5 + 4 * 0.25)
+
+    def testSamples(self):
+        server = httpserver.Server()
+        server.start()
+        try:
+            client = clientlib.HTTPClient()
+            client.estimator = self.estimator
+            client.getHeaders('127.0.0.1', server.getURL())
+            client.close()
+        finally:
+            server.stop()
+
+        self.failIf(self.estimator.srtt is None)
+        self.failUnlessEqual(client.timeout, 2)
+        self.failUnless(self.estimator.getTimeout() < 2)
+
+    def testShared(self):
+        self.failUnless(clientlib.getEstimator('127.0.0.1')
+                        is clientlib.getEstimator('127.0.0.1'))
+
+
+class TestTLSHandshakes(unittest.TestCase):
+
+    def setUp(self):
+        self.server = httpserver.SecureServer()
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def fetch(self):
+        client = clientlib.HTTPSClient()
+        try:
+            return client.getHeaders('127.0.0.1', self.server.getURL())
+        finally:
+            client.close()
+
+    def testHandshakes(self):
+        reply = self.fetch()
+        self.failUnlessEqual(reply.getCode(), '200')
+        self.failUnlessEqual(reply.handshake, 'full')
+        # Nothing is resumed: every connection costs a full handshake.
+        self.failUnlessEqual(self.fetch().handshake, 'full')
+
+    def testKeepAlive(self):
+        client = clientlib.HTTPSClient()
+        client.keepalive = True
+        first = client.getHeaders('127.0.0.1', self.server.getURL())
+        second = client.getHeaders('127.0.0.1', self.server.getURL())
+        client.close()
+
+        self.failUnlessEqual(second.getCode(), '200')
+        self.failUnless(first.handshake is not None)
+        self.failUnless(second.handshake is None)
+
+    def testContextIsShared(self):
+        self.failUnless(clientlib._getContext() is clientlib._getContext())
+
+
+class TestTLSClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = httpserver.SecureServer()
+        self.server.start()
+
+        self.client = clientlib.TLSClient()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def testFingerprint(self):
+        first = self.client.getHeaders('127.0.0.1', self.server.getURL())
+        second = self.client.getHeaders('127.0.0.1', self.server.getURL())
+
+        self.failUnlessEqual(first.headers[1:], second.headers[1:])
+        self.failIfEqual(first.connid, second.connid)
+        self.failUnlessEqual(second.handshake, 'full')
+
+        names = [name for name, value in first.headers]
+        self.failUnlessEqual(names, ['Date', 'TLS-Version', 'TLS-Cipher',
+                                     'TLS-Certificate'])
+
+        pem = open(self.server.certfile).read()
+        end = '-----END CERTIFICATE-----'
+        der = ssl.PEM_cert_to_DER_cert(pem[:pem.index(end) + len(end)])
+        self.failUnlessEqual(first.headers[-1][1].strip(),
+                             hashlib.sha1(der).hexdigest())
+
+    def testEstimator(self):
+        self.client.estimator = clientlib.RTTEstimator()
+        self.client.getHeaders('127.0.0.1', self.server.getURL())
+        self.failIf(self.client.estimator.srtt is None)
+
+    def testRequiresHTTPS(self):
+        task = Halberd.ScanTask.ScanTask()
+        task.url = 'http://localhost/'
+        task.probe = 'tls'
+        self.failUnlessRaises(clientlib.InvalidURL, clientlib.clientFactory,
+                              task)
 
 
 if __name__ == '__main__':
@@ -20,9 +20,14 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 
+import copy
+import pickle
+import hashlib
 import unittest
+import threading
 
 from Halberd.clues.Clue import Clue
+from Halberd.clientlib import Reply
 
 
 class TestClue(unittest.TestCase):
@@ -51,6 +56,81 @@ class TestClue(unittest.TestCase):
         value = '*content/location123'
         self.failUnless(Clue.normalize(value) == '_content_location123')
 
+    def testParseReply(self):
+        headers = 'Date: Tue, 24 Feb 2004 17:09:05 GMT\r\nServer: blah\r\n\r\n'
+        self.clue.setTimestamp(1077642545)
+        self.clue.parse(headers)
+
+        reply = Reply('HTTP/1.1 200 OK',
+                      [('Date', ' Tue, 24 Feb 2004 17:09:05 GMT'),
+                       ('Server', ' blah')], 1077642545)
+        other = Clue()
+        other.parse(reply)
+
+        self.failUnlessEqual(other.headers, self.clue.headers)
+        self.failUnlessEqual(other, self.clue)
+
+    def testDigest(self):
+        headers = [('Server', ' blah'), ('ETag', ' "1234"'),
+                   ('X-Cache', ' MISS'), ('X-Request-Id', ' 42')]
+        self.clue.parse(headers)
+        self.failUnlessEqual(self.clue.info['digest'], hashlib.sha1(
+            ' blahX-Cache:  MISS X-Request-Id:  42 ').hexdigest())
+
+        other = Clue()
+        other.parse(headers, set(['x_request_id']))
+        self.failUnlessEqual(other.info['digest'], hashlib.sha1(
+            ' blahX-Cache:  MISS ').hexdigest())
+
+    def testCompact(self):
+        headers = 'Server: blah\r\nSet-Cookie: a=1\r\nSet-Cookie: b=2\r\n'
+        self.clue.parse(headers)
+        other = Clue()
+        other.parse(headers)
+
+        self.failUnless(other.headers is self.clue.headers)
+        self.failUnless(other.getDigest() is self.clue.getDigest())
+        self.failIf(hasattr(self.clue, '__dict__'))
+
+        self.failUnlessEqual(self.clue.info['server'], ' blah')
+        self.failUnlessEqual(self.clue.info['cookies'], (' a=1', ' b=2'))
+        self.failUnlessEqual(self.clue.info['digest'], self.clue.getDigest())
+        self.clue.info['digest'] = 'x'
+        self.failUnlessEqual(self.clue.getDigest(), 'x')
+        self.failUnlessRaises(KeyError, self.clue.info.__getitem__, 'foo')
+
+    def testCompactThreads(self):
+        headers = ['Server: threads\r\nX-Id: %d\r\n' % idx
+                   for idx in range(50)]
+        clues = []
+
+        def parse():
+            for text in headers:
+                clue = Clue()
+                clue.parse(text)
+                clues.append(clue)
+
+        threads = [threading.Thread(target=parse) for idx in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        shared = {}
+        for clue in clues:
+            first = shared.setdefault(clue.headers, clue.headers)
+            self.failUnless(clue.headers is first)
+
+    def testCopy(self):
+        self.clue.parse('Server: blah\r\n')
+        self.clue.conns[3] = 1
+        for other in (copy.copy(self.clue),
+                      pickle.loads(pickle.dumps(self.clue))):
+            self.failUnlessEqual(other, self.clue)
+            self.failUnlessEqual(other.headers, self.clue.headers)
+            self.failUnlessEqual(other.conns, {3: 1})
+            self.failUnlessEqual(other.getCount(), 1)
+
     def testRecompute(self):
         # Check for invalid digest computations.
         self.clue.parse('Test: abc\r\nSomething: blah\r\n\r\n')
@@ -26,6 +26,8 @@ import unittest
 import Halberd.ScanTask
 import Halberd.clues.file
 import Halberd.clues.analysis as analysis
+from Halberd.clues.Clue import Clue
+from Halberd.clues.store import ClueStore
 
 
 class TestAnalysis(unittest.TestCase):
@@ -108,6 +110,37 @@ class TestAnalysis(unittest.TestCase):
     def testCdrom(self):
         self.analyze('www.cdrom.com', 4, 2)
 
+    def testSplitProxy(self):
+        # Same remote time and digest but time differences far apart: the
+        # proxy section is split in two instead of being dropped.
+        clues = []
+        for local in (1000, 1010):
+            clue = Clue()
+            clue.setTimestamp(local)
+            clue.parse('Server: proxy\r\nDate: Thu, 01 Jan 1970 00:16:40 GMT')
+            clues.append(clue)
+        clues[1].incCount(2)
+
+        filtered = analysis.filter_proxies(clues)
+        self.failUnlessEqual(sorted([c.diff for c in filtered]),
+                             sorted([c.diff for c in clues]))
+        self.failUnlessEqual(self._hits(filtered), 4)
+
+        store = analysis.filter_proxies(ClueStore(clues))
+        self.failUnlessEqual(len(store), 2)
+        self.failUnlessEqual(len(analysis.analyze(clues)),
+                             len(analysis.analyze(ClueStore(clues))))
+
+    def testBalancing(self):
+        one, other = self._getClues('www.cdrom.com')[:2]
+        self.failUnless(analysis.balancing([one, other]) is None)
+
+        one.conns, other.conns = {1: 5}, {2: 3}
+        self.failUnlessEqual(analysis.balancing([one, other]), 'L4')
+
+        other.conns[1] = 2
+        self.failUnlessEqual(analysis.balancing([one, other]), 'L7')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -21,6 +21,7 @@
 
 
 import os
+import shutil
 import unittest
 
 import Halberd.clues.file
@@ -65,6 +66,24 @@ class TestStorage(unittest.TestCase):
         self.failUnless(len(clues) == 1)
         self.failUnless(clues[0] == self.clue)
 
+    def testClueDirIPv6(self):
+        root = os.path.join('tests', 'data', 'cluedir')
+        try:
+            cluedir = Halberd.clues.file.ClueDir(root)
+            cluedir.save('http://[2001:DB8::1]:8080/', '2001:DB8:0::1',
+                         [self.clue])
+            cluedir.save('http://[2001:DB8::1]:8080/', '127.0.0.1',
+                         [self.clue])
+            urldir = os.path.join(root, 'http____2001_DB8__1__8080_')
+            self.failUnlessEqual(sorted(os.listdir(urldir)),
+                                 ['127_0_0_1.clu', '2001_db8__1.clu'])
+            clues = Halberd.clues.file.load(os.path.join(urldir,
+                                                         '2001_db8__1.clu'))
+        finally:
+            shutil.rmtree(root, True)
+
+        self.failUnless(clues[0] == self.clue)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,170 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Unit tests for Halberd.clues.store
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+
+import os
+import copy
+import glob
+import pickle
+import random
+import unittest
+
+import Halberd.clues.file
+import Halberd.clues.store
+import Halberd.clues.analysis as analysis
+from Halberd.clues.store import ClueStore
+
+
+def summary(clues, ordered=False):
+    result = [(c.getDigest(), c.diff, c.getCount(), c.headers, c._remote,
+               sorted(c.conns.items())) for c in clues]
+    if not ordered:
+        result.sort()
+    return result
+
+
+class TestClueStore(unittest.TestCase):
+
+    def setUp(self):
+        pattern = os.path.join('tests', 'data', '*.clu')
+        self.filenames = sorted(glob.glob(pattern))
+
+    def testRoundTrip(self):
+        clues = Halberd.clues.file.load(self.filenames[0])
+        clues[0].conns[7] = 2
+        store = ClueStore(clues)
+        self.failUnlessEqual(len(store), len(clues))
+
+        rebuilt = store.toClues()
+        self.failUnlessEqual(summary(rebuilt), summary(clues))
+        for clue, other in zip(clues, rebuilt):
+            self.failUnlessEqual(dict(clue.info), dict(other.info))
+
+    def testPack(self):
+        clues = Halberd.clues.file.load(self.filenames[0])
+        clues[1].conns[3] = 1
+        half = len(clues) // 2
+
+        sender, receiver = ClueStore(), ClueStore()
+        sent = (0, 0)
+        rebuilt = []
+        for batch in (clues[:half], clues[half:]):
+            sender.extend(batch)
+            packed, sent = sender.pack(sent)
+            sender.clear()
+            packed = pickle.loads(pickle.dumps(packed, 2))
+
+            receiver.unpack(packed)
+            rebuilt.extend(receiver.toClues())
+            receiver.clear()
+
+        self.failUnlessEqual(sent, (len(sender.digests),
+                                    len(sender.headersets)))
+        self.failUnlessEqual(summary(rebuilt, True), summary(clues, True))
+
+    def testLoadStore(self):
+        store = Halberd.clues.file.loadStore(self.filenames[0])
+        clues = Halberd.clues.file.load(self.filenames[0])
+        self.failUnlessEqual(summary(store.toClues()), summary(clues))
+
+    def testAnalysis(self):
+        for filename in self.filenames:
+            clues = Halberd.clues.file.load(filename)
+            store = ClueStore(clues)
+            for step in (analysis.uniq, analysis.filter_proxies,
+                         analysis.analyze):
+                self.failUnlessEqual(summary(step(store).toClues()),
+                                     summary(step(clues)))
+
+    def testAnalysisPerturbed(self):
+        # Shuffled clues plus copies shifted by more than the proxy delta
+        # (so proxy sections get split).
+        rand = random.Random(0)
+        for filename in self.filenames:
+            clues = Halberd.clues.file.load(filename)
+            for idx, clue in enumerate(clues[:]):
+                shifted = copy.copy(clue)
+                shifted.diff += 10 * (idx % 3 + 1)
+                clues.append(shifted)
+            rand.shuffle(clues)
+
+            for backend in Halberd.clues.store.backends:
+                store = ClueStore(clues, backend=backend)
+                for step in (analysis.uniq, analysis.filter_proxies,
+                             analysis.analyze):
+                    self.failUnlessEqual(summary(step(store).toClues()),
+                                         summary(step(clues)))
+
+    def testClusters(self):
+        clues = analysis.uniq(Halberd.clues.file.load(self.filenames[0]))
+        for cluster in analysis.clusters(ClueStore(clues)):
+            self.failUnless(isinstance(cluster, ClueStore))
+            self.failUnless(1 <= len(cluster) <= 3)
+
+    def testMergeConns(self):
+        clue = Halberd.clues.file.load(self.filenames[0])[0]
+        clue.conns[1] = 2
+        store = ClueStore([clue, clue])
+        merged = store.uniq().toClues()
+        self.failUnlessEqual(len(merged), 1)
+        self.failUnlessEqual(merged[0].getCount(), 2 * clue.getCount())
+        self.failUnlessEqual(merged[0].conns, {1: 4})
+
+    def testBackends(self):
+        self.failUnlessEqual(Halberd.clues.store.default_backend,
+                             Halberd.clues.store.backends[0])
+        self.failUnlessRaises(ValueError, ClueStore, backend='fortran')
+
+        store = ClueStore(backend='python')
+        self.failUnlessEqual(store.uniq().backend, 'python')
+        self.failUnlessEqual(len(store.analyze()), 0)
+
+    @unittest.skipIf('numpy' not in Halberd.clues.store.backends,
+                     'NumPy is not installed')
+    def testNumPy(self):
+        for filename in self.filenames:
+            clues = Halberd.clues.file.load(filename)
+            for idx, clue in enumerate(clues[::3]):
+                clue.conns[idx % 4] = idx
+            python = ClueStore(clues, backend='python')
+            vectorized = ClueStore(clues, backend='numpy')
+
+            for method in ('uniq', 'filterProxies', 'analyze'):
+                expected = getattr(python, method)().toClues()
+                result = getattr(vectorized, method)()
+                self.failUnlessEqual(result.backend, 'numpy')
+                self.failUnlessEqual(summary(result.toClues(), True),
+                                     summary(expected, True))
+
+            for step in (1, 3):
+                expected = python.uniq().clusters(step)
+                result = vectorized.uniq().clusters(step)
+                self.failUnlessEqual(
+                    [summary(cluster.toClues(), True) for cluster in result],
+                    [summary(cluster.toClues(), True) for cluster in expected])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: ts=4 sw=4 et
@@ -0,0 +1,378 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Unit tests for Halberd.crew
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import copy
+import time
+import unittest
+
+import Halberd.crew as crew
+import Halberd.tracer
+import Halberd.clientlib as clientlib
+import Halberd.clues.Clue
+import Halberd.ScanTask
+import Halberd.clues.analysis as analysis
+
+import tests.httpserver as httpserver
+
+
+class TestCrew(unittest.TestCase):
+
+    def setUp(self):
+        self.server = httpserver.Server()
+        self.server.start()
+
+        self.task = Halberd.ScanTask.ScanTask()
+        self.task.url = self.server.getURL()
+        self.task.addr = '127.0.0.1'
+        self.task.scantime = 2
+
+    def tearDown(self):
+        self.server.stop()
+
+    def scan(self, engine):
+        self.task.engine = engine
+        workcrew = crew.crewFactory(self.task)
+        clues = workcrew.scan()
+
+        self.failUnless(clues)
+        self.failUnless(workcrew.state.getError() is None)
+        nclues, replies, missed = workcrew.state.getStats()
+        self.failUnlessEqual(sum([c.getCount() for c in clues]), replies)
+
+        return workcrew
+
+    def testThreads(self):
+        self.failUnless(isinstance(self.scan('threads'), crew.WorkCrew))
+
+    def testAsync(self):
+        self.failUnless(isinstance(self.scan('async'), crew.AsyncCrew))
+
+    def testProbeSelectedOnce(self):
+        detections = []
+        def detect(scantask):
+            detections.append(scantask)
+            return None
+
+        # An inconclusive detection must not be repeated for every probe.
+        self.task.probe = 'auto'
+        original, clientlib._detectProbe = clientlib._detectProbe, detect
+        try:
+            workcrew = self.scan('threads')
+        finally:
+            clientlib._detectProbe = original
+
+        self.failUnlessEqual(len(detections), 1)
+        self.failUnlessEqual(workcrew.state.probe, 'get')
+
+    def testAsyncUnsupported(self):
+        self.task.engine = 'async'
+        self.failUnless(isinstance(crew.crewFactory(self.task),
+                                   crew.AsyncCrew))
+        for option, value in (('keepalive', True), ('pipeline', 4)):
+            task = copy.copy(self.task)
+            setattr(task, option, value)
+            workcrew = crew.crewFactory(task)
+            self.failIf(isinstance(workcrew, crew.AsyncCrew))
+
+    def testProcesses(self):
+        self.task.processes = 2
+        workcrew = self.scan('processes')
+        self.failUnless(isinstance(workcrew, crew.ProcessCrew))
+        self.failUnlessEqual(len(workcrew.workers), 2)
+
+    def testProcessesPacing(self):
+        self.task.processes = 2
+        self.task.rate = 20
+        workcrew = self.scan('processes')
+
+        # The workers' traffic is accounted for by the parent.
+        pacer = workcrew.state.pacer
+        replies = workcrew.state.getStats()[1]
+        self.failUnlessEqual(pacer.getTotals()[0], replies)
+        rate, bandwidth = pacer.getStats()
+        self.failUnless(0 < rate <= 25)
+        self.failUnless(bandwidth > 0)
+
+    def testProcessesRefused(self):
+        self.task.engine = 'processes'
+        self.task.url = 'http://localhost:1/'
+        workcrew = crew.crewFactory(self.task)
+        workcrew.scan()
+        self.failIf(workcrew.state.getError() is None)
+
+    def testConvergence(self):
+        self.task.scantime = 30
+        self.task.converge_window = 0.5
+        self.task.converge_samples = 10
+        self.task.converge_time = 0.5
+        for engine in ('threads', 'async', 'processes'):
+            started = time.time()
+            workcrew = self.scan(engine)
+            self.failUnless(time.time() - started < 10)
+            self.failUnless(workcrew.state.getStopReason()
+                            .startswith('converged'))
+
+    def testMultiCrew(self):
+        # Nothing listens on 127.0.0.2 so that scan fails on its own.
+        tasks = []
+        for addr in ('127.0.0.1', '127.0.0.2'):
+            task = copy.copy(self.task)
+            task.addr = addr
+            tasks.append(task)
+
+        started = time.time()
+        multicrew = crew.MultiCrew(tasks)
+        good, bad = multicrew.scan()
+        self.failUnless(time.time() - started < 2 * self.task.scantime)
+
+        self.failUnless(good)
+        self.failUnless(multicrew.crews[0].state.getError() is None)
+        self.failIf(bad)
+        self.failIf(multicrew.crews[1].state.getError() is None)
+
+    def testIPv6(self):
+        self.server.stop()
+        self.server = httpserver.Server6()
+        self.server.start()
+
+        self.task.url = self.server.getURL()
+        self.task.addr = self.server.getAddress()
+        self.scan('threads')
+        self.scan('async')
+
+    def testMetrics(self):
+        self.task.metrics = 'metrics'
+        for engine in ('threads', 'async'):
+            self.task.url = self.server.getURL() + engine
+            workcrew = self.scan(engine)
+            replies = workcrew.state.getStats()[1]
+            snapshot = workcrew.state.metrics.getSnapshot()
+            self.failUnlessEqual(snapshot['replies'], replies)
+            self.failUnlessEqual(snapshot['latency']['headers']['count'],
+                                 replies)
+            self.failUnless(snapshot['bytes_in'] > 0)
+
+    def testTrace(self):
+        tracer = Halberd.tracer.Tracer()
+        Halberd.tracer.install(tracer)
+        try:
+            workcrew = self.scan('threads')
+        finally:
+            Halberd.tracer.uninstall()
+
+        spans = tracer.getSpans()
+        names = [span[0] for span in spans]
+        replies = workcrew.state.getStats()[1]
+        self.failUnlessEqual(names.count('headers'), replies)
+        for name in ('connect', 'send', 'first byte', 'probe', 'clue insert'):
+            self.failUnless(name in names)
+        self.failUnless('Scanner-0' in tracer._threads.values())
+
+    def testStopReason(self):
+        reason = self.scan('threads').state.getStopReason()
+        self.failUnless(reason.startswith('scan time'))
+
+    def testFixedParallelism(self):
+        self.failUnlessEqual(self.scan('threads').getTrajectory(), [])
+
+    def testTLS(self):
+        self.server.stop()
+        self.server = httpserver.SecureServer()
+        self.server.start()
+        self.task.url = self.server.getURL()
+        self.task.probe = 'tls'
+
+        clues = self.scan('threads').state.getClues()
+        self.failUnlessEqual(len(analysis.analyze(clues)), 1)
+
+    def testPacing(self):
+        self.task.rate = 20
+        for engine in ('threads', 'async'):
+            workcrew = self.scan(engine)
+            nclues, replies, missed = workcrew.state.getStats()
+            self.failUnless(replies + missed <= 20 * self.task.scantime + 1)
+
+    def testAutoParallelism(self):
+        self.task.parallelism = 1
+        self.task.autoparallelism = True
+        self.task.max_parallelism = 8
+        for engine in ('threads', 'async'):
+            workcrew = self.scan(engine)
+            trajectory = workcrew.getTrajectory()
+            self.failUnlessEqual(trajectory[0], (0.0, 1))
+            # A healthy local server lets the limit grow.
+            self.failUnless(max([limit for t, limit in trajectory]) > 1)
+            self.failUnless(max([limit for t, limit in trajectory]) <= 8)
+
+    def testAsyncHTTPSFallback(self):
+        self.task.engine = 'async'
+        self.task.url = 'https://localhost/'
+        workcrew = crew.crewFactory(self.task)
+        self.failIf(isinstance(workcrew, crew.AsyncCrew))
+
+    def testAsyncRefused(self):
+        self.task.engine = 'async'
+        self.task.url = 'http://localhost:1/'
+        workcrew = crew.crewFactory(self.task)
+        workcrew.scan()
+        self.failIf(workcrew.state.getError() is None)
+
+
+def makeClue(server, count=1, conns=None):
+    clue = Halberd.clues.Clue.Clue()
+    clue.parse('Server: %s\r\n' % server)
+    if count > 1:
+        clue.incCount(count - 1)
+    clue.conns = conns or {}
+    return clue
+
+
+class TestScanState(unittest.TestCase):
+
+    def setUp(self):
+        self.state = crew.ScanState()
+
+    def testInsertClues(self):
+        self.state.insertClues([makeClue('a', 2, {1: 2}), makeClue('b')])
+        self.state.insertClue(makeClue('a', 1, {1: 1, 2: 1}))
+
+        self.failUnlessEqual(self.state.getStats(), (2, 4, 0))
+        a, b = self.state.getClues()
+        self.failUnlessEqual(a.getCount(), 3)
+        self.failUnlessEqual(a.conns, {1: 3, 2: 1})
+        self.failUnlessEqual(b.getCount(), 1)
+
+    def testBuffer(self):
+        buf = crew.ClueBuffer(self.state)
+        buf.interval = 3600
+        buf.flush()
+        for i in xrange(10):
+            buf.add(makeClue('a'))
+        buf.add(makeClue('b'))
+        # Replies are accounted for before their clues are inserted.
+        self.failUnlessEqual(self.state.getStats(), (0, 11, 0))
+
+        buf.flush()
+        self.failUnlessEqual(self.state.getStats(), (2, 11, 0))
+        self.failUnlessEqual(self.state.getClues()[0].getCount(), 10)
+
+        buf.size = 3
+        for name in 'cde':
+            buf.add(makeClue(name))
+        self.failUnlessEqual(self.state.getStats(), (5, 14, 0))
+
+    def testDrain(self):
+        self.state.insertClue(makeClue('a'))
+        self.state.incMissed(2)
+        clues, missed = self.state.drain()
+        self.failUnlessEqual((len(clues), missed), (1, 2))
+        self.failUnlessEqual(self.state.getStats(), (0, 0, 0))
+
+        self.state.insertClue(makeClue('a'))
+        self.failUnlessEqual(self.state.getClues()[0].getCount(), 1)
+
+    def testConvergenceRule(self):
+        rule = crew.ConvergenceRule(window=1, minsamples=4, mintime=0)
+        now = time.time()
+
+        self.state.insertClues([makeClue('a', 2), makeClue('b')])
+        self.failIf(rule.hasConverged(self.state, now))
+        # A known server whose clock ticked meanwhile is no news.
+        skewed = makeClue('a')
+        skewed.diff += 1
+        self.state.insertClue(skewed)
+        self.failIf(rule.hasConverged(self.state, now + 0.5))
+        self.failUnlessEqual(self.state.getStats()[0], 3)
+        self.failUnless(rule.hasConverged(self.state, now + 1))
+        self.failUnless(rule.reason.startswith('converged'))
+
+        self.state.insertClue(makeClue('c'))
+        self.failIf(rule.hasConverged(self.state, now + 1.5))
+        self.failUnless(rule.hasConverged(self.state, now + 2.5))
+
+
+class TestTuner(unittest.TestCase):
+
+    def setUp(self):
+        self.state = crew.ScanState()
+        self.estimator = clientlib.RTTEstimator()
+        self.tuner = crew.Tuner(self.state, self.estimator, 4, 6)
+        self.now = time.time()
+
+    def answer(self, num):
+        self.state.insertClue(makeClue('test', num))
+
+    def update(self):
+        self.now += self.tuner.period
+        return self.tuner.update(self.now)
+
+    def testAIMD(self):
+        # Too few samples to decide.
+        self.answer(3)
+        self.failUnlessEqual(self.update(), 4)
+
+        self.answer(1)
+        self.failUnlessEqual(self.update(), 5)
+        self.answer(5)
+        self.failUnlessEqual(self.update(), 6)
+        self.answer(6)
+        self.failUnlessEqual(self.update(), 6)
+
+        for i in xrange(6):
+            self.state.incMissed()
+        self.failUnlessEqual(self.update(), 3)
+
+        self.failUnlessEqual([limit for t, limit in self.tuner.trajectory],
+                             [4, 5, 6, 3])
+
+    def testLatency(self):
+        self.estimator.update(0.01)
+        self.answer(4)
+        self.failUnlessEqual(self.update(), 5)
+
+        # Latency went up: hold.
+        for i in xrange(20):
+            self.estimator.update(0.5)
+        self.answer(5)
+        self.failUnlessEqual(self.update(), 5)
+
+    def testBuffered(self):
+        buf = crew.ClueBuffer(self.state)
+        buf.interval = 3600
+
+        # A few misses among replies whose clues are still buffered are no
+        # reason to back off.
+        for i in xrange(100):
+            buf.add(makeClue('test'))
+        self.state.incMissed(4)
+        self.failUnlessEqual(self.update(), 5)
+        self.failUnlessEqual(self.state.getStats()[0], 0)
+
+        buf.flush()
+        self.failUnlessEqual(self.state.getStats(), (1, 100, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: ts=4 sw=4 et
@@ -0,0 +1,140 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Unit tests for Halberd.metrics
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+
+import os
+import json
+import time
+import logging
+import unittest
+
+import Halberd.logger
+import Halberd.clientlib as clientlib
+from Halberd.metrics import Histogram, TargetMetrics, Registry, Exporter
+from Halberd.metrics import _escape
+
+
+def makeReply(started, connected, timestamp, completed):
+    reply = clientlib.Reply('HTTP/1.1 200 OK', [], timestamp)
+    reply.started = started
+    reply.connected = connected
+    reply.completed = completed
+    reply.bytesin, reply.bytesout = 200, 50
+    return reply
+
+
+class TestHistogram(unittest.TestCase):
+
+    def testObserve(self):
+        hist = Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            hist.observe(value)
+        self.failUnlessEqual(hist.counts, [2, 1, 1])
+        self.failUnlessEqual(hist.getCumulative(),
+                             [(0.1, 2), (1, 3), (None, 4)])
+        self.failUnlessAlmostEqual(hist.total, 2.65)
+        self.failUnlessEqual(hist.getPercentile(0.5), 0.1)
+        self.failUnlessEqual(hist.getPercentile(0.75), 1)
+        self.failUnlessEqual(hist.getPercentile(1), None)
+
+
+class TestTargetMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = TargetMetrics('http://localhost/', '127.0.0.1')
+        self.metrics.addReply(makeReply(100, 100.002, 100.02, 100.021))
+        self.metrics.addReply(makeReply(101, None, 101.3, 101.5))
+        self.metrics.addError(clientlib.TimedOut('timed out'))
+
+    def testSnapshot(self):
+        snapshot = self.metrics.getSnapshot()
+        self.failUnlessEqual(snapshot['replies'], 2)
+        self.failUnlessEqual(snapshot['bytes_in'], 400)
+        self.failUnlessEqual(snapshot['bytes_out'], 100)
+        self.failUnlessEqual(snapshot['errors'], {'TimedOut': 1})
+        latency = snapshot['latency']
+        # No connection was opened for the second request.
+        self.failUnlessEqual(latency['connect']['count'], 1)
+        self.failUnlessEqual(latency['firstbyte']['count'], 2)
+        self.failUnlessAlmostEqual(latency['headers']['sum'], 0.521)
+
+    def testExport(self):
+        registry = Registry()
+        registry._targets[('http://localhost/', '127.0.0.1')] = self.metrics
+        filename = os.path.join('tests', 'data', 'metrics')
+        try:
+            Exporter(filename, 'json', registry=registry).stop()
+            data = json.load(open(filename))
+            self.failUnlessEqual(data['targets'][0]['replies'], 2)
+
+            Exporter(filename, 'prometheus', registry=registry).stop()
+            lines = open(filename).read().splitlines()
+        finally:
+            os.unlink(filename)
+
+        labels = '{url="http://localhost/",addr="127.0.0.1"}'
+        self.failUnless('halberd_replies_total%s 2' % labels in lines)
+        self.failUnless('halberd_errors_total{url="http://localhost/",'
+                        'addr="127.0.0.1",error="TimedOut"} 1' in lines)
+        self.failUnless('halberd_firstbyte_seconds_bucket{url='
+                        '"http://localhost/",addr="127.0.0.1",le="+Inf"} 2'
+                        in lines)
+        self.failUnless('halberd_connect_seconds_count%s 1' % labels in lines)
+
+    def testEscape(self):
+        self.failUnlessEqual(_escape('a\\b"c\nd'), 'a\\\\b\\"c\\nd')
+
+    def testWriteErrors(self):
+        registry = Registry()
+        registry._targets[('http://localhost/', '127.0.0.1')] = self.metrics
+        filename = os.path.join('tests', 'data', 'missing', 'metrics')
+        exporter = Exporter(filename, 'json', interval=0.01,
+                            registry=registry)
+        writes = []
+
+        def write():
+            writes.append(None)
+            Exporter.write(exporter)
+        exporter.write = write
+
+        logger = Halberd.logger.getLogger()
+        level = logger.level
+        logger.setLevel(logging.ERROR)
+        try:
+            exporter.start()
+            time.sleep(0.1)
+            # The thread survives the failed writes.
+            self.failUnless(exporter.isAlive())
+            exporter.stop()
+        finally:
+            logger.setLevel(level)
+        self.failUnless(len(writes) > 1)
+
+    def testInvalidFormat(self):
+        self.failUnlessRaises(ValueError, Exporter, 'metrics', 'xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: ts=4 sw=4 et
@@ -0,0 +1,91 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Unit tests for Halberd.pacer
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import unittest
+
+from Halberd.pacer import Pacer
+
+
+class TestPacer(unittest.TestCase):
+
+    def testUnlimited(self):
+        pacer = Pacer()
+        self.failIf(pacer.isActive())
+        for i in xrange(100):
+            self.failUnlessEqual(pacer.reserve(now=0), 0)
+
+    def testRate(self):
+        pacer = Pacer(rate=10)
+        waits = [pacer.reserve(now=100) for i in xrange(5)]
+        for wait, expected in zip(waits, [0, 0.1, 0.2, 0.3, 0.4]):
+            self.failUnlessAlmostEqual(wait, expected)
+
+        # Idle time doesn't accumulate into a burst.
+        self.failUnlessEqual(pacer.reserve(now=200), 0)
+        self.failUnlessAlmostEqual(pacer.delay(now=200), 0.1)
+
+    def testCount(self):
+        pacer = Pacer(rate=10)
+        pacer.reserve(4, now=0)
+        self.failUnlessAlmostEqual(pacer.delay(now=0), 0.4)
+
+    def testJitter(self):
+        pacer = Pacer(rate=1, jitter=0.5)
+        for i in xrange(100):
+            pacer.reserve(now=0)
+            wait = pacer.delay(now=0)
+            self.failUnless((i + 1) * 0.5 <= wait <= (i + 1) * 1.5)
+
+    def testBandwidth(self):
+        pacer = Pacer(bandwidth=1000)
+        self.failUnlessEqual(pacer.reserve(now=0), 0)
+        pacer.consume(3000, now=0)
+        self.failUnlessAlmostEqual(pacer.reserve(now=0), 3)
+        pacer.consume(-1000, now=0)
+        self.failUnlessAlmostEqual(pacer.reserve(now=0), 2)
+        self.failUnlessAlmostEqual(pacer.delay(now=1), 1)
+        self.failUnlessEqual(pacer.delay(now=2), 0)
+
+    def testStats(self):
+        pacer = Pacer(rate=10)
+        pacer.reserve(now=0)
+        pacer.consume(500, 10, now=1)
+        self.failUnlessEqual(pacer.getStats(now=2), (5, 250))
+
+    def testRemoteStats(self):
+        pacer = Pacer(rate=10)
+        self.failUnlessEqual(pacer.getStats(now=2), (0, 0))
+        pacer.start(now=0)
+        pacer.consume(500, 10, now=1)
+        self.failUnlessEqual(pacer.getStats(now=2), (5, 250))
+        self.failUnlessEqual(pacer.getTotals(), (10, 500))
+
+    def testInvalid(self):
+        self.failUnlessRaises(ValueError, Pacer, -1)
+        self.failUnlessRaises(ValueError, Pacer, 1, 0, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: ts=4 sw=4 et
@@ -0,0 +1,93 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Unit tests for Halberd.profiler
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+
+import os
+import time
+import threading
+import unittest
+
+from Halberd.profiler import Sampler, threadRole
+
+
+class Worker(threading.Thread):
+
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.done = threading.Event()
+
+    def run(self):
+        self.spin()
+
+    def spin(self):
+        while not self.done.isSet():
+            time.sleep(0.001)
+
+
+class TestSampler(unittest.TestCase):
+
+    def testRoles(self):
+        self.failUnlessEqual(threadRole(threading.currentThread()), 'main')
+        self.failUnlessEqual(threadRole(Worker()), 'Worker')
+        thread = threading.Thread(name='Resolver-3')
+        self.failUnlessEqual(threadRole(thread), 'Resolver')
+
+    def testSample(self):
+        worker = Worker()
+        worker.start()
+        sampler = Sampler(interval=0.001)
+        sampler.start()
+        time.sleep(0.2)
+        sampler.stop()
+        worker.done.set()
+        worker.join()
+
+        self.failUnless(sampler.samples['Worker'] > 0)
+        self.failUnless(sampler.samples['main'] > 0)
+        self.failIf('Sampler' in sampler.samples)
+
+        filename = os.path.join('tests', 'data', 'profile')
+        try:
+            sampler.write(filename)
+            lines = open(filename).read().splitlines()
+        finally:
+            os.unlink(filename)
+
+        worker = [line for line in lines if line.startswith('Worker;')]
+        self.failUnless(worker)
+        stack, count = worker[0].rsplit(' ', 1)
+        self.failUnless(int(count) > 0)
+        self.failUnless('spin (test_profiler.py:' in stack)
+        self.failUnlessEqual(sum([int(line.rsplit(' ', 1)[1])
+                                  for line in lines]),
+                             sum(sampler.samples.values()))
+
+        summary = sampler.getSummary()
+        self.failUnless([line for line in summary
+                         if line.startswith('Worker: ')])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: ts=4 sw=4 et
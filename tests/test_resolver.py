@@ -0,0 +1,158 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Unit tests for Halberd.resolver
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+
+import time
+import socket
+import threading
+import unittest
+
+from Halberd.resolver import Resolver
+
+
+class SlowResolver(Resolver):
+    """Resolver answering after a delay without using the network.
+    """
+    def _lookup(self, host, family):
+        time.sleep(0.2)
+        if host == 'unknown':
+            return ()
+        if host == 'broken':
+            raise UnicodeError, 'label empty or too long'
+        if host == 'flaky':
+            raise socket.gaierror(socket.EAI_AGAIN, 'temporary failure')
+        return ('10.0.0.1', '::1')
+
+
+class TestResolver(unittest.TestCase):
+
+    def testLocalhost(self):
+        resolver = Resolver()
+        self.failUnless('127.0.0.1' in resolver.resolve('localhost',
+                                                        socket.AF_INET))
+
+    def testCache(self):
+        resolver = SlowResolver()
+        self.failUnlessEqual(resolver.resolve('host'), ('10.0.0.1', '::1'))
+        started = time.time()
+        self.failUnlessEqual(resolver.resolve('host'), ('10.0.0.1', '::1'))
+        self.failUnless(time.time() - started < 0.1)
+        self.failUnlessEqual(resolver.getStats(), (1, 1))
+
+    def testExpiration(self):
+        resolver = SlowResolver(ttl=0, negative_ttl=0)
+        resolver.resolve('host')
+        resolver.resolve('host')
+        self.failUnlessEqual(resolver.getStats(), (0, 2))
+
+    def testBounded(self):
+        resolver = SlowResolver(workers=4, negative_ttl=0)
+        resolver.maxentries = 4
+        resolver.resolve('unknown')
+        for i in xrange(3):
+            resolver.prefetch('host%d' % i)
+        for i in xrange(3):
+            resolver.resolve('host%d' % i)
+        self.failUnlessEqual(len(resolver._cache), 4)
+
+        # The expired answer makes room for a new one.
+        resolver.resolve('host3')
+        self.failUnlessEqual(len(resolver._cache), 4)
+        self.failIf(resolver._cache.has_key(('unknown', socket.AF_UNSPEC)))
+
+        # Once there are no expired answers everything is forgotten.
+        resolver.resolve('host4')
+        self.failUnlessEqual(resolver._cache.keys(),
+                             [('host4', socket.AF_UNSPEC)])
+
+    def testNegative(self):
+        resolver = SlowResolver()
+        self.failUnlessEqual(resolver.resolve('unknown'), ())
+        self.failUnlessEqual(resolver.resolve('unknown'), ())
+        self.failUnlessEqual(resolver.getStats(), (1, 1))
+
+    def testTemporaryFailure(self):
+        resolver = SlowResolver()
+        self.failUnlessEqual(resolver.resolve('flaky'), ())
+        self.failUnlessEqual(resolver.resolve('flaky'), ())
+        self.failUnlessEqual(resolver.getStats(), (0, 2))
+        self.failIf(resolver._cache.has_key(('flaky', socket.AF_UNSPEC)))
+
+    def testLookupErrors(self):
+        resolver = Resolver()
+        errors = {'unknown': socket.EAI_NONAME, 'flaky': socket.EAI_AGAIN}
+
+        def getaddrinfo(host, *args):
+            raise socket.gaierror(errors[host], 'failed')
+
+        saved = socket.getaddrinfo
+        socket.getaddrinfo = getaddrinfo
+        try:
+            self.failUnlessEqual(resolver._lookup('unknown', 0), ())
+            self.failUnlessRaises(socket.gaierror, resolver._lookup,
+                                  'flaky', 0)
+        finally:
+            socket.getaddrinfo = saved
+
+    def testBrokenLookup(self):
+        resolver = SlowResolver(workers=1)
+        self.failUnlessEqual(resolver.resolve('broken', timeout=5), ())
+        # The worker survived.
+        self.failUnlessEqual(resolver.resolve('host', timeout=5),
+                             ('10.0.0.1', '::1'))
+
+    def testInFlight(self):
+        resolver = SlowResolver()
+        results = []
+
+        def work():
+            results.append(resolver.resolve('host'))
+
+        threads = [threading.Thread(target=work) for i in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.failUnlessEqual(len(results), 4)
+        self.failUnlessEqual(resolver.getStats()[1], 1)
+
+    def testPrefetch(self):
+        resolver = SlowResolver(workers=4)
+        started = time.time()
+        for i in xrange(4):
+            resolver.prefetch('host%d' % i)
+        for i in xrange(4):
+            resolver.resolve('host%d' % i)
+        # The lookups overlapped.
+        self.failUnless(time.time() - started < 0.6)
+
+    def testTimeout(self):
+        resolver = SlowResolver()
+        self.failUnlessEqual(resolver.resolve('host', timeout=0.05), ())
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: ts=4 sw=4 et
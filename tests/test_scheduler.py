@@ -0,0 +1,115 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Unit tests for Halberd.scheduler
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+
+import copy
+import time
+import unittest
+
+import Halberd.ScanTask
+import tests.httpserver as httpserver
+from Halberd.scheduler import Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.server = httpserver.Server()
+        self.server.start()
+
+        self.task = Halberd.ScanTask.ScanTask()
+        self.task.addr = '127.0.0.1'
+        # The scan time is truncated to whole seconds, so this lasts ~2s.
+        self.task.scantime = 3
+
+    def tearDown(self):
+        self.server.stop()
+
+    def makeTask(self, host):
+        task = copy.copy(self.task)
+        task.url = 'http://%s:%d/' % (host, self.server.server_address[1])
+        return task
+
+    def testInvalid(self):
+        self.failUnlessRaises(ValueError, Scheduler, 0)
+        self.failUnlessRaises(ValueError, Scheduler, 8, 0, 1)
+
+    def testAdmissible(self):
+        scheduler = Scheduler(budget=8, maxperhost=1, maxperaddr=2)
+        first = self.makeTask('localhost')
+        self.failUnless(scheduler.isAdmissible(first))
+        scheduler._running[first] = None
+        scheduler._account(first, 1)
+
+        # Same host.
+        self.failIf(scheduler.isAdmissible(self.makeTask('localhost')))
+
+        other = self.makeTask('127.0.0.1')
+        self.failUnless(scheduler.isAdmissible(other))
+        other.parallelism = 5
+        self.failIf(scheduler.isAdmissible(other))
+
+    def testAutoParallelism(self):
+        scheduler = Scheduler(budget=16, maxperhost=2, maxperaddr=2)
+        first = self.makeTask('localhost')
+        first.autoparallelism = True
+        first.max_parallelism = 12
+        scheduler._running[first] = None
+        scheduler._account(first, 1)
+        self.failUnlessEqual(scheduler._load, 12)
+
+        # There's room for its initial parallelism but not for its maximum.
+        other = self.makeTask('localhost')
+        other.autoparallelism = True
+        other.max_parallelism = 8
+        self.failIf(scheduler.isAdmissible(other))
+        other.max_parallelism = 4
+        self.failUnless(scheduler.isAdmissible(other))
+
+    def testRun(self):
+        tasks = [self.makeTask(host)
+                 for host in ('localhost', '127.0.0.1', 'localhost')]
+        done = []
+
+        def finished(task, crew):
+            self.failUnless(crew.state.getError() is None)
+            done.append(task)
+
+        scheduler = Scheduler(budget=32, maxperhost=1, maxperaddr=2)
+        started = time.time()
+        scheduler.run(tasks, finished)
+        elapsed = time.time() - started
+
+        # The first two targets are scanned at once, the last one must wait
+        # until the first is done.
+        self.failUnless(3 < elapsed < 6)
+        self.failUnlessEqual(len(done), 3)
+        self.failUnless(done[-1] is tasks[-1])
+        for task in done:
+            self.failUnless(task.clues)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: ts=4 sw=4 et
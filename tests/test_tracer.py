@@ -0,0 +1,87 @@
+# -*- coding: iso-8859-1 -*-
+
+"""Unit tests for Halberd.tracer
+"""
+
+# Copyright (C) 2004, 2005, 2006, 2010  Juan M. Bello Rivas <jmbr@superadditive.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+
+
+import os
+import json
+import threading
+import unittest
+
+from Halberd.tracer import Tracer
+
+
+class TestTracer(unittest.TestCase):
+
+    def testRingBuffer(self):
+        tracer = Tracer(capacity=3)
+        for i in range(5):
+            tracer.addSpan('span%d' % i, i, i + 0.5)
+
+        spans = tracer.getSpans()
+        self.failUnlessEqual([span[0] for span in spans],
+                             ['span2', 'span3', 'span4'])
+        self.failUnlessEqual(tracer.getRecorded(), 5)
+
+    def testInvalidCapacity(self):
+        self.failUnlessRaises(ValueError, Tracer, 0)
+
+    def testEvents(self):
+        tracer = Tracer()
+        tracer.addSpan('connect', 1.0, 1.25, addr='127.0.0.1')
+
+        thread = threading.Thread(name='Scanner-1',
+                                  target=tracer.addSpan,
+                                  args=('send', 2.0, 2.5))
+        thread.start()
+        thread.join()
+
+        filename = os.path.join('tests', 'data', 'trace')
+        try:
+            tracer.write(filename)
+            trace = json.load(open(filename))
+        finally:
+            os.unlink(filename)
+
+        self.failUnlessEqual(trace['otherData'],
+                             {'recorded': 2, 'dropped': 0})
+
+        events = trace['traceEvents']
+        names = dict([(event['tid'], event['args']['name'])
+                      for event in events if event['ph'] == 'M'])
+        spans = [event for event in events if event['ph'] == 'X']
+        self.failUnlessEqual(len(spans), 2)
+
+        connect, send = spans
+        self.failUnlessEqual(connect['ts'], 1000000)
+        self.failUnlessEqual(connect['dur'], 250000)
+        self.failUnlessEqual(connect['args'], {'addr': '127.0.0.1'})
+        self.failUnlessEqual(names[connect['tid']],
+                             threading.currentThread().getName())
+        self.failUnlessEqual(names[send['tid']], 'Scanner-1')
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: ts=4 sw=4 et